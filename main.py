@@ -1,3 +1,5 @@
+"""项目占位入口，实际入口见 src/agent/cli.py 与 web.py。"""
+
 def main():
     print("Hello from pocketwise!")
 
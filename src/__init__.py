@@ -0,0 +1 @@
+"""PocketWise 源码包。"""
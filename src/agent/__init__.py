@@ -0,0 +1 @@
+"""PocketWise 智能记账助手。"""
@@ -0,0 +1,165 @@
+"""消费统计：按类别、月份、星期和常见消费汇总支出，并估算当月预算消耗速度（只返回预先算好的数字）。"""
+import calendar
+import sqlite3
+from datetime import date, datetime
+from typing import Any, Dict, List, Tuple
+
+import database as db
+
+WEEKDAY_NAMES = ["周日", "周一", "周二", "周三", "周四", "周五", "周六"]
+
+
+def _round(value: float) -> float:
+    return round(float(value or 0), 2)
+
+
+def _month_start(today: date, months_back: int) -> date:
+    """返回 today 所在月往前推 months_back 个月的月初"""
+    index = today.year * 12 + today.month - 1 - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _summary_rows(conn: sqlite3.Connection, user_id: str, start: str) -> Tuple[List[Tuple[str, str, float, int]], str]:
+    """整月归档的月份读月度汇总表，返回 (汇总行, 需要扫描明细的起点)"""
+    end_month, live_start = db.summarized_months(conn, start)
+    if not end_month:
+        return [], start
+    return db.read_monthly_summaries(conn, user_id, start[:7], end_month), live_start
+
+
+def category_breakdown(conn: sqlite3.Connection, user_id: str, start: str, limit: int = 6) -> List[Dict[str, Any]]:
+    """按类别汇总 start 之后的支出"""
+    summaries, live_start = _summary_rows(conn, user_id, start)
+    source = db.expense_source(conn, live_start)
+    rows = conn.execute(
+        f"""SELECT COALESCE(NULLIF(category, ''), '未分类') AS cat, SUM(amount) AS total, COUNT(*) AS cnt
+           FROM {source} WHERE user_id = ? AND ts >= ?
+           GROUP BY cat""",
+        (user_id, db.to_epoch(live_start))).fetchall()
+    totals: Dict[str, List[float]] = {}
+    for cat, total, cnt in [(cat or "未分类", total, cnt) for _, cat, total, cnt in summaries] + rows:
+        entry = totals.setdefault(cat, [0, 0])
+        entry[0] += total or 0
+        entry[1] += cnt
+    grand_total = sum(total for total, _ in totals.values())
+    breakdown = []
+    for cat, (total, cnt) in sorted(totals.items(), key=lambda item: item[1][0], reverse=True)[:limit]:
+        breakdown.append({
+            "category": cat,
+            "total": _round(total),
+            "count": cnt,
+            "share": round(total / grand_total, 3) if grand_total else 0,
+        })
+    return breakdown
+
+
+def monthly_totals(conn: sqlite3.Connection, user_id: str, start: str) -> List[Dict[str, Any]]:
+    """按月汇总支出，并计算环比变化"""
+    summaries, live_start = _summary_rows(conn, user_id, start)
+    source = db.expense_source(conn, live_start)
+    rows = conn.execute(
+        f"""SELECT substr(timestamp, 1, 7) AS month, SUM(amount) AS total, COUNT(*) AS cnt
+           FROM {source} WHERE user_id = ? AND ts >= ?
+           GROUP BY month ORDER BY month""",
+        (user_id, db.to_epoch(live_start))).fetchall()
+    archived: Dict[str, List[float]] = {}
+    for month, _, total, cnt in summaries:
+        entry = archived.setdefault(month, [0, 0])
+        entry[0] += total or 0
+        entry[1] += cnt
+    months = []
+    previous = None
+    for month, total, cnt in [(month, total, cnt) for month, (total, cnt) in archived.items()] + rows:
+        item = {"month": month, "total": _round(total), "count": cnt}
+        if previous:
+            item["delta_pct"] = round((total - previous) / previous, 3)
+        months.append(item)
+        previous = total
+    return months
+
+
+def top_descriptions(conn: sqlite3.Connection, user_id: str, start: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """出现次数最多的消费描述（近似商家/商品）"""
+    source = db.expense_source(conn, start)
+    rows = conn.execute(
+        f"""SELECT description, COUNT(*) AS cnt, SUM(amount) AS total
+           FROM {source} WHERE user_id = ? AND ts >= ? AND description <> ''
+           GROUP BY description ORDER BY cnt DESC, total DESC LIMIT ?""",
+        (user_id, db.to_epoch(start), limit)).fetchall()
+    return [{"description": d, "count": cnt, "total": _round(total)} for d, cnt, total in rows]
+
+
+def weekday_pattern(conn: sqlite3.Connection, user_id: str, start: str) -> Dict[str, Any]:
+    """按星期汇总支出，给出消费最多的一天和周末占比"""
+    source = db.expense_source(conn, start)
+    rows = conn.execute(
+        f"""SELECT CAST(strftime('%w', timestamp) AS INTEGER) AS wd, SUM(amount) AS total
+           FROM {source} WHERE user_id = ? AND ts >= ?
+           GROUP BY wd""",
+        (user_id, db.to_epoch(start))).fetchall()
+    totals = {wd: total or 0 for wd, total in rows if wd is not None}
+    grand_total = sum(totals.values())
+    if not grand_total:
+        return {}
+    peak = max(totals, key=totals.get)
+    weekend = totals.get(0, 0) + totals.get(6, 0)
+    return {
+        "peak_day": WEEKDAY_NAMES[peak],
+        "peak_day_total": _round(totals[peak]),
+        "weekend_share": round(weekend / grand_total, 3),
+    }
+
+
+def budget_burn_rate(conn: sqlite3.Connection, user_id: str, budget: float, today: date) -> Dict[str, Any]:
+    """当月预算消耗速度：已花费占预算比例 vs 已过去的天数比例"""
+    month_start = today.replace(day=1).isoformat()
+    source = db.expense_source(conn, month_start)
+    row = conn.execute(
+        f"SELECT COALESCE(SUM(amount), 0) FROM {source} WHERE user_id = ? AND ts >= ?",
+        (user_id, db.to_epoch(month_start))).fetchone()
+    spent = row[0] or 0
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    elapsed = today.day / days_in_month
+    result = {
+        "month_spent": _round(spent),
+        "month_elapsed": round(elapsed, 3),
+        "projected_month_total": _round(spent / elapsed) if elapsed else _round(spent),
+    }
+    if budget:
+        result["monthly_budget"] = _round(budget)
+        result["budget_used"] = round(spent / budget, 3)
+        result["remaining"] = _round(budget - spent)
+        result["on_track"] = spent / budget <= elapsed
+    return result
+
+
+def summarize_spending(user_id: str, months: int = 3) -> Dict[str, Any]:
+    """汇总最近 months 个月（含本月）的消费统计，结果只包含预先计算好的数字"""
+    months = max(1, int(months))
+    today = datetime.now().date()
+    start = _month_start(today, months - 1).isoformat()
+    budget = db.get_user_profile(user_id).get("monthly_budget", 0) or 0
+
+    conn = db.connect(user_id)
+    try:
+        summaries, live_start = _summary_rows(conn, user_id, start)
+        source = db.expense_source(conn, live_start)
+        total, count = conn.execute(
+            f"SELECT COALESCE(SUM(amount), 0), COUNT(*) FROM {source} WHERE user_id = ? AND ts >= ?",
+            (user_id, db.to_epoch(live_start))).fetchone()
+        total += sum(row[2] or 0 for row in summaries)
+        count += sum(row[3] for row in summaries)
+        if not count:
+            return {"period_start": start, "count": 0}
+        return {
+            "period_start": start,
+            "total": _round(total),
+            "count": count,
+            "by_category": category_breakdown(conn, user_id, start),
+            "monthly": monthly_totals(conn, user_id, start),
+            "top_items": top_descriptions(conn, user_id, start),
+            "weekday": weekday_pattern(conn, user_id, start),
+            "budget": budget_burn_rate(conn, user_id, budget, today),
+        }
+    finally:
+        conn.close()
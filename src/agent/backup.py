@@ -0,0 +1,293 @@
+"""在线备份：用 SQLite online backup API 分步复制每个分片，服务运行期间不阻塞读写。
+
+每一步只复制 pages 页，步与步之间休眠 sleep_ms 毫秒：源库只在单步期间持有读锁，写入方最多
+等待一个小步。备份期间其他连接的写入会让 SQLite 从头重新复制，连续重启 MAX_RESTARTS 次后
+自动加大步长（最终一步复制完），保证在持续写入下也能结束。
+每次备份写入 BACKUP_DIR 下以时间命名的快照目录：先写临时目录，每个分片经 PRAGMA integrity_check
+校验（可选 gzip 压缩）并写入 manifest.json 后再改名，只保留最近 keep 份。
+各分片分别取快照，同一用户的数据总在一个分片内，因此按用户是一致的。
+
+用法：
+    python backup.py run [--pages 256] [--sleep-ms 20] [--no-compress] [--keep 7]
+    python backup.py verify [--snapshot 快照目录]   # 还原到临时文件后逐个分片校验，默认校验最新快照
+    python backup.py list
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import database as db
+from env_utils import BACKUP_COMPRESS, BACKUP_DIR, BACKUP_INTERVAL_HOURS, BACKUP_KEEP
+
+# 每步复制的页数和步间休眠（毫秒）：默认 4KB 页时每步约 1MB
+BACKUP_PAGES = 256
+BACKUP_SLEEP_MS = 20
+# 同一步长下允许的重新复制次数，超过后步长放大 STEP_GROWTH 倍
+MAX_RESTARTS = 3
+STEP_GROWTH = 4
+MANIFEST = "manifest.json"
+# 精确到微秒，同一秒内的多次备份不会重名，按名称排序即按时间排序
+SNAPSHOT_FORMAT = "%Y%m%d-%H%M%S-%f"
+
+# progress(分片文件名, 已复制页数, 总页数)
+ProgressCallback = Callable[[str, int, int], None]
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def backup_dir() -> Path:
+    """快照根目录，默认在数据库文件旁的 backups/"""
+    return Path(BACKUP_DIR) if BACKUP_DIR else Path(db.DB_PATH).resolve().parent / "backups"
+
+
+def _copy(src: sqlite3.Connection, dst: sqlite3.Connection, pages: int, sleep_ms: int,
+          stats: Dict[str, Any], progress: Optional[ProgressCallback], name: str):
+    last_remaining = None
+    restarts = 0
+
+    def on_step(status, remaining, total):
+        nonlocal last_remaining, restarts
+        stats["steps"] += 1
+        stats["pages"] = total
+        if status in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+            # 源库正被写入，本步没有复制（backup 会自行休眠后重试）
+            stats["busy_steps"] += 1
+            return
+        # 其余为 SQLITE_OK 或最后一步的 SQLITE_DONE（remaining 为 0）
+        # 成功的一步之后剩余页数没有减少，说明源库被写入，backup 从头开始
+        if last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            stats["restarts"] += 1
+            if restarts >= MAX_RESTARTS and pages > 0:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        if progress is not None:
+            progress(name, total - remaining, total)
+        if remaining and sleep_ms:
+            # 步间休眠时不持有源库的锁，写入方可以提交
+            time.sleep(sleep_ms / 1000)
+            stats["sleep_seconds"] += sleep_ms / 1000
+
+    # 源库正被写入（SQLITE_BUSY/LOCKED）时按同样的间隔重试，而不是默认的 250ms
+    src.backup(dst, pages=pages, progress=on_step, sleep=max(sleep_ms, 1) / 1000)
+
+
+def backup_file(src_path: str, dest_path: str, pages: int = BACKUP_PAGES, sleep_ms: int = BACKUP_SLEEP_MS,
+                progress: ProgressCallback = None) -> Dict[str, Any]:
+    """把 src_path 在线复制到 dest_path，返回页数、步数、重启次数、耗时等指标"""
+    stats = {"pages": 0, "steps": 0, "busy_steps": 0, "restarts": 0, "sleep_seconds": 0.0}
+    started = time.monotonic()
+    name = os.path.basename(src_path)
+    src = sqlite3.connect(src_path)
+    try:
+        while True:
+            dst = sqlite3.connect(dest_path)
+            try:
+                _copy(src, dst, pages, sleep_ms, stats, progress, name)
+                break
+            except _TooManyRestarts:
+                total = stats["pages"]
+                pages = -1 if pages * STEP_GROWTH >= total else pages * STEP_GROWTH
+            finally:
+                dst.close()
+    finally:
+        src.close()
+    stats["final_pages_per_step"] = pages
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    stats["sleep_seconds"] = round(stats["sleep_seconds"], 3)
+    stats["bytes"] = os.path.getsize(dest_path)
+    return stats
+
+
+def integrity_check(path: str) -> str:
+    """返回 PRAGMA integrity_check 的结果，正常时为 'ok'"""
+    conn = sqlite3.connect(path)
+    try:
+        return "; ".join(row[0] for row in conn.execute("PRAGMA integrity_check"))
+    finally:
+        conn.close()
+
+
+def _gzip(path: Path) -> Path:
+    target = path.with_name(path.name + ".gz")
+    with open(path, "rb") as raw, gzip.open(target, "wb", compresslevel=6) as packed:
+        shutil.copyfileobj(raw, packed, 1 << 20)
+    path.unlink()
+    return target
+
+
+def list_snapshots(root: Path = None) -> List[Path]:
+    """已完成的快照目录，按时间从旧到新"""
+    root = root or backup_dir()
+    if not root.is_dir():
+        return []
+    return sorted(p for p in root.iterdir() if p.is_dir() and (p / MANIFEST).exists())
+
+
+def rotate(keep: int = BACKUP_KEEP, root: Path = None) -> List[Path]:
+    """只保留最近 keep 份快照，返回删除的目录"""
+    snapshots = list_snapshots(root)
+    removed = snapshots[:-keep] if keep > 0 else []
+    for path in removed:
+        shutil.rmtree(path)
+    return removed
+
+
+def create_snapshot(pages: int = BACKUP_PAGES, sleep_ms: int = BACKUP_SLEEP_MS, compress: bool = BACKUP_COMPRESS,
+                    keep: int = BACKUP_KEEP, root: Path = None, progress: ProgressCallback = None) -> Dict[str, Any]:
+    """备份全部分片到新的快照目录并轮转旧快照，返回 manifest；任一分片校验失败时抛出 RuntimeError"""
+    root = root or backup_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    name = datetime.now().strftime(SNAPSHOT_FORMAT)
+    partial = root / f".{name}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir()
+    manifest = {"snapshot": name, "created_at": datetime.now().isoformat(), "compressed": compress, "shards": {}}
+    started = time.monotonic()
+    try:
+        for src_path in db.all_db_paths():
+            dest = partial / os.path.basename(src_path)
+            stats = backup_file(src_path, str(dest), pages, sleep_ms, progress)
+            stats["integrity"] = integrity_check(str(dest))
+            if stats["integrity"] != "ok":
+                raise RuntimeError(f"{dest.name} integrity_check failed: {stats['integrity']}")
+            if compress:
+                dest = _gzip(dest)
+                stats["compressed_bytes"] = dest.stat().st_size
+            stats["file"] = dest.name
+            manifest["shards"][os.path.basename(src_path)] = stats
+        manifest["seconds"] = round(time.monotonic() - started, 3)
+        with open(partial / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        partial.rename(root / name)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    manifest["removed"] = [p.name for p in rotate(keep, root)]
+    return manifest
+
+
+def verify_snapshot(snapshot: Path = None) -> Dict[str, str]:
+    """把快照中的每个分片还原到临时文件并执行 integrity_check，返回 {分片: 结果}"""
+    snapshot = snapshot or (list_snapshots() or [None])[-1]
+    if snapshot is None:
+        raise FileNotFoundError("没有可校验的快照")
+    with open(Path(snapshot) / MANIFEST, encoding="utf-8") as f:
+        manifest = json.load(f)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for shard, stats in manifest["shards"].items():
+            source = Path(snapshot) / stats["file"]
+            restored = Path(tmp) / shard
+            opener = gzip.open if source.suffix == ".gz" else open
+            with opener(source, "rb") as packed, open(restored, "wb") as raw:
+                shutil.copyfileobj(packed, raw, 1 << 20)
+            results[shard] = integrity_check(str(restored))
+            restored.unlink()
+    return results
+
+
+class BackupJob:
+    """后台线程：每隔 interval_hours 取一次快照，记录最近一次结果和失败次数"""
+
+    def __init__(self, interval_hours: float = BACKUP_INTERVAL_HOURS, **snapshot_kwargs):
+        """interval_hours 为 0 时 start() 不启动线程；snapshot_kwargs 原样传给 create_snapshot"""
+        self.interval = interval_hours * 3600
+        self.snapshot_kwargs = snapshot_kwargs
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._metrics: Dict[str, Any] = {"runs": 0, "failures": 0, "last_snapshot": None,
+                                         "last_seconds": None, "last_error": None, "progress": None}
+
+    def _progress(self, name: str, copied: int, total: int):
+        self._metrics["progress"] = {"shard": name, "copied": copied, "total": total}
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        """立即取一次快照，返回清单；失败时记录错误并返回 None"""
+        self._metrics["runs"] += 1
+        try:
+            manifest = create_snapshot(progress=self._progress, **self.snapshot_kwargs)
+        except Exception as e:
+            self._metrics["failures"] += 1
+            self._metrics["last_error"] = f"{type(e).__name__}: {e}"
+            return None
+        finally:
+            self._metrics["progress"] = None
+        self._metrics.update(last_snapshot=manifest["snapshot"], last_seconds=manifest["seconds"], last_error=None)
+        return manifest
+
+    def _run(self):
+        # 启动后先等一个周期，避免每次重启都立即备份
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self) -> "BackupJob":
+        """启动后台备份线程（间隔为 0 或已启动时不做任何事）"""
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="db-backup", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止备份线程，正在进行的备份会先完成"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self) -> Dict[str, Any]:
+        """运行与失败次数、最近一次快照及当前进度"""
+        return dict(self._metrics)
+
+
+def _print_progress(name: str, copied: int, total: int):
+    print(f"\r{name}: {copied}/{total} 页", end="\n" if copied >= total else "", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PocketWise 在线备份")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="备份全部分片并轮转旧快照")
+    run_parser.add_argument("--pages", type=int, default=BACKUP_PAGES, help="每步复制的页数")
+    run_parser.add_argument("--sleep-ms", type=int, default=BACKUP_SLEEP_MS, help="步间休眠毫秒数")
+    run_parser.add_argument("--no-compress", dest="compress", action="store_false", default=BACKUP_COMPRESS,
+                            help="不压缩快照（默认按 BACKUP_COMPRESS）")
+    run_parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="保留的快照份数")
+
+    verify_parser = sub.add_parser("verify", help="还原快照到临时文件并执行 integrity_check")
+    verify_parser.add_argument("--snapshot", default=None, help="快照目录，默认最新一份")
+
+    sub.add_parser("list", help="列出已有快照")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        manifest = create_snapshot(args.pages, args.sleep_ms, args.compress, args.keep, progress=_print_progress)
+        print(json.dumps(manifest, ensure_ascii=False, indent=2))
+    elif args.command == "verify":
+        results = verify_snapshot(Path(args.snapshot) if args.snapshot else None)
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        if any(result != "ok" for result in results.values()):
+            raise SystemExit(1)
+    elif args.command == "list":
+        for path in list_snapshots():
+            with open(path / MANIFEST, encoding="utf-8") as f:
+                manifest = json.load(f)
+            size = sum(s.get("compressed_bytes", s["bytes"]) for s in manifest["shards"].values())
+            print(f"{path.name}  {len(manifest['shards'])} 个分片  {size / 1e6:.1f} MB  {manifest['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
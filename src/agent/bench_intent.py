@@ -0,0 +1,128 @@
+"""对比两次调用（意图识别 + chatbot）与单次调用（fused）模式的延迟和意图准确率。
+
+只测量每条消息到得到首个响应（回复或工具调用）为止的 LLM 调用，不执行工具。
+用法：
+    python bench_intent.py [--data samples.jsonl] [--repeat 1]
+samples.jsonl 每行形如 {"text": "...", "intent": "consult"}，不指定时使用内置样本。
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List
+
+from graph import ChatbotService, FusedChatbotService, GraphConstants, IntentRecognizer
+from langchain_core.messages import HumanMessage
+from model import llm_chat
+from tools import (
+    analyze_spending,
+    detect_impulse_buying,
+    edit_user_profile,
+    log_notable_expense,
+    view_plan,
+    view_recent_expenses,
+    view_user_profile,
+)
+
+BENCH_USER_ID = "bench_user"
+BENCH_PROFILE = {"income": 3000, "monthly_budget": 2000, "saving": 5000, "personality_tags": [], "current_mood": "neutral"}
+
+DEFAULT_SAMPLES = [
+    {"text": "今天中午吃饭花了35块，帮我记一下", "intent": "log_expense"},
+    {"text": "刚打车花了28元", "intent": "log_expense"},
+    {"text": "买了一本教材 89 块", "intent": "log_expense"},
+    {"text": "我想买一双 899 的球鞋，值得吗", "intent": "consult"},
+    {"text": "新出的游戏机要不要现在入手", "intent": "consult"},
+    {"text": "你觉得花 300 买演唱会门票划算吗", "intent": "consult"},
+    {"text": "我想在半年内存下 5000 块", "intent": "generate_plan"},
+    {"text": "帮我制定一个每月控制消费的计划", "intent": "generate_plan"},
+    {"text": "把我的储蓄计划目标改成 8000", "intent": "update_plan"},
+    {"text": "储蓄计划的开始时间推迟到下个月", "intent": "update_plan"},
+    {"text": "删掉那个消费节制计划", "intent": "delete_plan"},
+    {"text": "我不想要旅游存钱计划了，删了吧", "intent": "delete_plan"},
+    {"text": "我现在有哪些计划", "intent": "review_plan"},
+    {"text": "看看我的存钱计划进度", "intent": "review_plan"},
+    {"text": "帮我复盘一下这几个月的消费情况", "intent": "review_profile"},
+    {"text": "我的钱都花在哪了", "intent": "review_profile"},
+    {"text": "我这个月的生活费涨到 2500 了", "intent": "edit_profile"},
+    {"text": "把我的月预算改成 1500", "intent": "edit_profile"},
+    {"text": "今天天气怎么样", "intent": "unknown"},
+    {"text": "给我讲个笑话", "intent": "unknown"},
+]
+
+AVAILABLE_TOOLS = [view_user_profile, edit_user_profile, log_notable_expense, view_recent_expenses,
+                   analyze_spending, detect_impulse_buying, view_plan]
+
+
+def _state(text: str, intent: str = GraphConstants.DEFAULT_INTENT) -> Dict:
+    return {"user_id": BENCH_USER_ID, "user_profile": BENCH_PROFILE,
+            "messages": [HumanMessage(content=text)], "last_intent": intent}
+
+
+def run_two_call(samples: List[Dict]) -> List[Dict]:
+    recognizer = IntentRecognizer(llm_chat)
+    chatbot = ChatbotService(llm_chat, AVAILABLE_TOOLS)
+    results = []
+    for sample in samples:
+        started = time.perf_counter()
+        intent = recognizer.recognize_intent(_state(sample["text"]))["last_intent"]
+        # 计划类意图直接交给计划 agent，不经过 chatbot
+        if intent not in GraphConstants.PLAN_INTENTS:
+            chatbot.generate_response(_state(sample["text"], intent))
+        results.append({"intent": intent, "latency": time.perf_counter() - started})
+    return results
+
+
+def run_fused(samples: List[Dict]) -> List[Dict]:
+    fused = FusedChatbotService(llm_chat, AVAILABLE_TOOLS)
+    results = []
+    for sample in samples:
+        started = time.perf_counter()
+        intent = fused.split_response(fused.decide(_state(sample["text"])))["intent"]
+        results.append({"intent": intent, "latency": time.perf_counter() - started})
+    return results
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def report(name: str, samples: List[Dict], results: List[Dict]) -> Dict:
+    latencies = [r["latency"] * 1000 for r in results]
+    correct = sum(r["intent"] == s["intent"] for s, r in zip(samples, results))
+    summary = {
+        "mode": name,
+        "messages": len(results),
+        "intent_accuracy": round(correct / len(results), 3) if results else 0,
+        "mean_ms": round(statistics.mean(latencies), 1) if latencies else 0,
+        "p50_ms": round(_percentile(latencies, 0.5), 1) if latencies else 0,
+        "p95_ms": round(_percentile(latencies, 0.95), 1) if latencies else 0,
+    }
+    misses = [(s["text"], s["intent"], r["intent"]) for s, r in zip(samples, results) if r["intent"] != s["intent"]]
+    print(json.dumps(summary, ensure_ascii=False))
+    for text, expected, got in misses:
+        print(f"  [{name}] {text}: 期望 {expected}，得到 {got}")
+    return summary
+
+
+def load_samples(path: str = None) -> List[Dict]:
+    if not path:
+        return list(DEFAULT_SAMPLES)
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="两次调用与单次调用模式的延迟/意图准确率对比")
+    parser.add_argument("--data", default=None, help="标注样本 jsonl 文件")
+    parser.add_argument("--repeat", type=int, default=1, help="样本重复次数")
+    args = parser.parse_args()
+
+    samples = load_samples(args.data) * args.repeat
+    report(GraphConstants.MODE_TWO_CALL, samples, run_two_call(samples))
+    report(GraphConstants.MODE_FUSED, samples, run_fused(samples))
+
+
+if __name__ == "__main__":
+    main()
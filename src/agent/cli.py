@@ -1,16 +1,31 @@
+"""命令行入口：构建对话图，按会话处理用户输入，并按配置启动提醒和备份后台任务。"""
+import atexit
+
+from backup import BackupJob
+from env_utils import PLAN_REMINDERS
 from graph import build_graph
 from langgraph.checkpoint.memory import MemorySaver
+from reminders import ReminderScheduler
+from sessions import DEFAULT_SESSION_ID, SessionManager
 
 checkpointer = MemorySaver()
-config = {"configurable": {"thread_id": "user_001"}}
+USER_ID = "student_01"
 app = build_graph(checkpointer)
-def process_input(user_input):
-    inputs = {
-        "user_id": "student_01",
-        "messages": [("user", user_input)]
-    }
-    result = app.invoke(inputs, config=config)
-    return result
+# 所有用户会话共用同一张图，按 (user_id, session_id) 区分对话线程
+sessions = SessionManager(app, checkpointer)
+atexit.register(sessions.close)
+# 计划阶段提醒：到期后写入待送达消息，由前端在展示对话时取出
+reminders = ReminderScheduler()
+if PLAN_REMINDERS:
+    reminders.start()
+    atexit.register(reminders.stop)
+# 定期在线备份（BACKUP_INTERVAL_HOURS 为 0 时不启动）
+backups = BackupJob().start()
+atexit.register(backups.stop)
+
+
+def process_input(user_input, user_id: str = USER_ID, session_id: str = DEFAULT_SESSION_ID):
+    return sessions.run(user_id, user_input, session_id)
 
 # def main():
 #     checkpointer = MemorySaver()
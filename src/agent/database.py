@@ -1,16 +1,164 @@
-import sqlite3
+"""SQLite 数据存储：按用户分片的表结构与迁移，以及用户档案、支出、计划、提醒和对话记忆的读写。"""
+import atexit
 import json
-from datetime import datetime
-from typing import Any, Dict, List
+import re
+import sqlite3
+from collections import namedtuple
+from datetime import date, datetime
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import plan_progress
+from env_utils import DB_SHARDS, WRITE_BEHIND, WRITE_BEHIND_BATCH, WRITE_BEHIND_FLUSH_MS
+from sharding import ShardRouter
+from spending_stats import QuantileSketch, RunningStats
+from write_behind import WriteBehindQueue
 
 DB_PATH = str(Path(__file__).resolve().parent / "pocketwise.db")
 # DB_PATH = "pocketwise.db"
 
-def init_db():
-    
-    conn = sqlite3.connect(DB_PATH)
+# 按 user_id 一致性哈希到 DB_SHARDS 个数据库文件，单分片时即 DB_PATH
+router = ShardRouter(DB_PATH, DB_SHARDS)
+
+
+def configure_shards(base_path: str, shard_count: int = 1):
+    """切换数据库位置或分片数（测试、迁移工具使用）"""
+    global DB_PATH, router
+    DB_PATH = base_path
+    router = ShardRouter(base_path, shard_count)
+
+
+def connect(user_id: str) -> sqlite3.Connection:
+    """打开 user_id 所在分片的连接，所有按用户的读写都经过这里"""
+    if write_queue is not None:
+        # 读之前等待该用户排队中的写入落盘
+        write_queue.wait_user(user_id)
+    return sqlite3.connect(router.path_for(user_id))
+
+
+def all_db_paths() -> List[str]:
+    return router.paths()
+
+
+# --- Write-Behind ---
+
+# 开启后写操作进入后台队列批量提交，None 表示同步写入
+write_queue: WriteBehindQueue = None
+
+
+def enable_write_behind(flush_interval: float = WRITE_BEHIND_FLUSH_MS / 1000,
+                        batch_size: int = WRITE_BEHIND_BATCH) -> WriteBehindQueue:
+    global write_queue
+    if write_queue is None:
+        write_queue = WriteBehindQueue(lambda user_id: router.path_for(user_id), flush_interval, batch_size)
+        # 进程退出前写完队列
+        atexit.register(disable_write_behind)
+    return write_queue
+
+
+def disable_write_behind():
+    """写完队列中的剩余操作并切回同步写入"""
+    global write_queue
+    if write_queue is not None:
+        write_queue.stop()
+        write_queue = None
+
+
+def write_behind_metrics() -> Dict[str, Any]:
+    return write_queue.metrics() if write_queue is not None else {}
+
+
+def _write(user_id: str, op, wait: bool = False):
+    """执行写操作 op(conn)：write-behind 模式下进入队列（wait=True 时等待结果），否则同步提交"""
+    if write_queue is not None:
+        future = write_queue.submit(user_id, op)
+        return future.result() if wait else None
+    conn = connect(user_id)
+    try:
+        with conn:
+            return op(conn)
+    finally:
+        conn.close()
+
+
+TimeLike = Union[datetime, date, str, int, float]
+
+
+def _ensure_column(c: sqlite3.Cursor, table: str, column: str, decl: str) -> bool:
+    """列不存在时补充该列，返回是否新增"""
+    columns = [row[1] for row in c.execute(f"PRAGMA table_info({table})")]
+    if column in columns:
+        return False
+    c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return True
+
+
+def to_epoch(value: TimeLike) -> int:
+    """把 datetime/date/ISO 字符串/时间戳统一转换为本地时间的 epoch 秒"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return int(value.timestamp())
+
+
+# FTS 索引中的用户列：用户 id 两侧加上 \x01，按短语匹配时只命中完全相同的 id（trigram 是子串匹配，
+# 不加分隔符时 "u1" 会命中 "u12"），两侧各多一个字符也让短于 3 个字的 id 能产生 trigram
+_FTS_OWNER_SQL = "char(1) || {}user_id || char(1)"
+
+
+def _fts_user_query(user_id: str, trigrams: List[str]) -> str:
+    """只在 user_id 自己的文档中匹配任一 trigram 的 FTS 查询"""
+    def phrase(text: str) -> str:
+        return '"' + text.replace('"', '""') + '"'
+
+    return f"owner:{phrase(chr(1) + user_id + chr(1))} AND ({' OR '.join(phrase(t) for t in trigrams)})"
+
+
+def _create_fts(c: sqlite3.Cursor, table: str, columns: Tuple[str, ...]):
+    """为表创建外部内容 FTS5 索引（trigram 分词）和同步触发器，首次创建时回填已有数据
+
+    用户 id 作为带分隔符的 owner 列参与索引，查询时与检索词 AND 组合，只有该用户的文档参与打分；
+    FTS 的内容来源是在源表上加出 owner 列的视图，rebuild 和 integrity-check 读到的与触发器写入的一致。
+    """
+    fts = f"{table}_fts"
+    source = f"{table}_fts_source"
+    cols = ", ".join(columns + ("owner",))
+    new_values = ", ".join([f"new.{col}" for col in columns] + [_FTS_OWNER_SQL.format("new.")])
+    old_values = ", ".join([f"old.{col}" for col in columns] + [_FTS_OWNER_SQL.format("old.")])
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone()
+    if exists and "owner" not in [row[1] for row in c.execute(f"PRAGMA table_info({fts})")]:
+        # 旧版索引的 user_id 是 UNINDEXED 列，只能匹配后再过滤，重建为带 owner 列的索引
+        for suffix in ("ai", "ad", "au"):
+            c.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+        c.execute(f"DROP TABLE {fts}")
+        exists = None
+    c.execute(f"""CREATE VIEW IF NOT EXISTS {source} AS
+                     SELECT id, {", ".join(columns)}, {_FTS_OWNER_SQL.format("")} AS owner FROM {table}""")
+    c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                     {cols}, content='{source}', content_rowid='id', tokenize='trigram')""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+                     INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_values});
+                 END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+                     INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+                 END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE ON {table} BEGIN
+                     INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+                     INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new_values});
+                 END""")
+    if not exists:
+        c.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def init_shard(path: str):
+    """初始化单个分片数据库的表结构（含迁移）"""
+    conn = sqlite3.connect(path)
     c = conn.cursor()
+    # 仅对新建的数据库生效，已有数据库由 maintenance.py vacuum 转换
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
     # User Profile Table
     c.execute('''CREATE TABLE IF NOT EXISTS users
@@ -28,7 +176,8 @@ def init_db():
                      amount      REAL,
                      category    TEXT,
                      context     TEXT,
-                     timestamp   TEXT
+                     timestamp   TEXT,
+                     ts          INTEGER
                  )''')
 
     # Plans Table
@@ -44,21 +193,195 @@ def init_db():
                      status      TEXT
                  )''')
 
+    # Tool Call History Table
+    c.execute('''CREATE TABLE IF NOT EXISTS tool_calls
+                 (
+                     id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id     TEXT,
+                     name        TEXT,
+                     arguments   TEXT,
+                     result      TEXT,
+                     timestamp   REAL
+                 )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tool_calls_user ON tool_calls (user_id, id)")
+
+    # Archived Expenses Table（冷数据，结构与 expenses 相同，保留原 id）
+    c.execute('''CREATE TABLE IF NOT EXISTS expenses_archive
+                 (
+                     id          INTEGER PRIMARY KEY,
+                     user_id     TEXT,
+                     description TEXT,
+                     amount      REAL,
+                     category    TEXT,
+                     context     TEXT,
+                     timestamp   TEXT,
+                     ts          INTEGER
+                 )''')
+
+    # Monthly Summary Table（已归档支出的月度汇总）
+    c.execute('''CREATE TABLE IF NOT EXISTS monthly_expense_summary
+                 (
+                     user_id     TEXT,
+                     month       TEXT,
+                     category    TEXT,
+                     total       REAL,
+                     count       INTEGER,
+                     PRIMARY KEY (user_id, month, category)
+                 )''')
+
+    # Key-Value Metadata Table
+    c.execute('''CREATE TABLE IF NOT EXISTS meta
+                 (
+                     key         TEXT PRIMARY KEY,
+                     value       TEXT
+                 )''')
+
+    # 迁移：ts 为 timestamp 对应的 epoch 秒，时间范围查询走 (user_id, ts) 索引
+    for table in ("expenses", "expenses_archive"):
+        if _ensure_column(c, table, "ts", "INTEGER"):
+            # timestamp 是本地时间，'utc' 修饰符将其换算为真实的 epoch
+            c.execute(f"UPDATE {table} SET ts = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) WHERE ts IS NULL")
+    c.execute("DROP INDEX IF EXISTS idx_expenses_archive_user")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_ts ON expenses (user_id, ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_archive_user_ts ON expenses_archive (user_id, ts)")
+    # 按 id 键集分页（iter_expenses / get_expense_page / get_recent_expenses）
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_id ON expenses (user_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_archive_user_id ON expenses_archive (user_id, id)")
+
+    # 描述/情境的全文索引（trigram 分词以支持中文子串），由触发器与源表保持同步
+    for table in ("expenses", "expenses_archive"):
+        _create_fts(c, table, ("description", "context"))
+
+    # Plan Progress Table（由 add_expense / update_user_profile 增量维护）
+    c.execute('''CREATE TABLE IF NOT EXISTS plan_progress
+                 (
+                     plan_id              INTEGER PRIMARY KEY,
+                     user_id              TEXT,
+                     kind                 TEXT,
+                     baseline             REAL,
+                     amount_achieved      REAL,
+                     current_stage        INTEGER,
+                     progress_status      TEXT,
+                     projected_completion TEXT,
+                     updated_at           TEXT
+                 )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_plan_progress_user ON plan_progress (user_id, kind)")
+    # 迁移：为已有计划补充进度记录（无法得知历史存款，储蓄计划以当前存款为基线）
+    for (plan_id,) in c.execute("SELECT id FROM plans WHERE id NOT IN (SELECT plan_id FROM plan_progress)").fetchall():
+        _init_plan_progress(conn, plan_id)
+
+    # Plan Reminders Table（每个计划一行，由 add_plan / update_plan 维护；next_fire_at 为空表示没有后续提醒）
+    c.execute('''CREATE TABLE IF NOT EXISTS plan_reminders
+                 (
+                     plan_id         INTEGER PRIMARY KEY,
+                     user_id         TEXT,
+                     stage           INTEGER,
+                     next_fire_at    REAL,
+                     pending_message TEXT,
+                     fired_at        REAL
+                 )''')
+    # 调度器按到期时间范围扫描，前端按用户取待送达消息，两个索引都只包含需要的行
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_plan_reminders_due ON plan_reminders (next_fire_at)
+                 WHERE next_fire_at IS NOT NULL""")
+    c.execute("""CREATE INDEX IF NOT EXISTS idx_plan_reminders_pending ON plan_reminders (user_id)
+                 WHERE pending_message IS NOT NULL""")
+    # 迁移：为已有的活跃计划生成提醒
+    for (plan_id,) in c.execute("""SELECT id FROM plans WHERE status = 'active'
+                                   AND id NOT IN (SELECT plan_id FROM plan_reminders)""").fetchall():
+        _sync_reminder(conn, plan_id)
+
+    # Session Checkpoint Table（sessions.py 淘汰空闲会话时保存其最新 checkpoint）
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions
+                 (
+                     thread_id       TEXT PRIMARY KEY,
+                     user_id         TEXT,
+                     checkpoint_type TEXT,
+                     checkpoint      BLOB,
+                     updated_at      REAL
+                 )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)")
+
+    # Conversation Memory Table（滑出对话窗口的历史轮次，按用户建全文索引供检索）
+    c.execute('''CREATE TABLE IF NOT EXISTS conversation_memory
+                 (
+                     id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id    TEXT,
+                     thread_id  TEXT,
+                     message_id TEXT,
+                     content    TEXT,
+                     ts         REAL,
+                     UNIQUE (user_id, message_id)
+                 )''')
+    _create_fts(c, "conversation_memory", ("content",))
+
+    # Expense Parse Log（记账快速通道的解析结果；走 LLM 流程时补记模型给出的金额和类别，用于评估解析准确率）
+    c.execute('''CREATE TABLE IF NOT EXISTS expense_parse_log
+                 (
+                     parse_id     TEXT PRIMARY KEY,
+                     user_id      TEXT,
+                     text         TEXT,
+                     description  TEXT,
+                     amount       REAL,
+                     category     TEXT,
+                     confident    INTEGER,
+                     outcome      TEXT,
+                     reason       TEXT,
+                     llm_amount   REAL,
+                     llm_category TEXT,
+                     ts           REAL
+                 )''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expense_parse_log_user ON expense_parse_log (user_id)")
+
+    # Spending Stats Table（category 为空串表示该用户全部支出；add_expense 时 O(1) 更新）
+    c.execute('''CREATE TABLE IF NOT EXISTS spending_stats
+                 (
+                     user_id  TEXT,
+                     category TEXT,
+                     count    INTEGER,
+                     mean     REAL,
+                     m2       REAL,
+                     sketch   TEXT,
+                     PRIMARY KEY (user_id, category)
+                 )''')
+
+    # Monthly Reports Table（由 reports.py 批量生成）
+    c.execute('''CREATE TABLE IF NOT EXISTS reports
+                 (
+                     user_id     TEXT,
+                     month       TEXT,
+                     report_json TEXT,
+                     narrative   TEXT,
+                     created_at  TEXT,
+                     PRIMARY KEY (user_id, month)
+                 )''')
+
     conn.commit()
     conn.close()
 
 
+def init_db():
+    for path in all_db_paths():
+        init_shard(path)
+    if WRITE_BEHIND:
+        enable_write_behind()
+
+
 # --- User Operations ---
 
-def get_user_profile(user_id: str) -> Dict:
-    conn = sqlite3.connect(DB_PATH)
+def _read_profile(user_id: str):
+    conn = connect(user_id)
     c = conn.cursor()
     c.execute("SELECT profile_json FROM users WHERE user_id = ?", (user_id,))
     row = c.fetchone()
     conn.close()
+    return json.loads(row[0]) if row else None
 
-    if row:
-        return json.loads(row[0])
+
+def get_user_profile(user_id: str) -> Dict:
+    profile = _read_profile(user_id)
+
+    if profile is not None:
+        return profile
     else:
         # Default profile if new user
         default_profile = {
@@ -72,8 +395,7 @@ def get_user_profile(user_id: str) -> Dict:
         return default_profile
 
 
-def update_user_profile(user_id: str, updates: Dict):
-    conn = sqlite3.connect(DB_PATH)
+def _merge_profile(conn: sqlite3.Connection, user_id: str, updates: Dict) -> Dict:
     c = conn.cursor()
 
     # Get existing first to merge
@@ -84,51 +406,374 @@ def update_user_profile(user_id: str, updates: Dict):
         current_profile = json.loads(row[0])
         current_profile.update(updates)
     else:
-        current_profile = updates
+        current_profile = dict(updates)
 
     c.execute("INSERT OR REPLACE INTO users (user_id, profile_json) VALUES (?, ?)",
               (user_id, json.dumps(current_profile)))
-    conn.commit()
-    conn.close()
+    if "saving" in updates:
+        try:
+            saving = float(current_profile.get("saving") or 0)
+        except (TypeError, ValueError):
+            saving = None
+        if saving is not None:
+            _update_progress(conn, user_id, "saving", saving=saving)
     return current_profile
 
 
+def update_user_profile(user_id: str, updates: Dict):
+    if write_queue is not None:
+        # 写入在后台执行：先读出当前档案（会等待此前的写入落盘），在本地合并作为返回值
+        current_profile = _read_profile(user_id) or {}
+        current_profile.update(updates)
+        _write(user_id, lambda conn: _merge_profile(conn, user_id, updates))
+        return current_profile
+    return _write(user_id, lambda conn: _merge_profile(conn, user_id, updates))
+
+
 # --- Expense Operations ---
 
 def add_expense(user_id: str, description: str, amount: float, category: str,
                 context: str):
-    conn = sqlite3.connect(DB_PATH)
+    now = datetime.now()
+
+    def op(conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT INTO expenses (user_id, description, amount, category, context, timestamp, ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, description, amount, category, context, now.isoformat(), to_epoch(now)))
+        _update_progress(conn, user_id, "limit", amount_delta=amount, at=now)
+        _update_spending_stats(conn, user_id, category, amount)
+
+    _write(user_id, op)
+
+
+# 流式读取时使用的轻量记录，避免每行构造 dict
+EXPENSE_COLUMNS = ("id", "user_id", "description", "amount", "category", "context", "timestamp", "ts")
+ExpenseRecord = namedtuple("ExpenseRecord", EXPENSE_COLUMNS)
+ITER_BATCH_SIZE = 500
+
+
+def _expense_batch(conn: sqlite3.Connection, user_id: str, boundary_id: Optional[int], limit: int,
+                   descending: bool, include_archive: bool) -> List[ExpenseRecord]:
+    """按 id 键集分页读取一批支出；合并冷表时两个表各取 limit 条再归并（id 在分片内唯一）"""
+    op, order = ("<", "DESC") if descending else (">", "ASC")
+    cols = ", ".join(EXPENSE_COLUMNS)
+    tables = ["expenses"]
+    if include_archive and get_archive_cutoff(conn):
+        tables.append("expenses_archive")
+    clause = "user_id = ?" + (f" AND id {op} ?" if boundary_id is not None else "")
+    params = [user_id] + ([boundary_id] if boundary_id is not None else [])
+    branches = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT {cols} FROM {table} WHERE {clause} ORDER BY id {order} LIMIT ?)" for table in tables)
+    rows = conn.execute(f"{branches} ORDER BY id {order} LIMIT ?",
+                        (params + [limit]) * len(tables) + [limit]).fetchall()
+    return [ExpenseRecord._make(row) for row in rows]
+
+
+def iter_expenses(user_id: str, after_id: int = None, batch: int = ITER_BATCH_SIZE,
+                  include_archive: bool = False) -> Iterator[ExpenseRecord]:
+    """按 id 升序流式迭代支出，每批一次键集查询，内存占用与总行数无关"""
+    conn = connect(user_id)
+    try:
+        while True:
+            records = _expense_batch(conn, user_id, after_id, batch, False, include_archive)
+            yield from records
+            if len(records) < batch:
+                break
+            after_id = records[-1].id
+    finally:
+        conn.close()
+
+
+def get_expense_page(user_id: str, before_id: int = None, limit: int = 5,
+                     include_archive: bool = True) -> Tuple[List[ExpenseRecord], Optional[int]]:
+    """按 id 倒序读取一页支出，返回 (记录, 下一页的 before_id)，没有更早的记录时后者为 None"""
+    conn = connect(user_id)
+    try:
+        records = _expense_batch(conn, user_id, before_id, limit + 1, True, include_archive)
+    finally:
+        conn.close()
+    if len(records) > limit:
+        return records[:limit], records[limit - 1].id
+    return records, None
+
+
+def get_recent_expenses(user_id: str, limit: int = 5) -> List[Dict]:
+    records, _ = get_expense_page(user_id, None, limit, include_archive=False)
+    return [record._asdict() for record in records]
+
+
+def get_archive_cutoff(conn: sqlite3.Connection) -> str:
+    """早于该时间（ISO 字符串）的支出已移入 expenses_archive，未归档过则返回空串"""
+    row = conn.execute("SELECT value FROM meta WHERE key = 'archive_cutoff'").fetchone()
+    return row[0] if row else ""
+
+
+def expense_source(conn: sqlite3.Connection, start: str = None) -> str:
+    """返回查询 start 之后支出时应使用的表表达式，只有范围覆盖到已归档数据时才合并冷表"""
+    cutoff = get_archive_cutoff(conn)
+    if cutoff and (start is None or start < cutoff):
+        return "(SELECT * FROM expenses UNION ALL SELECT * FROM expenses_archive)"
+    return "expenses"
+
+
+def _range_clause(user_id: str, start: TimeLike, end: TimeLike = None, category: str = None):
+    """构造 [start, end) 时间范围查询的 WHERE 子句和参数"""
+    clause = "user_id = ? AND ts >= ?"
+    params = [user_id, to_epoch(start)]
+    if end is not None:
+        clause += " AND ts < ?"
+        params.append(to_epoch(end))
+    if category is not None:
+        clause += " AND category = ?"
+        params.append(category)
+    return clause, params
+
+
+def sum_expenses_between(user_id: str, start: TimeLike, end: TimeLike = None, category: str = None) -> float:
+    """统计 [start, end) 时间范围内的支出总额"""
+    conn = connect(user_id)
     c = conn.cursor()
-    timestamp = datetime.now().isoformat()
-    c.execute(
-        "INSERT INTO expenses (user_id, description, amount, category, context, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, description, amount, category, context, timestamp))
-    conn.commit()
+    clause, params = _range_clause(user_id, start, end, category)
+    source = expense_source(conn, datetime.fromtimestamp(params[1]).isoformat())
+    c.execute(f"SELECT COALESCE(SUM(amount), 0) FROM {source} WHERE {clause}", params)
+    total = c.fetchone()[0]
     conn.close()
+    return total
 
 
-def get_recent_expenses(user_id: str, limit: int = 5) -> List[Dict]:
-    conn = sqlite3.connect(DB_PATH)
+# 单次查询最多使用的 trigram 数量
+MAX_SEARCH_TRIGRAMS = 32
+# LIKE 回退最多使用的二字词数量
+MAX_SEARCH_BIGRAMS = 16
+# 中文没有空格分词，较长的查询按二字切分后参与 LIKE 回退；含这些虚词/动词的二字组合区分度太低，不使用
+_BIGRAM_STOP_CHARS = set("了的个和买在是我一也就都")
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]{2,}")
+
+
+def _search_terms(text: str):
+    """把查询文本拆成 FTS trigram 短语和 LIKE 回退用的二字词（两个字的词及较长中文词切出的二字组合）"""
+    trigrams, short_terms = [], []
+    for token in re.split(r"[\s\W_]+", (text or "").lower()):
+        if len(token) >= 3:
+            trigrams.extend(token[i:i + 3] for i in range(len(token) - 2))
+            # “买盲盒”“盲盒手办”的 trigram 与“买了盲盒”没有重合，需要二字词才能召回
+            for run in _CJK_RUN.findall(token):
+                short_terms.extend(run[i:i + 2] for i in range(len(run) - 1)
+                                   if not _BIGRAM_STOP_CHARS.intersection(run[i:i + 2]))
+        elif len(token) == 2:
+            short_terms.append(token)
+    return list(dict.fromkeys(trigrams))[:MAX_SEARCH_TRIGRAMS], list(dict.fromkeys(short_terms))[:MAX_SEARCH_BIGRAMS]
+
+
+def find_similar_expenses(user_id: str, text: str, k: int = 5) -> List[Dict]:
+    """按相关度返回与 text 相似的历史支出（含已归档）。
+
+    先用 trigram 全文索引按 bm25 排序；结果不足 k 条时用二字词 LIKE 匹配补足，按命中的词数和时间排序。
+    """
+    trigrams, short_terms = _search_terms(text)
+    if not trigrams and not short_terms:
+        return []
+
+    conn = connect(user_id)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    c.execute("SELECT * FROM expenses WHERE user_id = ? ORDER BY id DESC LIMIT ?",
-              (user_id, limit))
-    rows = c.fetchall()
+    results: Dict[int, Dict] = {}
+
+    if trigrams:
+        # 用户条件写在 MATCH 里，只有该用户的文档参与匹配和打分；e.user_id 再精确核对一次
+        query = _fts_user_query(user_id, trigrams)
+        for table in ("expenses", "expenses_archive"):
+            c.execute(f"""SELECT e.*, bm25({table}_fts) AS rank
+                          FROM {table}_fts JOIN {table} e ON e.id = {table}_fts.rowid
+                          WHERE {table}_fts MATCH ? AND e.user_id = ?
+                          ORDER BY rank LIMIT ?""",
+                      (query, user_id, k))
+            for row in c.fetchall():
+                results[row["id"]] = dict(row)
+
+    # trigram 无法索引两个字的词（如“盲盒”），也召回不了换了说法的长查询，退化为按用户范围内的 LIKE 匹配
+    like_hits: Dict[int, Dict] = {}
+    if short_terms and len(results) < k:
+        like = " OR ".join("description LIKE ? OR context LIKE ?" for _ in short_terms)
+        params = [user_id]
+        for term in short_terms:
+            params.extend([f"%{term}%", f"%{term}%"])
+        # 多取一些候选，再按命中的二字词数排序
+        params.append(k * 4)
+        source = expense_source(conn)
+        c.execute(f"SELECT * FROM {source} WHERE user_id = ? AND ({like}) ORDER BY ts DESC LIMIT ?", params)
+        for row in c.fetchall():
+            if row["id"] not in results:
+                like_hits[row["id"]] = dict(row)
+
     conn.close()
-    return [dict(row) for row in rows]
+    ranked = sorted(results.values(), key=lambda e: (e["rank"], -(e.get("ts") or 0)))
+    for expense in ranked:
+        expense.pop("rank", None)
+
+    def matched(e: Dict) -> int:
+        text = f"{e.get('description') or ''} {e.get('context') or ''}".lower()
+        return sum(term in text for term in short_terms)
+
+    ranked += sorted(like_hits.values(), key=lambda e: (-matched(e), -(e.get("ts") or 0)))
+    return ranked[:k]
+
+
+def read_monthly_summaries(conn: sqlite3.Connection, user_id: str, start_month: str,
+                           end_month: str) -> List[Tuple[str, str, float, int]]:
+    """读取 [start_month, end_month) 内已归档月份的按类别汇总 (month, category, total, count)，月份形如 '2025-01'"""
+    return conn.execute("SELECT month, category, total, count FROM monthly_expense_summary "
+                        "WHERE user_id = ? AND month >= ? AND month < ? ORDER BY month",
+                        (user_id, start_month, end_month)).fetchall()
+
+
+def summarized_months(conn: sqlite3.Connection, start: str) -> Tuple[str, str]:
+    """把从 start 开始的查询拆成两段，返回 (汇总表覆盖到的月份, 需要扫描明细的起点)
+
+    归档水位线所在月之前的月份已整月归档，可以直接读 monthly_expense_summary；
+    start 不是月初或没有整月归档的月份时第一项为空串，全部扫描明细。
+    """
+    end_month = get_archive_cutoff(conn)[:7]
+    if not end_month or start[7:] not in ("", "-01") or start[:7] >= end_month:
+        return "", start
+    return end_month, end_month + "-01"
+
+
+# --- Spending Stats ---
+
+def read_spending_stats(conn: sqlite3.Connection, user_id: str, category: str = "") -> Optional[RunningStats]:
+    row = conn.execute("SELECT count, mean, m2, sketch FROM spending_stats WHERE user_id = ? AND category = ?",
+                       (user_id, category or "")).fetchone()
+    if row is None:
+        return None
+    return RunningStats(row[0], row[1], row[2], QuantileSketch.from_json(row[3]))
+
+
+def put_spending_stats(conn: sqlite3.Connection, user_id: str, category: str, stats: RunningStats):
+    conn.execute("INSERT OR REPLACE INTO spending_stats (user_id, category, count, mean, m2, sketch) VALUES (?, ?, ?, ?, ?, ?)",
+                 (user_id, category or "", stats.count, stats.mean, stats.m2, stats.sketch.to_json()))
+
+
+def _update_spending_stats(conn: sqlite3.Connection, user_id: str, category: str, amount: float):
+    """把一笔支出计入用户总体和该类别的统计"""
+    for key in {"", category or ""}:
+        stats = read_spending_stats(conn, user_id, key) or RunningStats()
+        stats.add(float(amount or 0))
+        put_spending_stats(conn, user_id, key, stats)
+
+
+def get_spending_stats(user_id: str, category: str = None) -> Dict[str, Optional[RunningStats]]:
+    """返回 {'overall': 全部支出的统计, 'category': 该类别的统计}，没有记录时为 None"""
+    conn = connect(user_id)
+    try:
+        return {
+            "overall": read_spending_stats(conn, user_id),
+            "category": read_spending_stats(conn, user_id, category) if category else None,
+        }
+    finally:
+        conn.close()
+
+
+# --- Plan Progress ---
+
+def _current_saving(conn: sqlite3.Connection, user_id: str) -> float:
+    row = conn.execute("SELECT profile_json FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if not row:
+        return 0.0
+    try:
+        return float(json.loads(row[0]).get("saving") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _write_progress(conn: sqlite3.Connection, plan: Dict, kind: str, baseline: float, achieved: float):
+    start = plan_progress.parse_start_date(plan["start_date"])
+    derived = plan_progress.derive_progress(kind, plan["goal_amount"], plan["stages_amount"], start, achieved)
+    conn.execute(
+        """INSERT OR REPLACE INTO plan_progress
+           (plan_id, user_id, kind, baseline, amount_achieved, current_stage, progress_status, projected_completion, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (plan["id"], plan["user_id"], kind, baseline, achieved, derived["current_stage"],
+         derived["progress_status"], derived["projected_completion"], datetime.now().isoformat()))
+
+
+def _init_plan_progress(conn: sqlite3.Connection, plan_id: int, keep_baseline: bool = False):
+    """计算单个计划的完整进度（新建或修改计划时调用，只扫描一次该计划开始后的支出）"""
+    row = conn.execute("SELECT id, user_id, plan_type, start_date, goal_amount, stages_amount FROM plans WHERE id = ?",
+                       (plan_id,)).fetchone()
+    if row is None:
+        return
+    plan = dict(zip(("id", "user_id", "plan_type", "start_date", "goal_amount", "stages_amount"), row))
+    kind = plan_progress.plan_kind(plan["plan_type"])
+    saving = _current_saving(conn, plan["user_id"])
+    baseline = saving
+    if keep_baseline:
+        existing = conn.execute("SELECT baseline FROM plan_progress WHERE plan_id = ?", (plan_id,)).fetchone()
+        if existing and existing[0] is not None:
+            baseline = existing[0]
+
+    achieved = 0.0
+    if kind == "saving":
+        achieved = max(0.0, saving - baseline)
+    elif kind == "limit":
+        start = plan_progress.parse_start_date(plan["start_date"])
+        source = expense_source(conn, start.isoformat())
+        achieved = conn.execute(f"SELECT COALESCE(SUM(amount), 0) FROM {source} WHERE user_id = ? AND ts >= ?",
+                                (plan["user_id"], to_epoch(start))).fetchone()[0]
+    _write_progress(conn, plan, kind, baseline, achieved)
+
+
+def _update_progress(conn: sqlite3.Connection, user_id: str, kind: str,
+                     amount_delta: float = None, saving: float = None, at: datetime = None):
+    """增量更新某类活跃计划的进度：消费节制计划累加支出，储蓄计划按存款与基线之差重算"""
+    rows = conn.execute(
+        """SELECT p.id, p.user_id, p.plan_type, p.start_date, p.goal_amount, p.stages_amount,
+                  g.baseline, g.amount_achieved
+           FROM plan_progress g JOIN plans p ON p.id = g.plan_id
+           WHERE g.user_id = ? AND g.kind = ? AND p.status = 'active'""",
+        (user_id, kind)).fetchall()
+    for row in rows:
+        plan = dict(zip(("id", "user_id", "plan_type", "start_date", "goal_amount", "stages_amount"), row[:6]))
+        baseline, achieved = row[6] or 0, row[7] or 0
+        if amount_delta is not None:
+            # 计划开始之前的支出不计入
+            if at is not None and at < plan_progress.parse_start_date(plan["start_date"], at):
+                continue
+            achieved += amount_delta
+        if saving is not None:
+            achieved = max(0.0, saving - baseline)
+        _write_progress(conn, plan, kind, baseline, achieved)
+
+
+def with_live_progress(plan: Dict) -> Dict:
+    """按当前时间刷新阶段/状态/预计完成日期（只做计算，不读历史）"""
+    if plan.get("amount_achieved") is None:
+        return plan
+    start = plan_progress.parse_start_date(plan.get("start_date"))
+    kind = plan_progress.plan_kind(plan.get("plan_type"))
+    plan.update(plan_progress.derive_progress(kind, plan.get("goal_amount"), plan.get("stages_amount"),
+                                              start, plan["amount_achieved"]))
+    return plan
 
 
 # --- Plan Operations ---
 
+_PLAN_WITH_PROGRESS = """SELECT p.*, g.amount_achieved, g.current_stage, g.progress_status, g.projected_completion
+                         FROM plans p LEFT JOIN plan_progress g ON g.plan_id = p.id"""
+
+
 def add_plan(user_id: str, plan_type: str, content: str, start_date: str,
-             stages_amount: float = None, goal_amount: float = None):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO plans (user_id, plan_type, content, start_date, goal_amount, stages_amount, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (user_id, plan_type, content, start_date, stages_amount, goal_amount, "active"))
-    conn.commit()
-    conn.close()
+             goal_amount: float = None, stages_amount: float = None) -> int:
+    """新增计划并初始化其进度，返回计划 id"""
+    def op(conn: sqlite3.Connection):
+        cur = conn.execute(
+            "INSERT INTO plans (user_id, plan_type, content, start_date, goal_amount, stages_amount, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, plan_type, content, start_date, goal_amount, stages_amount, "active"))
+        _init_plan_progress(conn, cur.lastrowid)
+        _sync_reminder(conn, cur.lastrowid)
+        return cur.lastrowid
+
+    return _write(user_id, op, wait=True)
 
 
 def update_plan(plan_id: int, user_id: str, plan_type: str = None, content: str = None,
@@ -152,9 +797,6 @@ def update_plan(plan_id: int, user_id: str, plan_type: str = None, content: str
     if not updates:
         return False
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
     # 动态构建SET子句
     set_clause = ", ".join(f"{key}=?" for key in updates.keys())
     sql = f"UPDATE plans SET {set_clause} WHERE id=? AND user_id=?"
@@ -162,35 +804,44 @@ def update_plan(plan_id: int, user_id: str, plan_type: str = None, content: str
     # 构建参数列表
     params = list(updates.values()) + [plan_id, user_id]
 
-    c.execute(sql, params)
-    conn.commit()
-    conn.close()
-    return c.rowcount > 0
+    # 影响进度计算的字段变化时重算该计划进度
+    affects_progress = any(key in updates for key in ("plan_type", "start_date", "goal_amount", "stages_amount"))
+
+    def op(conn: sqlite3.Connection):
+        updated = conn.execute(sql, params).rowcount > 0
+        if updated and affects_progress:
+            _init_plan_progress(conn, plan_id, keep_baseline=True)
+        if updated:
+            _sync_reminder(conn, plan_id)
+        return updated
+
+    return _write(user_id, op, wait=True)
 
 
 def delete_plan(plan_id: int, user_id: str) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM plans WHERE id=? AND user_id=?", (plan_id, user_id))
-    conn.commit()
-    conn.close()
-    return c.rowcount > 0
+    def op(conn: sqlite3.Connection):
+        conn.execute("DELETE FROM plan_progress WHERE plan_id=? AND user_id=?", (plan_id, user_id))
+        conn.execute("DELETE FROM plan_reminders WHERE plan_id=? AND user_id=?", (plan_id, user_id))
+        return conn.execute("DELETE FROM plans WHERE id=? AND user_id=?", (plan_id, user_id)).rowcount > 0
+
+    return _write(user_id, op, wait=True)
 
 
 def get_active_plans(user_id: str) -> List[Dict]:
-    conn = sqlite3.connect(DB_PATH)
+    """活跃计划及其进度（已达成金额、当前阶段、进度状态、预计完成日期）"""
+    conn = connect(user_id)
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
-    c.execute("SELECT * FROM plans WHERE user_id = ? AND status = 'active'", (user_id,))
+    c.execute(f"{_PLAN_WITH_PROGRESS} WHERE p.user_id = ? AND p.status = 'active'", (user_id,))
     rows = c.fetchall()
     conn.close()
-    return [dict(row) for row in rows]
+    return [with_live_progress(dict(row)) for row in rows]
 
 
 def get_stage_plan(user_id: str) -> dict:
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(user_id)
     c = conn.cursor()
-    c.execute("SELECT stages_amount FROM plans WHERE user_id = ?", (user_id,))
+    c.execute("SELECT stages_amount FROM plans WHERE user_id = ? AND status = 'active'", (user_id,))
     rows = c.fetchall()
     conn.close()
     stages_amounts = {}
@@ -199,3 +850,219 @@ def get_stage_plan(user_id: str) -> dict:
         stages_amounts[f"计划{n}:"] = row
         n += 1
     return stages_amounts
+
+
+# --- Plan Reminders ---
+
+def _sync_reminder(conn: sqlite3.Connection, plan_id: int, now: datetime = None):
+    """按计划的开始日期和阶段重新计算下一次提醒（计划不再活跃或没有后续阶段时 next_fire_at 置空）"""
+    row = conn.execute("SELECT user_id, start_date, goal_amount, stages_amount, status FROM plans WHERE id = ?",
+                       (plan_id,)).fetchone()
+    if row is None:
+        conn.execute("DELETE FROM plan_reminders WHERE plan_id = ?", (plan_id,))
+        return
+    user_id, start_date, goal_amount, stages_amount, status = row
+    upcoming = None
+    if status == "active":
+        upcoming = plan_progress.next_reminder(plan_progress.parse_start_date(start_date), goal_amount,
+                                               stages_amount, now)
+    stage, fire_at = upcoming if upcoming else (None, None)
+    conn.execute("""INSERT INTO plan_reminders (plan_id, user_id, stage, next_fire_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (plan_id) DO UPDATE SET user_id = excluded.user_id, stage = excluded.stage,
+                                                        next_fire_at = excluded.next_fire_at""",
+                 (plan_id, user_id, stage, fire_at.timestamp() if fire_at else None))
+
+
+def load_due_reminders(path: str, until: float) -> List[Tuple[str, int, float]]:
+    """读取单个分片中 until（epoch 秒）之前到期的提醒 [(user_id, plan_id, next_fire_at)]，包括已过期未触发的"""
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("""SELECT user_id, plan_id, next_fire_at FROM plan_reminders
+                               WHERE next_fire_at IS NOT NULL AND next_fire_at < ?
+                               ORDER BY next_fire_at""", (until,)).fetchall()
+    finally:
+        conn.close()
+
+
+def fire_reminder(user_id: str, plan_id: int, due: float, now: datetime = None) -> Optional[Dict]:
+    """触发一条到期提醒：生成文案写入 pending_message 并推进 next_fire_at，返回提醒内容。
+
+    只有 next_fire_at 仍等于 due 时才触发（计划已修改、或已被其他进程触发时返回 None），
+    停机期间错过的多个阶段只补发一条，报告当前所处的阶段。
+    """
+    now = now or datetime.now()
+
+    def op(conn: sqlite3.Connection):
+        row = conn.execute("SELECT next_fire_at FROM plan_reminders WHERE plan_id = ? AND user_id = ?",
+                           (plan_id, user_id)).fetchone()
+        if row is None or row[0] is None or abs(row[0] - due) > 1e-3:
+            return None
+        conn.row_factory = sqlite3.Row
+        plan = conn.execute(f"{_PLAN_WITH_PROGRESS} WHERE p.id = ?", (plan_id,)).fetchone()
+        conn.row_factory = None
+        if plan is None:
+            conn.execute("DELETE FROM plan_reminders WHERE plan_id = ?", (plan_id,))
+            return None
+        plan = with_live_progress(dict(plan))
+        start = plan_progress.parse_start_date(plan["start_date"])
+        upcoming = plan_progress.next_reminder(start, plan["goal_amount"], plan["stages_amount"], now)
+        finished = plan["status"] != "active" or plan.get("progress_status") == "achieved"
+        message = None
+        if not finished:
+            total = plan_progress.total_stages(plan["goal_amount"], plan["stages_amount"])
+            stage = upcoming[0] - 1 if upcoming else total + 1
+            message = plan_progress.reminder_message(plan, stage)
+        if finished or upcoming is None:
+            upcoming = (None, None)
+        conn.execute("""UPDATE plan_reminders SET stage = ?, next_fire_at = ?, fired_at = ?,
+                                                  pending_message = COALESCE(?, pending_message)
+                        WHERE plan_id = ?""",
+                     (upcoming[0], upcoming[1].timestamp() if upcoming[1] else None, now.timestamp(), message, plan_id))
+        if message is None:
+            return None
+        return {"user_id": user_id, "plan_id": plan_id, "stage": stage, "message": message, "due": due,
+                "next_fire_at": upcoming[1].timestamp() if upcoming[1] else None}
+
+    return _write(user_id, op, wait=True)
+
+
+def pop_reminder_messages(user_id: str) -> List[Dict]:
+    """取出并清空用户待送达的提醒消息（前端在展示对话时调用）"""
+    def op(conn: sqlite3.Connection):
+        rows = conn.execute("""SELECT plan_id, pending_message, fired_at FROM plan_reminders
+                               WHERE user_id = ? AND pending_message IS NOT NULL ORDER BY fired_at""",
+                            (user_id,)).fetchall()
+        if rows:
+            conn.execute("UPDATE plan_reminders SET pending_message = NULL WHERE user_id = ? AND pending_message IS NOT NULL",
+                         (user_id,))
+        return [{"plan_id": plan_id, "message": message, "fired_at": fired_at} for plan_id, message, fired_at in rows]
+
+    return _write(user_id, op, wait=True)
+
+
+# --- Tool Call Operations ---
+
+def add_tool_call(user_id: str, name: str, arguments: Dict, result: str, timestamp: float):
+    arguments_json = json.dumps(arguments, ensure_ascii=False)
+
+    def op(conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT INTO tool_calls (user_id, name, arguments, result, timestamp) VALUES (?, ?, ?, ?, ?)",
+            (user_id, name, arguments_json, result, timestamp))
+
+    _write(user_id, op)
+
+
+def get_tool_calls(user_id: str, limit: int = 10, before_id: int = None) -> List[Dict]:
+    """按 id 倒序分页读取工具调用记录，before_id 为上一页最后一条的 id"""
+    conn = connect(user_id)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    if before_id is None:
+        c.execute("SELECT * FROM tool_calls WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                  (user_id, limit))
+    else:
+        c.execute("SELECT * FROM tool_calls WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                  (user_id, before_id, limit))
+    rows = c.fetchall()
+    conn.close()
+    records = []
+    for row in rows:
+        record = dict(row)
+        record["arguments"] = json.loads(record["arguments"] or "{}")
+        records.append(record)
+    return records
+
+
+# --- Session Operations ---
+
+def save_session_checkpoint(user_id: str, thread_id: str, checkpoint_type: str, checkpoint: bytes):
+    def op(conn: sqlite3.Connection):
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (thread_id, user_id, checkpoint_type, checkpoint, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (thread_id, user_id, checkpoint_type, sqlite3.Binary(checkpoint), datetime.now().timestamp()))
+
+    _write(user_id, op)
+
+
+def load_session_checkpoint(user_id: str, thread_id: str):
+    """返回 (checkpoint_type, checkpoint)，没有保存过时返回 None"""
+    conn = connect(user_id)
+    c = conn.cursor()
+    c.execute("SELECT checkpoint_type, checkpoint FROM sessions WHERE thread_id = ?", (thread_id,))
+    row = c.fetchone()
+    conn.close()
+    return (row[0], bytes(row[1])) if row else None
+
+
+# --- Conversation Memory ---
+
+def archive_conversation_turns(user_id: str, thread_id: str, turns: List[Tuple[str, str]]):
+    """归档滑出对话窗口的轮次 [(首条消息 id, 文本)]，同一轮重复归档时忽略；FTS 索引由触发器增量维护"""
+    if not turns:
+        return
+    now = datetime.now().timestamp()
+
+    def op(conn: sqlite3.Connection):
+        conn.executemany(
+            "INSERT OR IGNORE INTO conversation_memory (user_id, thread_id, message_id, content, ts) VALUES (?, ?, ?, ?, ?)",
+            [(user_id, thread_id, message_id, content, now) for message_id, content in turns])
+
+    _write(user_id, op)
+
+
+def search_conversation_memory(user_id: str, text: str, k: int = 3) -> List[Dict]:
+    """按 bm25 相关度返回该用户与 text 最相关的 k 条历史对话轮次"""
+    trigrams, short_terms = _search_terms(text)
+    if not trigrams and not short_terms:
+        return []
+
+    conn = connect(user_id)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    results: Dict[int, Dict] = {}
+    if trigrams:
+        query = _fts_user_query(user_id, trigrams)
+        c.execute("""SELECT m.id, m.content, m.ts, bm25(conversation_memory_fts) AS rank
+                     FROM conversation_memory_fts JOIN conversation_memory m ON m.id = conversation_memory_fts.rowid
+                     WHERE conversation_memory_fts MATCH ? AND m.user_id = ?
+                     ORDER BY rank LIMIT ?""",
+                  (query, user_id, k))
+        for row in c.fetchall():
+            results[row["id"]] = dict(row)
+    # 两个字的词无法用 trigram 匹配，退化为 LIKE
+    if short_terms and len(results) < k:
+        like = " OR ".join("content LIKE ?" for _ in short_terms)
+        c.execute(f"SELECT id, content, ts FROM conversation_memory WHERE user_id = ? AND ({like}) ORDER BY id DESC LIMIT ?",
+                  [user_id, *(f"%{term}%" for term in short_terms), k])
+        for row in c.fetchall():
+            results.setdefault(row["id"], dict(row))
+    conn.close()
+    ranked = sorted(results.values(), key=lambda m: (m.get("rank", 0), -m["id"]))
+    for memory in ranked:
+        memory.pop("rank", None)
+    return ranked[:k]
+
+
+# --- Expense Parse Log ---
+
+def log_expense_parse(user_id: str, parse_id: str, text: str, parsed, outcome: str, reason: str = ""):
+    """记录一次本地记账解析（parsed 为 expense_parser.ParsedExpense），outcome 为 fast_path / fallback / shadow"""
+    def op(conn: sqlite3.Connection):
+        conn.execute(
+            """INSERT INTO expense_parse_log
+               (parse_id, user_id, text, description, amount, category, confident, outcome, reason, ts)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (parse_id, user_id, text, parsed.description, parsed.amount, parsed.category, int(parsed.confident),
+             outcome, reason, datetime.now().timestamp()))
+
+    _write(user_id, op)
+
+
+def record_llm_expense(user_id: str, parse_id: str, amount: float, category: str):
+    """补记 LLM 流程对同一条消息调用 log_notable_expense 时的金额和类别（只记第一次）"""
+    def op(conn: sqlite3.Connection):
+        conn.execute("UPDATE expense_parse_log SET llm_amount = ?, llm_category = ? WHERE parse_id = ? AND llm_amount IS NULL",
+                     (amount, category, parse_id))
+
+    _write(user_id, op)
@@ -1,6 +1,40 @@
+"""环境变量配置：读取 .env 与环境变量，集中定义各模块使用的开关和参数。"""
 import os
+
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
-QWEN_API_KEY = os.getenv("DASHSCOPE_API_KEY")
-QWEN_BASE_URL = os.getenv("BASE_URL")
+# LLM_API_KEY_OVERRIDE / LLM_BASE_URL_OVERRIDE 不会被 .env 覆盖，压测时用来把模型请求指向本地 mock 服务
+QWEN_API_KEY = os.getenv("LLM_API_KEY_OVERRIDE") or os.getenv("DASHSCOPE_API_KEY")
+QWEN_BASE_URL = os.getenv("LLM_BASE_URL_OVERRIDE") or os.getenv("BASE_URL")
+# 早于该天数的支出会被 maintenance.py archive 移入归档表
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "365"))
+# 用户数据按一致性哈希分布到的数据库文件数
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+# 开启后写操作进入后台队列，按刷盘间隔或批大小合并为一个事务提交
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "50"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "256"))
+# 对话图模式：two_call（先识别意图再回复）或 fused（一次调用同时给出意图和回复/工具调用）
+GRAPH_MODE = os.getenv("GRAPH_MODE", "two_call").lower()
+# 单进程内保留在内存中的会话数上限，以及会话空闲多久（秒）后被淘汰到数据库
+SESSION_MAX_LIVE = int(os.getenv("SESSION_MAX_LIVE", "1000"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+# 对话长期记忆：每轮检索注入的历史片段数及其 token 上限
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "3"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "300"))
+# LLM 准入控制：每分钟请求数与 token 数上限（0 表示不限），以及每个优先级的最大排队数
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "256"))
+# 记账快速通道：on 直接入账（默认），shadow 只解析并记录、仍走完整流程（用 maintenance.py parse-stats 评估准确率），off 关闭
+FAST_EXPENSE_PATH = os.getenv("FAST_EXPENSE_PATH", "on").lower()
+# 工具结果直接用模板渲染回复的只读意图（逗号分隔，留空则全部交给 LLM 回复）
+RESPONSE_TEMPLATE_INTENTS = [i.strip() for i in os.getenv("RESPONSE_TEMPLATE_INTENTS", "review_plan,view_recent_expenses").split(",") if i.strip()]
+# 是否在对话进程中运行计划阶段提醒调度器（默认关闭，部署时选择一个进程开启或单独运行 reminders.py）
+PLAN_REMINDERS = os.getenv("PLAN_REMINDERS", "0").lower() in ("1", "true", "yes")
+# 在线备份：快照目录（默认数据库旁的 backups/）、后台备份间隔（小时，0 表示不在对话进程中备份）、保留份数、是否 gzip 压缩
+BACKUP_DIR = os.getenv("BACKUP_DIR", "")
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "0"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "1").lower() in ("1", "true", "yes")
@@ -0,0 +1,168 @@
+"""本地记账解析：从“午饭 25 元”“买了本书 58”这类明确的记账消息中提取金额、描述、类别和情境。
+
+纯规则实现，不调用 LLM。只有在金额唯一、没有咨询/计划类用词、描述清楚时才判定为有把握（confident），
+其余情况交给完整对话图处理。
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# 支出类别词典（类别名与 impulse_rules.json 的 category_keywords 保持一致）
+CATEGORY_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "餐饮": ("早饭", "午饭", "晚饭", "早餐", "午餐", "晚餐", "夜宵", "吃饭", "外卖", "食堂", "奶茶", "咖啡", "零食",
+           "水果", "饮料", "火锅", "烧烤", "聚餐", "面包", "便当"),
+    "交通": ("打车", "滴滴", "地铁", "公交", "高铁", "火车", "机票", "车票", "加油", "停车", "共享单车"),
+    "学习": ("教材", "书", "课程", "网课", "文具", "打印", "复印", "考试", "报名费", "资料"),
+    "服饰": ("衣服", "裤子", "裙子", "外套", "鞋", "袜子", "帽子", "包包"),
+    "数码": ("手机", "耳机", "电脑", "平板", "充电器", "数据线", "键盘", "鼠标"),
+    "娱乐": ("电影", "游戏", "唱歌", "KTV", "演唱会", "剧本杀", "抽卡", "皮肤", "会员"),
+    "日用": ("超市", "日用品", "洗发水", "牙膏", "纸巾", "洗衣液"),
+    "医疗": ("药", "医院", "挂号", "看病", "体检"),
+    "通讯": ("话费", "流量", "宽带"),
+    "住房": ("房租", "水电", "电费", "水费", "住宿"),
+}
+# 情境线索 -> 写入 context 的说明
+CONTEXT_CUES: Dict[str, str] = {
+    "心情不好": "心情不好", "难过": "心情不好", "压力大": "压力大", "奖励自己": "奖励自己",
+    "打折": "打折促销", "促销": "打折促销", "秒杀": "打折促销", "满减": "打折促销",
+    "朋友": "和朋友一起", "同学": "和同学一起", "请客": "请客", "生日": "生日",
+    "加班": "加班", "赶时间": "赶时间", "下雨": "天气原因",
+}
+# 出现这些词时不是单纯的记账（咨询、计划、收入、修改档案等），交给完整对话图
+BLOCKING_WORDS = ("值得", "要不要", "该不该", "想买", "打算", "准备", "计划", "预算", "存", "攒", "目标", "改成",
+                  "删", "吗", "?", "？", "多少", "怎么", "为什么", "收入", "工资", "生活费", "退款", "退了", "赚",
+                  "收到", "借", "还钱", "如果", "假如", "不是", "记错")
+# 否定或明确要求不记账（"我不想花 50 元看电影"、"别记 午饭 25"）
+NEGATION_WORDS = ("不想", "不买", "不花", "没买", "没花", "没有买", "没有花", "不用", "不该", "不会", "别买", "别花",
+                  "别记", "不要记", "不用记", "不记", "先别", "撤销")
+# 收入、出售、报销等资金流入（"卖了耳机 300 元"）
+INCOME_WORDS = ("卖了", "卖掉", "卖出", "出售", "转卖", "报销", "红包", "返现", "奖学金", "兼职")
+# 不是当天发生的消费：未来的打算（"明天要交房租 1500"）或过去的日期（"昨天午饭 25 元"），入账时间需要由模型确认
+OTHER_DAY_WORDS = ("明天", "后天", "下周", "下星期", "下个月", "下月", "明年", "以后", "待会", "等会", "晚点",
+                   "要交", "要买", "要花", "会花", "将要", "昨天", "昨晚", "前天", "上周", "上星期", "上个月", "上月",
+                   "去年", "那天", "周末")
+# 具体日期或星期几（"10月1日"、"3号"、"10/1"、"周三"）
+_DATE_PATTERN = re.compile(r"\d+\s*[月号日]|\d{1,2}[/-]\d{1,2}|[周礼拜][一二三四五六日天]|星期")
+# 明确的记账用语
+LOGGING_CUES = ("花了", "花费", "用了", "付了", "买了", "记一下", "记一笔", "记账", "帮我记", "消费", "交了", "充了")
+# 从描述中去掉的填充词（按顺序替换，长词在前）
+FILLER_WORDS = ("帮我记一下", "帮我记", "记一下", "记一笔", "记账", "花了", "花费", "用了", "付了", "一共", "总共",
+                "大概", "左右", "今天", "刚刚", "刚才", "刚")
+LEADING_VERBS = ("买了", "吃了", "喝了", "交了", "充了", "买", "吃", "喝")
+CURRENCY_UNITS = "块钱|元钱|块|元|rmb|RMB|人民币"
+# 数字后跟这些量词时是数量、日期或时间，不是金额
+QUANTITY_UNITS = "个本杯件双份张瓶盒袋顿次斤两点号日月年天周岁人位"
+
+MAX_DESCRIPTION_LENGTH = 20
+MAX_MESSAGE_LENGTH = 40
+MAX_AMOUNT = 100000
+
+_AMOUNT_PATTERN = re.compile(
+    rf"(?P<prefix>[¥￥])?\s*(?P<number>\d+(?:\.\d{{1,2}})?)\s*(?P<unit>{CURRENCY_UNITS})?(?P<quantity>[{QUANTITY_UNITS}])?")
+_CN_AMOUNT_PATTERN = re.compile(rf"(?P<number>[零一二两三四五六七八九十百千万]+)\s*(?P<unit>{CURRENCY_UNITS})")
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_CN_UNITS = {"十": 10, "百": 100, "千": 1000, "万": 10000}
+_MEASURE_PREFIX = re.compile(rf"^[一两\d]*[{QUANTITY_UNITS}]")
+_PUNCTUATION = re.compile(r"[\s,，。.!！、~～:：;；\"“”'‘’()（）]+")
+
+
+class ParsedExpense(NamedTuple):
+    description: str
+    amount: float
+    category: str
+    context: str
+    confident: bool
+    # 没有把握时的原因（有把握时为空）
+    reason: str
+
+
+def chinese_number(text: str) -> Optional[int]:
+    """把“二十五”“一百零八”“两千”这类中文数字转为整数"""
+    total, section, digit = 0, 0, None
+    for ch in text:
+        if ch in _CN_DIGITS:
+            digit = _CN_DIGITS[ch]
+        elif ch in _CN_UNITS:
+            unit = _CN_UNITS[ch]
+            if unit == 10000:
+                total = (total + section + (digit or 0)) * unit
+                section = 0
+            else:
+                section += (1 if digit is None else digit) * unit
+            digit = None
+        else:
+            return None
+    return total + section + (digit or 0)
+
+
+def find_amounts(text: str) -> Tuple[List[Tuple[float, Tuple[int, int]]], List[Tuple[float, Tuple[int, int]]]]:
+    """返回 (带货币单位的金额, 不带单位的数字)，各为 [(数值, 文本区间)]；量词前的数字不计入"""
+    marked, bare = [], []
+    for match in _AMOUNT_PATTERN.finditer(text):
+        if match.group("quantity") and not match.group("unit"):
+            continue
+        value = float(match.group("number"))
+        target = marked if match.group("prefix") or match.group("unit") else bare
+        target.append((value, match.span()))
+    for match in _CN_AMOUNT_PATTERN.finditer(text):
+        value = chinese_number(match.group("number"))
+        if value:
+            marked.append((float(value), match.span()))
+    return marked, bare
+
+
+def match_category(text: str) -> str:
+    for category, words in CATEGORY_KEYWORDS.items():
+        if any(word in text for word in words):
+            return category
+    return ""
+
+
+def match_context(text: str) -> str:
+    return "、".join(dict.fromkeys(label for cue, label in CONTEXT_CUES.items() if cue in text))
+
+
+def _description(text: str, span: Tuple[int, int]) -> str:
+    text = text[:span[0]] + " " + text[span[1]:]
+    for word in FILLER_WORDS + tuple(CONTEXT_CUES):
+        text = text.replace(word, " ")
+    parts = [p for p in _PUNCTUATION.split(text) if p]
+    description = "".join(parts)
+    for verb in LEADING_VERBS:
+        if description.startswith(verb):
+            description = description[len(verb):]
+            break
+    return _MEASURE_PREFIX.sub("", description) or description
+
+
+def parse(text: str) -> Optional[ParsedExpense]:
+    """解析记账消息；找不到金额时返回 None"""
+    text = (text or "").strip()
+    marked, bare = find_amounts(text)
+    amounts = marked or bare
+    if not amounts:
+        return None
+    amount, span = amounts[0]
+    description = _description(text, span)
+    category = match_category(text)
+    context = match_context(text)
+
+    reason = ""
+    if len(text) > MAX_MESSAGE_LENGTH:
+        reason = "消息过长"
+    elif len(marked) > 1 or (not marked and len(bare) > 1):
+        reason = "包含多个金额"
+    elif any(word in text for word in NEGATION_WORDS):
+        reason = "包含否定或不记账用语"
+    elif any(word in text for word in INCOME_WORDS):
+        reason = "收入或出售，不是支出"
+    elif any(word in text for word in OTHER_DAY_WORDS) or _DATE_PATTERN.search(text):
+        reason = "不是当天的消费"
+    elif any(word in text for word in BLOCKING_WORDS):
+        reason = "包含咨询或计划类用词"
+    elif not description or len(description) > MAX_DESCRIPTION_LENGTH:
+        reason = "缺少明确的消费描述"
+    elif not 0 < amount < MAX_AMOUNT:
+        reason = "金额不合理"
+    elif not category and not any(cue in text for cue in LOGGING_CUES):
+        reason = "无法确认是记账消息"
+    return ParsedExpense(description, amount, category, context, not reason, reason)
@@ -1,13 +1,61 @@
-from model import llm_chat, llm_plan
-from state import PocketWiseState, Intent, ToolCallRecord
-from tools import *
-from prompts import get_intent_prompt, get_chatbot_prompt, get_plan_prompt, get_summarize_character_prompt, get_guidance_map
-from langgraph.graph import StateGraph, START, END
-from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, BaseMessage
-from langchain.agents import create_agent
-from typing import List, Dict, Any
+"""PocketWise 对话图：意图识别、工具调用、计划 agent、记账快速通道和模板回复等节点的实现与组装。"""
+import json
 from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
 import database as db
+import expense_parser
+import impulse_rules
+import plan_progress
+from env_utils import (
+    FAST_EXPENSE_PATH,
+    GRAPH_MODE,
+    MEMORY_TOKEN_BUDGET,
+    MEMORY_TOP_K,
+    RESPONSE_TEMPLATE_INTENTS,
+)
+from jinja2 import Template
+from langchain.agents import create_agent
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableConfig
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langgraph.graph import END, START, StateGraph
+from llm_scheduler import LLMOverloaded
+from model import llm_background, llm_chat, llm_intent, llm_plan
+from prompts import (
+    get_chatbot_prompt,
+    get_fused_guidance,
+    get_guidance_map,
+    get_intent_prompt,
+    get_intent_tool_map,
+    get_plan_prompt,
+    get_response_templates,
+    get_summarize_character_prompt,
+)
+from pydantic import BaseModel, Field
+from state import Intent, PocketWiseState, ToolCallRecord
+from tool_results import estimate_tokens, serialize_full_result, shape_tool_result
+from tools import (
+    analyze_spending,
+    calculate_saving_plan,
+    delete_plan,
+    detect_impulse_buying,
+    edit_user_profile,
+    log_notable_expense,
+    log_plan,
+    update_plan,
+    view_plan,
+    view_recent_expenses,
+    view_user_profile,
+)
 
 
 class GraphConstants:
@@ -20,14 +68,32 @@ class GraphConstants:
     NODE_LOAD_CONTEXT = "load_context"
     NODE_RECOGNIZE_INTENT = "recognize_intent"
     NODE_TRUNCATE_HISTORY = "truncate_message_history"
+    NODE_RETRIEVE_MEMORY = "retrieve_memory"
     NODE_CHATBOT = "chatbot"
     NODE_SUMMARIZE_CHARACTER = "summarize_character"
     NODE_EXECUTE_PLAN = "execute_plan"
     NODE_TOOLS = "tools"
+    NODE_FUSED_CHATBOT = "fused_chatbot"
+    NODE_FAST_EXPENSE = "fast_log_expense"
+    NODE_RENDER_RESPONSE = "render_response"
+
+    # 图模式
+    MODE_TWO_CALL = "two_call"
+    MODE_FUSED = "fused"
+    PLAN_INTENTS = ("generate_plan", "update_plan", "delete_plan")
+    # LLM 调用被调度器丢弃（排队超时或队列已满）时的回复
+    BUSY_REPLY = "现在请求的人有点多，我暂时没法回答，请稍后再试一次。"
+
+
+def busy_reply() -> Dict[str, Any]:
+    """LLM 调用被限流丢弃时结束本轮的回复"""
+    return {"messages": [AIMessage(content=GraphConstants.BUSY_REPLY)]}
+
 
 class ContextManager:
     """上下文管理器"""
     def __init__(self, db_module):
+        """db_module 为数据库模块，归档与检索对话记忆都经过它"""
         self.db = db_module
 
     @staticmethod
@@ -38,20 +104,79 @@ class ContextManager:
         return {"user_profile": profile}
 
     @staticmethod
-    def truncate_message_history(state: PocketWiseState, max_messages: int = GraphConstants.MAX_MESSAGES) -> Dict[str, Any]:
-        """控制对话上下文"""
+    def _window_start(messages: List[BaseMessage], max_messages: int) -> int:
+        """保留窗口的起点：最近 max_messages 条中的第一条用户消息，避免窗口以孤立的工具结果开头"""
+        start = len(messages) - max_messages
+        for i in range(start, len(messages)):
+            if isinstance(messages[i], HumanMessage):
+                return i
+        # 窗口内没有用户消息（一轮中工具调用过多）时，从最后一条用户消息开始保留
+        for i in range(start - 1, -1, -1):
+            if isinstance(messages[i], HumanMessage):
+                return i
+        return 0
+
+    @staticmethod
+    def _turns_to_archive(messages: List[BaseMessage]) -> List[tuple]:
+        r"""把消息按轮次合并为 [(用户消息 id, '用户：…\n助手：…')]，工具调用和工具结果不归档"""
+        turns = []
+        for msg in messages:
+            text = str(msg.content or "").strip() if isinstance(msg.content, str) else ""
+            if isinstance(msg, HumanMessage):
+                turns.append([msg.id, [f"用户：{text}"]])
+            elif isinstance(msg, AIMessage) and text and turns:
+                turns[-1][1].append(f"助手：{text}")
+        return [(message_id, "\n".join(lines)) for message_id, lines in turns]
+
+    @staticmethod
+    def truncate_message_history(state: PocketWiseState, config: RunnableConfig,
+                                 max_messages: int = GraphConstants.MAX_MESSAGES) -> Dict[str, Any]:
+        """控制对话上下文：滑出窗口的轮次归档到数据库（供 retrieve_memory 检索）后从 state 中删除"""
         messages: List[BaseMessage] = state["messages"]
         # 无需截断
         if len(messages) <= max_messages:
             return {}
-            # return {"messages": messages}
-        truncated = messages[-max_messages:]
-        return {"messages": truncated}
+        start = ContextManager._window_start(messages, max_messages)
+        if start == 0:
+            return {}
+        dropped = messages[:start]
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        try:
+            db.archive_conversation_turns(state["user_id"], thread_id, ContextManager._turns_to_archive(dropped))
+        except Exception:
+            # 归档失败不阻断对话，只是这些轮次无法再被检索到
+            pass
+        # add_messages 按 id 合并，只有 RemoveMessage 才会真正从 checkpoint 中删除消息
+        return {"messages": [RemoveMessage(id=msg.id) for msg in dropped]}
+
+    @staticmethod
+    def retrieve_memory(state: PocketWiseState) -> Dict[str, Any]:
+        """按用户最新一句话检索已归档的历史轮次，在 token 上限内注入最相关的几条"""
+        text = IntentRecognizer._last_human_text(state["messages"])
+        try:
+            memories = db.search_conversation_memory(state["user_id"], text, MEMORY_TOP_K) if text else []
+        except Exception:
+            memories = []
+        snippets, used = [], 0
+        for memory in memories:
+            date = datetime.fromtimestamp(memory["ts"]).strftime("%Y-%m-%d")
+            snippet = f"[{date}] {memory['content']}"
+            cost = estimate_tokens(snippet)
+            if used + cost > MEMORY_TOKEN_BUDGET:
+                if snippets:
+                    break
+                # 最相关的一条单独超出上限时按比例截断
+                snippet = snippet[:max(1, len(snippet) * MEMORY_TOKEN_BUDGET // cost)] + "…"
+                cost = MEMORY_TOKEN_BUDGET
+            snippets.append(snippet)
+            used += cost
+        return {"recalled_memory": "\n".join(snippets)}
 
 class IntentRecognizer:
     """意图识别器"""
 
     def __init__(self, llm_model):
+        """llm_model 为意图识别使用的模型"""
         self.llm = llm_model
 
     @staticmethod
@@ -88,28 +213,51 @@ class IntentRecognizer:
 class ChatbotService:
     """聊天机器人服务"""
 
-    def __init__(self, llm_model, available_tools: List):
+    def __init__(self, llm_model, available_tools: List, intent_tool_map: Dict[str, List[str]] = None,
+                 background_llm=None):
+        """intent_tool_map 默认取 prompts 中的配置；background_llm 用于性格总结，默认与对话共用模型"""
         self.llm = llm_model
         self.available_tools = available_tools
+        # 工具 JSON schema 只在构建时转换一次，之后各意图复用预先绑定好的 LLM
+        self.tool_schemas = {t.name: convert_to_openai_tool(t) for t in available_tools}
+        self._llm_all_tools = self.llm.bind_tools(list(self.tool_schemas.values()))
+        self._intent_llms = self._bind_intent_tools(intent_tool_map or get_intent_tool_map())
+        # 性格总结是后台任务，使用低优先级的模型，限额紧张时会被推迟或丢弃
+        self._summarize_llm = (background_llm or self.llm).bind_tools([convert_to_openai_tool(edit_user_profile),
+                                                   convert_to_openai_tool(view_recent_expenses)])
+
+    def _bind_intent_tools(self, intent_tool_map: Dict[str, List[str]]) -> Dict[str, Any]:
+        """为每个意图预先绑定其工具子集，工具组合相同的意图共用同一个绑定"""
+        bound_by_names: Dict[tuple, Any] = {}
+        intent_llms = {}
+        for intent, names in intent_tool_map.items():
+            key = tuple(n for n in names if n in self.tool_schemas)
+            if not key:
+                continue
+            if key not in bound_by_names:
+                bound_by_names[key] = self.llm.bind_tools([self.tool_schemas[n] for n in key])
+            intent_llms[intent] = bound_by_names[key]
+        return intent_llms
 
     def _get_extra_guidance(self, intent: str) -> str:
         """根据意图获取额外指导"""
         intent_guidance_map = get_guidance_map()
         return intent_guidance_map.get(intent, intent_guidance_map[GraphConstants.DEFAULT_INTENT])
 
-    def _prepare_system_message(self, user_id: str, profile: Dict[str, Any], extra_guidance: str) -> str:
+    def _prepare_system_message(self, user_id: str, profile: Dict[str, Any], extra_guidance: str,
+                                recalled_memory: str = "") -> str:
         """准备系统消息"""
-        return get_chatbot_prompt(user_id, profile, extra_guidance)
+        return get_chatbot_prompt(user_id, profile, extra_guidance, recalled_memory)
 
-    def _bind_tools(self):
-        """绑定工具到LLM"""
-        return self.llm.bind_tools(self.available_tools)
+    def _bind_tools(self, intent: str = None):
+        """取出该意图预先绑定好工具的 LLM，未配置的意图绑定全部工具"""
+        return self._intent_llms.get(intent, self._llm_all_tools)
 
     def summarize_character(self, state: PocketWiseState) -> Dict[str, Any]:
         """总结用户性格"""
         user_id = state["user_id"]
         hum_texts = []
-        llm_with_tools = self.llm.bind_tools([edit_user_profile, view_recent_expenses])
+        llm_with_tools = self._summarize_llm
         for msg in state["messages"]:
             if isinstance(msg, HumanMessage):
                 hum_texts.append(str(msg.content or ""))
@@ -150,15 +298,244 @@ class ChatbotService:
         last_intent = state.get("last_intent", GraphConstants.DEFAULT_INTENT)
 
         extra_guidance = self._get_extra_guidance(last_intent)
-        sys_msg = self._prepare_system_message(user_id, profile, extra_guidance)
+        sys_msg = self._prepare_system_message(user_id, profile, extra_guidance, state.get("recalled_memory", ""))
 
-        llm_with_tools = self._bind_tools()
+        llm_with_tools = self._bind_tools(last_intent)
         messages = [SystemMessage(content=sys_msg)] + state["messages"]
 
-        response = llm_with_tools.invoke(messages)
+        try:
+            response = llm_with_tools.invoke(messages)
+        except LLMOverloaded:
+            return busy_reply()
         return {"messages": [response]}
     
 
+class route_turn(BaseModel):
+    """给出用户最新一句话的意图；可以直接回答时把回复写在 reply 中"""
+    intent: Intent = Field(description="用户最新一句话的意图")
+    reply: Optional[str] = Field(default=None, description="直接回复用户的内容，需要调用工具或制定计划时留空")
+
+
+class FusedChatbotService(ChatbotService):
+    """单次调用模式：一次 LLM 调用同时完成意图识别和回复（或工具调用）"""
+
+    # 模型只调用了业务工具、没有给出 route_turn 时，按工具推断意图
+    TOOL_INTENTS = {
+        "log_notable_expense": "log_expense",
+        "view_recent_expenses": "view_recent_expenses",
+        "edit_user_profile": "edit_profile",
+        "view_user_profile": "review_profile",
+        "analyze_spending": "review_profile",
+        "detect_impulse_buying": "consult",
+        "view_plan": "review_plan",
+    }
+
+    def __init__(self, llm_model, available_tools: List, intent_tool_map: Dict[str, List[str]] = None,
+                 background_llm=None):
+        """参数同 ChatbotService，另外绑定 route_turn 与全部业务工具"""
+        super().__init__(llm_model, available_tools, intent_tool_map, background_llm)
+        # 意图在调用之前未知，绑定 route_turn 与全部业务工具，要求每轮至少调用一个工具
+        self._fused_llm = self.llm.bind_tools([convert_to_openai_tool(route_turn)] + list(self.tool_schemas.values()),
+                                              tool_choice="required")
+
+    def _bind_tools(self, intent: str = None):
+        return self._fused_llm
+
+    def decide(self, state: PocketWiseState) -> AIMessage:
+        """调用 LLM，返回包含 route_turn 与业务工具调用的原始响应"""
+        user_id = state["user_id"]
+        profile = state.get("user_profile", {})
+        sys_msg = self._prepare_system_message(user_id, profile, get_fused_guidance(), state.get("recalled_memory", ""))
+        messages = [SystemMessage(content=sys_msg)] + state["messages"]
+        return self._bind_tools().invoke(messages)
+
+    def split_response(self, response: AIMessage) -> Dict[str, Any]:
+        """从响应中拆出意图，并去掉 route_turn 调用，只保留要执行的业务工具调用"""
+        intent, reply = None, None
+        tool_calls = []
+        for call in response.tool_calls or []:
+            if call["name"] == route_turn.__name__:
+                intent = call["args"].get("intent")
+                reply = call["args"].get("reply")
+            else:
+                tool_calls.append(call)
+        if intent is None and tool_calls:
+            intent = self.TOOL_INTENTS.get(tool_calls[0]["name"])
+        if intent not in Intent.__args__:
+            intent = GraphConstants.DEFAULT_INTENT
+        content = reply or response.content or ""
+        return {"intent": intent, "message": AIMessage(content=content, tool_calls=tool_calls, id=response.id)}
+
+    def generate_response(self, state: PocketWiseState) -> Dict[str, Any]:
+        """生成响应；计划类意图或未给出回复时只写入意图，由后续节点处理"""
+        try:
+            decision = self.split_response(self.decide(state))
+        except LLMOverloaded:
+            return {"last_intent": GraphConstants.DEFAULT_INTENT, **busy_reply()}
+        message = decision["message"]
+        if decision["intent"] in GraphConstants.PLAN_INTENTS or not (message.content or message.tool_calls):
+            return {"last_intent": decision["intent"]}
+        return {"last_intent": decision["intent"], "messages": [decision["message"]]}
+
+
+class FastExpenseLogger:
+    """记账快速通道：本地解析有把握且未触发冲动消费规则时直接入账并按模板回复，整轮不调用 LLM"""
+
+    def __init__(self, mode: str = None):
+        """按 mode（on / shadow / off，含义见 FAST_EXPENSE_PATH，默认取该配置）决定是否直接入账"""
+        self.mode = mode or FAST_EXPENSE_PATH
+
+    @staticmethod
+    def _assess(user_id: str, profile: Dict[str, Any], parsed: expense_parser.ParsedExpense):
+        """与 detect_impulse_buying 相同的规则打分（只读本地数据），返回 (评估结果, 本月已花费)"""
+        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        month_spent = db.sum_expenses_between(user_id, month_start)
+        stats = db.get_spending_stats(user_id, parsed.category or None)
+        features = impulse_rules.compute_features(parsed.amount, profile.get("monthly_budget", 0) or 0, 0,
+                                                  profile.get("personality_tags", []), month_spent,
+                                                  stats["overall"], stats["category"])
+        assessment = impulse_rules.engine.assess(features, parsed.description,
+                                                 profile.get("trigger_keywords", []), parsed.category)
+        return assessment, month_spent
+
+    @staticmethod
+    def _reply(parsed: expense_parser.ParsedExpense, budget: float, month_spent: float) -> str:
+        category = f"（{parsed.category}）" if parsed.category else ""
+        reply = f"已记录：{parsed.description} {parsed.amount:.2f} 元{category}。本月已支出 {month_spent:.2f} 元"
+        if budget:
+            reply += f"，预算还剩 {budget - month_spent:.2f} 元"
+        return reply + "。"
+
+    def try_log_expense(self, state: PocketWiseState) -> Dict[str, Any]:
+        """能直接入账时写入回复（路由到 END），否则只记录解析结果，交给完整流程"""
+        last_message = state["messages"][-1]
+        if self.mode == "off" or not isinstance(last_message, HumanMessage):
+            return {"expense_parse_id": None}
+        text = str(last_message.content or "").strip()
+        parsed = expense_parser.parse(text)
+        if parsed is None:
+            return {"expense_parse_id": None}
+
+        user_id = state["user_id"]
+        profile = state.get("user_profile", {}) or {}
+        parse_id = uuid4().hex
+        outcome, reason, month_spent = "fast_path", "", 0.0
+        if not parsed.confident:
+            outcome, reason = "fallback", parsed.reason
+        elif self.mode == "shadow":
+            outcome = "shadow"
+        else:
+            assessment, month_spent = self._assess(user_id, profile, parsed)
+            if assessment["is_impulse"] or assessment["is_suspicious"]:
+                # 疑似冲动消费交给模型结合计划和历史给出提醒
+                outcome, reason = "fallback", "; ".join(assessment["reasons"])
+        db.log_expense_parse(user_id, parse_id, text, parsed, outcome, reason)
+        if outcome != "fast_path":
+            return {"expense_parse_id": parse_id}
+
+        db.add_expense(user_id, parsed.description, parsed.amount, parsed.category, parsed.context)
+        args = {"description": parsed.description, "amount": parsed.amount,
+                "category": parsed.category, "context": parsed.context}
+        call_record: ToolCallRecord = {
+            "name": "log_notable_expense",
+            "arguments": args,
+            "result": f"已记录支出：{parsed.description}，花费 {parsed.amount}。",
+            "timestamp": datetime.now().timestamp(),
+        }
+        try:
+            db.add_tool_call(user_id, call_record["name"], args, call_record["result"], call_record["timestamp"])
+        except Exception:
+            pass
+        reply = self._reply(parsed, profile.get("monthly_budget", 0) or 0, month_spent + parsed.amount)
+        return {
+            "messages": [AIMessage(content=reply)],
+            "last_intent": "log_expense",
+            "expense_parse_id": None,
+            "tool_call_history": [call_record],
+        }
+
+
+class ResponseRenderer:
+    """只读意图的模板回复：工具结果形状已知时直接渲染回复并结束本轮，省去第二次 chatbot 调用"""
+
+    def __init__(self, templates: Dict[str, Dict[str, Any]] = None, intents: List[str] = None):
+        """只编译 intents（默认 RESPONSE_TEMPLATE_INTENTS）中的模板，templates 默认取 prompts 中的配置"""
+        templates = get_response_templates() if templates is None else templates
+        intents = RESPONSE_TEMPLATE_INTENTS if intents is None else intents
+        # 模板只在构建图时编译一次
+        self.templates = {
+            intent: {**config, "compiled": Template(config["template"], trim_blocks=True, lstrip_blocks=True)}
+            for intent, config in templates.items() if intent in intents
+        }
+
+    @staticmethod
+    def _context(tool_name: str, result: Any, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """把工具结果转换为模板变量，形状不符合预期时返回 None"""
+        if tool_name == "view_plan" and isinstance(result, list) and all(isinstance(p, dict) for p in result):
+            return {"plans": [dict(p, kind=plan_progress.plan_kind(p.get("plan_type")),
+                                   status_label=plan_progress.STATUS_LABELS.get(p.get("progress_status")))
+                              for p in result]}
+        if tool_name == "view_recent_expenses" and isinstance(result, dict) and isinstance(result.get("expenses"), list):
+            expenses = result["expenses"]
+            return {
+                "expenses": expenses,
+                "first_page": not args.get("cursor"),
+                "has_more": bool(result.get("next_cursor")),
+                "total": sum(e.get("amount") or 0 for e in expenses),
+            }
+        return None
+
+    def _render_input(self, state: PocketWiseState):
+        """本轮可以用模板回复时返回 (模板配置, 工具结果, 工具参数)，否则返回 None"""
+        config = self.templates.get(state.get("last_intent"))
+        messages = state["messages"]
+        if config is None or len(messages) < 2 or not isinstance(messages[-1], ToolMessage):
+            return None
+        call_message = messages[-2]
+        if not isinstance(call_message, AIMessage) or len(call_message.tool_calls or []) != 1:
+            return None
+        call = call_message.tool_calls[0]
+        history = state.get("tool_call_history") or []
+        if call["name"] != config["tool"] or not history or history[-1]["name"] != call["name"]:
+            return None
+        # 用户在要求分析或建议，交给 LLM 自由回复
+        text = IntentRecognizer._last_human_text(messages)
+        if any(word in text for word in config.get("llm_followup_words", [])):
+            return None
+        try:
+            result = json.loads(history[-1]["result"])
+        except (TypeError, ValueError):
+            # 工具出错时结果是一段文字
+            return None
+        return config, result, call
+
+    def _render(self, state: PocketWiseState) -> Optional[str]:
+        """本轮可以用模板回复时返回渲染好的回复，否则返回 None"""
+        found = self._render_input(state)
+        if found is None:
+            return None
+        config, result, call = found
+        try:
+            context = self._context(call["name"], result, call["args"])
+            if context is None:
+                return None
+            rendered = config["compiled"].render(**context)
+        except Exception:
+            # 字段类型不符合模板的预期（如金额不是数字）时交给 LLM 回复
+            return None
+        return "\n".join(line.strip() for line in rendered.splitlines() if line.strip())
+
+    def route_after_tools(self, state: PocketWiseState) -> str:
+        """工具执行后：能用模板回复时渲染回复，否则回到 chatbot"""
+        if self._render(state) is not None:
+            return GraphConstants.NODE_RENDER_RESPONSE
+        return GraphConstants.NODE_CHATBOT
+
+    def render_response(self, state: PocketWiseState) -> Dict[str, Any]:
+        """用最近一次工具结果渲染模板，作为本轮的回复"""
+        return {"messages": [AIMessage(content=self._render(state))]}
+
+
 class FlowController:
     """流程控制器"""
 
@@ -175,13 +552,20 @@ class PlanExecutor:
     """计划执行器"""
 
     def __init__(self, plan_agent):
+        """plan_agent 为 create_agent 构建的计划 agent"""
         self.plan_agent = plan_agent
 
 
-    def execute_plan(self, state: PocketWiseState) -> Dict[str, Any]:
+    def execute_plan(self, state: PocketWiseState, config: RunnableConfig) -> Dict[str, Any]:
         """执行计划生成"""
-        config = {"configurable": {"thread_id": GraphConstants.PLAN_AGENT_THREAD_ID}}
-        response = self.plan_agent.invoke({"messages": state["messages"]}, config=config)
+        # 每个会话使用自己的计划 agent 线程，避免所有用户的计划对话堆在同一个线程里
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        plan_thread = f"{thread_id}:{GraphConstants.PLAN_AGENT_THREAD_ID}" if thread_id else GraphConstants.PLAN_AGENT_THREAD_ID
+        config = {"configurable": {"thread_id": plan_thread}}
+        try:
+            response = self.plan_agent.invoke({"messages": state["messages"]}, config=config)
+        except LLMOverloaded:
+            return busy_reply()
         return {"messages": [response["messages"][-1].content]}
 
 
@@ -189,6 +573,7 @@ class ToolExecutor:
     """工具执行器"""
 
     def __init__(self, tool_registry: Dict[str, Any]):
+        """tool_registry 为工具名到工具对象的映射"""
         self.tool_registry = tool_registry
 
     def execute_tool(self, state: PocketWiseState) -> Dict[str, Any]:
@@ -205,6 +590,12 @@ class ToolExecutor:
         tool_call_id = tool_call["id"]
 
         full_args = {"user_id": user_id, **tool_args}
+        if tool_name == "log_notable_expense" and state.get("expense_parse_id"):
+            # 本地解析没有直接入账的消息，补记模型给出的结果用于评估解析准确率
+            try:
+                db.record_llm_expense(user_id, state["expense_parse_id"], tool_args.get("amount"), tool_args.get("category"))
+            except Exception:
+                pass
 
         if tool_name not in self.tool_registry:
             result = "未知工具"
@@ -214,16 +605,24 @@ class ToolExecutor:
             except Exception as e:
                 result = f"工具执行出错: {str(e)}"
 
-        # 记录工具调用
+        # 记录工具调用（完整结果只保留在 tool_call_history 中）
         call_record: ToolCallRecord = {
             "name": tool_name,
             "arguments": tool_args,
-            "result": str(result),
+            "result": serialize_full_result(result),
             "timestamp": datetime.now().timestamp()  # 添加时间戳
         }
 
+        # 完整历史写入 tool_calls 表，state 中只保留最近若干条
+        try:
+            db.add_tool_call(user_id, tool_name, tool_args, call_record["result"], call_record["timestamp"])
+        except Exception:
+            # 落盘失败不应阻断流程
+            pass
+
         new_state_update = {
-            "messages": [ToolMessage(content=str(result), tool_call_id=tool_call_id)],
+            # 写入对话的是按工具裁剪、限制 token 数的紧凑结果
+            "messages": [ToolMessage(content=shape_tool_result(tool_name, result), tool_call_id=tool_call_id)],
             "tool_call_history": [call_record]  # 追加新的记录
         }
 
@@ -242,26 +641,55 @@ class Router:
         
         return GraphConstants.NODE_CHATBOT
 
-def build_graph(checkpointer):
-    """构建对话图"""
+    @staticmethod
+    def route_fast_path(state: PocketWiseState) -> str:
+        """记账快速通道已经给出回复时结束本轮"""
+        if isinstance(state["messages"][-1], AIMessage):
+            return END
+        return GraphConstants.NODE_SUMMARIZE_CHARACTER
+
+    @staticmethod
+    def route_after_plan(state: PocketWiseState) -> str:
+        """计划 agent 被限流时已经给出回复，直接结束本轮"""
+        if isinstance(state["messages"][-1], AIMessage):
+            return END
+        return GraphConstants.NODE_CHATBOT
+
+    @staticmethod
+    def route_fused(state: PocketWiseState) -> str:
+        """单次调用模式：根据同一次调用给出的意图和工具调用路由"""
+        if state["last_intent"] in GraphConstants.PLAN_INTENTS:
+            return GraphConstants.NODE_EXECUTE_PLAN
+        if not isinstance(state["messages"][-1], AIMessage):
+            # 模型只给出了意图，由 chatbot 按意图指导补充回复
+            return GraphConstants.NODE_CHATBOT
+        return FlowController.should_continue(state)
+
+def build_graph(checkpointer, mode: str = None):
+    """构建对话图
+
+    mode 为 two_call 时先单独识别意图再生成回复；为 fused 时一次调用同时完成两者，默认取 GRAPH_MODE。
+    """
+    mode = mode or GRAPH_MODE
 
     # 创建实例
     context_manager = ContextManager(db)
-    intent_recognizer = IntentRecognizer(llm_chat)
+    intent_recognizer = IntentRecognizer(llm_intent)
 
     available_tools = [
         view_user_profile,
         edit_user_profile,
         log_notable_expense,
         view_recent_expenses,
+        analyze_spending,
         detect_impulse_buying,
         view_plan
     ]
-    chatbot_service = ChatbotService(llm_chat, available_tools)
+    chatbot_service = ChatbotService(llm_chat, available_tools, background_llm=llm_background)
 
     # 创建计划生成agent
     plan_agent_prompt = get_plan_prompt()
-    plan_agent = create_agent(llm_plan, system_prompt=plan_agent_prompt, tools=[view_user_profile, log_plan, view_plan, update_plan, delete_plan], checkpointer=checkpointer)
+    plan_agent = create_agent(llm_plan, system_prompt=plan_agent_prompt, tools=[view_user_profile, calculate_saving_plan, log_plan, view_plan, update_plan, delete_plan], checkpointer=checkpointer)
     plan_executor = PlanExecutor(plan_agent)
 
     # 工具注册表
@@ -270,16 +698,18 @@ def build_graph(checkpointer):
         "edit_user_profile": edit_user_profile,
         "log_notable_expense": log_notable_expense,
         "view_recent_expenses": view_recent_expenses,
+        "analyze_spending": analyze_spending,
         "detect_impulse_buying": detect_impulse_buying,
         "view_plan": view_plan
     }
     tool_executor = ToolExecutor(tool_registry)
+    response_renderer = ResponseRenderer()
 
     graph_builder = StateGraph(PocketWiseState)
     graph_builder.add_node(GraphConstants.NODE_LOAD_CONTEXT, context_manager.load_user_context)
-    graph_builder.add_node(GraphConstants.NODE_RECOGNIZE_INTENT, intent_recognizer.recognize_intent)
-    graph_builder.add_node(GraphConstants.NODE_TRUNCATE_HISTORY,
-                          lambda s: context_manager.truncate_message_history(s, GraphConstants.MAX_MESSAGES))
+    graph_builder.add_node(GraphConstants.NODE_FAST_EXPENSE, FastExpenseLogger().try_log_expense)
+    graph_builder.add_node(GraphConstants.NODE_TRUNCATE_HISTORY, context_manager.truncate_message_history)
+    graph_builder.add_node(GraphConstants.NODE_RETRIEVE_MEMORY, context_manager.retrieve_memory)
     graph_builder.add_node(GraphConstants.NODE_SUMMARIZE_CHARACTER, chatbot_service.summarize_character)
     graph_builder.add_node(GraphConstants.NODE_CHATBOT, chatbot_service.generate_response)
     graph_builder.add_node(GraphConstants.NODE_EXECUTE_PLAN, plan_executor.execute_plan)
@@ -287,19 +717,40 @@ def build_graph(checkpointer):
 
     # 编排
     graph_builder.add_edge(START, GraphConstants.NODE_LOAD_CONTEXT)
-    graph_builder.add_edge(GraphConstants.NODE_LOAD_CONTEXT, GraphConstants.NODE_SUMMARIZE_CHARACTER)
-    graph_builder.add_edge(GraphConstants.NODE_SUMMARIZE_CHARACTER, GraphConstants.NODE_RECOGNIZE_INTENT)
-    graph_builder.add_edge(GraphConstants.NODE_RECOGNIZE_INTENT, GraphConstants.NODE_TRUNCATE_HISTORY)
-    graph_builder.add_conditional_edges(GraphConstants.NODE_TRUNCATE_HISTORY,
-                                        Router.route_by_intent,
-                                        {
-                                            GraphConstants.NODE_EXECUTE_PLAN: GraphConstants.NODE_EXECUTE_PLAN,
-                                            GraphConstants.NODE_CHATBOT: GraphConstants.NODE_CHATBOT
-                                        }
-                                        )
-    graph_builder.add_edge(GraphConstants.NODE_EXECUTE_PLAN, GraphConstants.NODE_CHATBOT)
+    # 明确的记账消息在本地解析后直接入账，不进入后续的 LLM 节点
+    graph_builder.add_edge(GraphConstants.NODE_LOAD_CONTEXT, GraphConstants.NODE_FAST_EXPENSE)
+    graph_builder.add_conditional_edges(GraphConstants.NODE_FAST_EXPENSE, Router.route_fast_path,
+                                        [GraphConstants.NODE_SUMMARIZE_CHARACTER, END])
+    # 截断历史后检索已归档的相关轮次，再交给后续节点
+    graph_builder.add_edge(GraphConstants.NODE_TRUNCATE_HISTORY, GraphConstants.NODE_RETRIEVE_MEMORY)
+    if mode == GraphConstants.MODE_FUSED:
+        # 截断历史后一次调用完成意图识别与回复，工具执行后的后续回复仍由 chatbot 按意图生成
+        fused_service = FusedChatbotService(llm_chat, available_tools, background_llm=llm_background)
+        graph_builder.add_node(GraphConstants.NODE_FUSED_CHATBOT, fused_service.generate_response)
+        graph_builder.add_edge(GraphConstants.NODE_SUMMARIZE_CHARACTER, GraphConstants.NODE_TRUNCATE_HISTORY)
+        graph_builder.add_edge(GraphConstants.NODE_RETRIEVE_MEMORY, GraphConstants.NODE_FUSED_CHATBOT)
+        graph_builder.add_conditional_edges(GraphConstants.NODE_FUSED_CHATBOT, Router.route_fused,
+                                            [GraphConstants.NODE_EXECUTE_PLAN, GraphConstants.NODE_CHATBOT,
+                                             GraphConstants.NODE_TOOLS, END])
+    else:
+        graph_builder.add_node(GraphConstants.NODE_RECOGNIZE_INTENT, intent_recognizer.recognize_intent)
+        graph_builder.add_edge(GraphConstants.NODE_SUMMARIZE_CHARACTER, GraphConstants.NODE_RECOGNIZE_INTENT)
+        graph_builder.add_edge(GraphConstants.NODE_RECOGNIZE_INTENT, GraphConstants.NODE_TRUNCATE_HISTORY)
+        graph_builder.add_conditional_edges(GraphConstants.NODE_RETRIEVE_MEMORY,
+                                            Router.route_by_intent,
+                                            {
+                                                GraphConstants.NODE_EXECUTE_PLAN: GraphConstants.NODE_EXECUTE_PLAN,
+                                                GraphConstants.NODE_CHATBOT: GraphConstants.NODE_CHATBOT
+                                            }
+                                            )
+    graph_builder.add_conditional_edges(GraphConstants.NODE_EXECUTE_PLAN, Router.route_after_plan,
+                                        [GraphConstants.NODE_CHATBOT, END])
     # graph_builder.add_edge(GraphConstants.NODE_EXECUTE_PLAN, END)
     graph_builder.add_conditional_edges(GraphConstants.NODE_CHATBOT, FlowController.should_continue, [GraphConstants.NODE_TOOLS, END])
-    graph_builder.add_edge(GraphConstants.NODE_TOOLS, GraphConstants.NODE_CHATBOT)
+    # 只读意图的工具结果直接用模板渲染回复，其余回到 chatbot 生成回复
+    graph_builder.add_node(GraphConstants.NODE_RENDER_RESPONSE, response_renderer.render_response)
+    graph_builder.add_conditional_edges(GraphConstants.NODE_TOOLS, response_renderer.route_after_tools,
+                                        [GraphConstants.NODE_RENDER_RESPONSE, GraphConstants.NODE_CHATBOT])
+    graph_builder.add_edge(GraphConstants.NODE_RENDER_RESPONSE, END)
     return graph_builder.compile(checkpointer=checkpointer)
 
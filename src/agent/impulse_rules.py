@@ -0,0 +1,221 @@
+"""冲动消费规则引擎：从 JSON 规则文件编译阈值规则和关键词自动机，按特征给每笔支出打分。"""
+import json
+import logging
+import operator
+import os
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from spending_stats import MIN_HISTORY, RunningStats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = str(Path(__file__).resolve().parent / "impulse_rules.json")
+# 两次检查规则文件是否变更的最小间隔（秒）
+RELOAD_CHECK_INTERVAL = 2.0
+
+COMPARATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+
+def keyword_list(value: Any) -> Tuple[str, ...]:
+    """把触发词配置统一成元组：单个字符串视为一个词（直接迭代会拆成单字），空值为空元组"""
+    if not value:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(str(word) for word in value if word)
+
+
+class AhoCorasick:
+    """多模式串匹配自动机，一次扫描文本即可找出所有命中的关键词"""
+
+    def __init__(self, words: Iterable[str]):
+        """用 words 建立字典树和失败指针，匹配时不区分大小写"""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+        for word in words:
+            if word:
+                self._add(word.lower())
+        self._build_fail_links()
+
+    def _add(self, word: str):
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = nxt
+        if word not in self._output[node]:
+            self._output[node] += (word,)
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._output[child] += self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> List[str]:
+        """返回 text 中出现过的关键词（按首次出现顺序去重）"""
+        found = {}
+        node = 0
+        for ch in (text or "").lower():
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for word in self._output[node]:
+                found.setdefault(word, None)
+        return list(found)
+
+
+class CompiledRuleSet:
+    """编译后的规则集：比较函数、阈值和消息模板都已预先解析"""
+
+    def __init__(self, config: Dict[str, Any], version: int):
+        """由规则文件的内容 config 编译，version 在每次重新加载后递增"""
+        self.version = version
+        self.impulse_score = config.get("impulse_score", 3)
+        self.suspicious_score = config.get("suspicious_score", 2)
+        self.keywords = keyword_list(config.get("keywords"))
+        self.category_keywords = {k: keyword_list(v) for k, v in config.get("category_keywords", {}).items()}
+        # 每条规则是若干档位，按顺序命中第一个满足条件的档位
+        self.rules = []
+        for rule in config.get("rules", []):
+            tiers = rule.get("tiers", [rule])
+            self.rules.append(tuple(
+                (t["feature"], COMPARATORS[t["op"]], t["threshold"], t["weight"], t["message"])
+                for t in tiers
+            ))
+
+    def evaluate(self, features: Dict[str, Any]) -> Tuple[int, List[str]]:
+        """对特征打分，返回总分和命中规则的说明"""
+        score = 0
+        reasons = []
+        for tiers in self.rules:
+            for feature, compare, threshold, weight, message in tiers:
+                value = features.get(feature)
+                if value is None or not compare(value, threshold):
+                    continue
+                score += weight
+                reasons.append(message.format(**features))
+                break
+        return score, reasons
+
+
+class RuleEngine:
+    """冲动消费规则引擎，规则文件变更后自动重新编译"""
+
+    def __init__(self, path: str = None):
+        """Path 默认取 IMPULSE_RULES_PATH，未设置时使用内置的 impulse_rules.json"""
+        self.path = path or os.getenv("IMPULSE_RULES_PATH") or DEFAULT_RULES_PATH
+        self._lock = threading.Lock()
+        self._ruleset: Optional[CompiledRuleSet] = None
+        self._mtime = None
+        self._last_check = 0.0
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if self._ruleset is not None and mtime == self._mtime:
+            return
+        # 先记录 mtime，文件写坏时不会在每次检查时重复报错
+        self._mtime = mtime
+        with open(self.path, encoding="utf-8") as f:
+            config = json.load(f)
+        version = (self._ruleset.version + 1) if self._ruleset else 1
+        self._ruleset = CompiledRuleSet(config, version)
+        logger.info("Loaded impulse rules v%s from %s", version, self.path)
+
+    def ruleset(self) -> CompiledRuleSet:
+        """返回当前规则集，最多每 RELOAD_CHECK_INTERVAL 秒检查一次文件变更"""
+        now = time.monotonic()
+        if self._ruleset is not None and now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return self._ruleset
+        with self._lock:
+            self._last_check = now
+            try:
+                self._load()
+            except Exception:
+                # 规则文件写坏时沿用上一版规则，首次加载失败则直接抛出
+                if self._ruleset is None:
+                    raise
+                logger.exception("Failed to reload impulse rules, keeping v%s", self._ruleset.version)
+        return self._ruleset
+
+    def keyword_matcher(self, user_keywords: Iterable[str] = (), category: str = None) -> AhoCorasick:
+        """合并全局、类别和用户自定义触发词的自动机（按组合缓存），user_keywords 也可以是单个字符串"""
+        ruleset = self.ruleset()
+        return _build_matcher(ruleset, tuple(sorted(set(keyword_list(user_keywords)))), category or "")
+
+    def assess(self, features: Dict[str, Any], description: str,
+               user_keywords: Iterable[str] = (), category: str = None) -> Dict[str, Any]:
+        """计算关键词特征并打分"""
+        ruleset = self.ruleset()
+        matched = self.keyword_matcher(user_keywords, category).find_all(description)
+        features = dict(features, keyword_hits=len(matched), matched_keywords="、".join(matched))
+        score, reasons = ruleset.evaluate(features)
+        return {
+            "score": score,
+            "reasons": reasons,
+            "is_impulse": score >= ruleset.impulse_score,
+            "is_suspicious": ruleset.suspicious_score <= score < ruleset.impulse_score,
+        }
+
+
+@lru_cache(maxsize=1024)
+def _build_matcher(ruleset: CompiledRuleSet, user_keywords: Tuple[str, ...], category: str) -> AhoCorasick:
+    words = ruleset.keywords + ruleset.category_keywords.get(category, ()) + user_keywords
+    return AhoCorasick(words)
+
+
+def compute_features(amount: float, budget: float, recent_avg: float,
+                     personality: Any, month_spent: float,
+                     stats: RunningStats = None, category_stats: RunningStats = None) -> Dict[str, Any]:
+    """把原始数据转换为规则引擎使用的特征，不适用的特征取 None
+
+    stats / category_stats 为用户全部支出和该类别支出的流式统计；历史足够时用 z 分数和百分位判断异常，
+    近期平均只在历史不足时作为回退。
+    """
+    tags = personality if isinstance(personality, list) else [personality or ""]
+    remaining = max(0, budget - month_spent) if budget else None
+    has_history = stats is not None and stats.count >= MIN_HISTORY
+    return {
+        "amount": amount,
+        "budget_ratio": amount / budget if budget and budget > 0 else None,
+        "recent_avg": recent_avg,
+        "recent_avg_multiple": amount / recent_avg if recent_avg and recent_avg > 0 and not has_history else None,
+        "history_count": stats.count if stats else 0,
+        "history_mean": stats.mean if stats else None,
+        "amount_zscore": stats.zscore(amount) if stats else None,
+        "amount_percentile": stats.percentile_of(amount) if stats else None,
+        "category_zscore": category_stats.zscore(amount) if category_stats else None,
+        "category_percentile": category_stats.percentile_of(amount) if category_stats else None,
+        "impulsive_tag": any("impuls" in str(t).lower() or "冲动" in str(t) for t in tags),
+        "month_spent": month_spent,
+        "month_remaining": remaining,
+        "remaining_share": amount / remaining if remaining else None,
+    }
+
+
+# 进程内共享的规则引擎
+engine = RuleEngine()
@@ -0,0 +1,242 @@
+"""LLM 调用的全局准入控制：按请求数和 token 数的令牌桶限流，按优先级排队。
+
+优先级从高到低为 chat（交互回复）> intent（意图识别）> plan（计划 agent）
+> background（对话中顺带执行的性格总结）> batch（月度报告点评等离线任务）。
+低优先级只能在令牌桶保留一定余量时准入，后台任务堆积时不会挤占交互请求的额度；
+排队超过各类别的等待上限或队列已满时抛出 LLMOverloaded，由调用方降级处理。
+background 不排队（额度不足立即丢弃，不拖慢所在的对话轮次），batch 可以推迟较长时间。
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+
+class PriorityClass(NamedTuple):
+    priority: int
+    # 准入后令牌桶至少要保留的容量比例，为更高优先级的调用预留额度
+    reserve: float
+    # 最长排队时间（秒），超过后放弃本次调用
+    max_wait: float
+
+
+PRIORITY_CLASSES: Dict[str, PriorityClass] = {
+    "chat": PriorityClass(0, 0.0, 30.0),
+    "intent": PriorityClass(1, 0.0, 10.0),
+    "plan": PriorityClass(2, 0.2, 30.0),
+    "background": PriorityClass(3, 0.5, 0.0),
+    "batch": PriorityClass(4, 0.5, 120.0),
+}
+# 每个类别保留的等待时间样本数
+WAIT_SAMPLES = 1000
+# 令牌不足时两次检查之间的最短间隔（秒）
+MIN_RETRY_INTERVAL = 0.005
+
+
+class LLMOverloaded(RuntimeError):
+    """LLM 调用因超出限额被丢弃"""
+
+
+class TokenBucket:
+    """令牌桶：rate_per_minute 为 0 时不限流；允许扣成负数，按实际用量事后记账"""
+
+    def __init__(self, rate_per_minute: float):
+        """桶容量为一分钟的额度，初始为满"""
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        """速率为 0 时不限流"""
+        return self.capacity <= 0
+
+    def refill(self, now: float):
+        """按上次更新以来经过的时间补充令牌，不超过容量"""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def has(self, amount: float, reserve: float) -> bool:
+        """取走 amount 后是否仍保留 reserve 比例的容量"""
+        return self.unlimited or self.level - amount >= reserve * self.capacity
+
+    def seconds_until(self, amount: float, reserve: float) -> float:
+        """还需等待多少秒 has(amount, reserve) 才成立"""
+        if self.has(amount, reserve):
+            return 0.0
+        return (amount + reserve * self.capacity - self.level) / self.rate
+
+    def take(self, amount: float):
+        """扣除 amount 个令牌，可以扣成负数"""
+        if not self.unlimited:
+            self.level -= amount
+
+
+class LLMScheduler:
+    """线程安全的优先级调度器，所有 LLM 客户端共用一个实例"""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, queue_limit: int = 256,
+                 classes: Dict[str, PriorityClass] = None):
+        """每分钟请求数和 token 数为 0 时不限流；queue_limit 为每个类别的最大排队数"""
+        self.classes = classes or PRIORITY_CLASSES
+        self.queue_limit = queue_limit
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiting: List[list] = []
+        self._seq = itertools.count()
+        self._queued = {name: 0 for name in self.classes}
+        self._stats = {name: {"admitted": 0, "shed_queue_full": 0, "shed_deadline": 0, "tokens": 0}
+                       for name in self.classes}
+        self._waits = {name: deque(maxlen=WAIT_SAMPLES) for name in self.classes}
+
+    def _admissible(self, cls: PriorityClass) -> bool:
+        # token 桶只要求不低于保留线：单次调用用量事先未知，结束后再按实际用量扣除
+        return self._requests.has(1, cls.reserve) and self._tokens.has(0, cls.reserve)
+
+    def _retry_after(self, cls: PriorityClass) -> float:
+        return max(MIN_RETRY_INTERVAL, self._requests.seconds_until(1, cls.reserve),
+                   self._tokens.seconds_until(0, cls.reserve))
+
+    def _refill(self, now: float):
+        self._requests.refill(now)
+        self._tokens.refill(now)
+
+    def _shed(self, name: str, reason: str):
+        self._stats[name][f"shed_{reason}"] += 1
+        raise LLMOverloaded(f"LLM {name} call shed: {reason}")
+
+    def acquire(self, name: str, blocking: bool = True) -> bool:
+        """按优先级排队直到准入；blocking=False 时不能立即准入则返回 False"""
+        cls = self.classes[name]
+        started = time.monotonic()
+        deadline = started + cls.max_wait
+        with self._cond:
+            self._refill(started)
+            if not blocking:
+                if self._waiting or not self._admissible(cls):
+                    return False
+                self._admit(name, started, started)
+                return True
+            if self._queued[name] >= self.queue_limit:
+                self._shed(name, "queue_full")
+            entry = [cls.priority, next(self._seq)]
+            heapq.heappush(self._waiting, entry)
+            self._queued[name] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    # 只有队首（优先级最高、最早到达）可以准入，低优先级不会插队
+                    if self._waiting[0] is entry and self._admissible(cls):
+                        heapq.heappop(self._waiting)
+                        self._admit(name, started, now)
+                        return True
+                    if now >= deadline:
+                        self._waiting.remove(entry)
+                        heapq.heapify(self._waiting)
+                        self._shed(name, "deadline")
+                    wait = deadline - now
+                    if self._waiting[0] is entry:
+                        wait = min(wait, self._retry_after(cls))
+                    self._cond.wait(wait)
+            finally:
+                self._queued[name] -= 1
+                self._cond.notify_all()
+
+    def _admit(self, name: str, started: float, now: float):
+        self._requests.take(1)
+        self._stats[name]["admitted"] += 1
+        self._waits[name].append(now - started)
+
+    def record_tokens(self, name: str, tokens: int):
+        """调用结束后按实际 token 用量扣减令牌桶"""
+        if not tokens:
+            return
+        with self._cond:
+            self._refill(time.monotonic())
+            self._tokens.take(tokens)
+            self._stats[name]["tokens"] += tokens
+
+    def rate_limiter(self, name: str) -> "ScheduledRateLimiter":
+        """返回按 name 类别排队的 langchain rate_limiter"""
+        return ScheduledRateLimiter(self, name)
+
+    def usage_callback(self, name: str) -> "TokenUsageCallback":
+        """返回把 token 用量记入 name 类别的回调"""
+        return TokenUsageCallback(self, name)
+
+    @staticmethod
+    def _wait_summary(values: deque) -> Dict[str, float]:
+        if not values:
+            return {"p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(values)
+
+        def pick(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        return {"p50_ms": round(pick(0.5) * 1000, 1), "p95_ms": round(pick(0.95) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1)}
+
+    def metrics(self) -> Dict[str, Any]:
+        """各优先级的准入/丢弃次数、token 用量、当前排队数和排队等待时间分位数"""
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "requests_available": None if self._requests.unlimited else round(self._requests.level, 1),
+                "tokens_available": None if self._tokens.unlimited else round(self._tokens.level),
+                "classes": {
+                    name: {**self._stats[name], "queued": self._queued[name], **self._wait_summary(self._waits[name])}
+                    for name in self.classes
+                },
+            }
+
+
+class ScheduledRateLimiter(BaseRateLimiter):
+    """把 LLMScheduler 接入 langchain 模型的 rate_limiter 参数（每次调用前执行 acquire）"""
+
+    def __init__(self, scheduler: LLMScheduler, name: str):
+        """按 PRIORITY_CLASSES 中的 name 类别调度"""
+        self.scheduler = scheduler
+        self.name = name
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        """在调用模型前排队等待准入"""
+        return self.scheduler.acquire(self.name, blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        """异步调用时在线程中排队，不阻塞事件循环"""
+        return await asyncio.to_thread(self.scheduler.acquire, self.name, blocking)
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """调用结束时把响应中的 token 用量记入调度器"""
+
+    def __init__(self, scheduler: LLMScheduler, name: str):
+        """按 PRIORITY_CLASSES 中的 name 类别调度"""
+        self.scheduler = scheduler
+        self.name = name
+
+    @staticmethod
+    def _total_tokens(response: LLMResult) -> Optional[int]:
+        total = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                total += usage.get("total_tokens", 0)
+        if not total:
+            total = ((response.llm_output or {}).get("token_usage") or {}).get("total_tokens", 0)
+        return total
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        """调用结束后记录实际 token 用量"""
+        self.scheduler.record_tokens(self.name, self._total_tokens(response))
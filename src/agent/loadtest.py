@@ -0,0 +1,191 @@
+"""压测：用大量模拟用户驱动 build_graph 编译出的对话图，统计吞吐量与各节点/端到端延迟分位数。
+
+默认在进程内启动 mock LLM 服务，不消耗真实模型额度，数据写入临时目录下的独立数据库。
+用法：
+    python loadtest.py --users 2000 --messages 3 --concurrency 64 --mock-latency lognormal:300:0.5
+    python loadtest.py --base-url http://127.0.0.1:8765/v1   # 使用单独启动的 mock_llm_server.py
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+# 消息类型及权重，对应 mock_llm_server.DEFAULT_SCRIPT 中的规则
+MESSAGE_MIX = [
+    (30, ["今天中午吃饭花了35块，帮我记一下", "刚打车花了28元", "买了一本教材 89 块"]),
+    (20, ["我想买一双 899 的球鞋，值得吗", "新出的游戏机要不要现在入手"]),
+    (10, ["看看我最近的支出", "最近花了哪些钱"]),
+    (10, ["帮我复盘一下这几个月的消费情况", "我的钱都花在哪了"]),
+    (8, ["我现在有哪些计划", "看看我的计划进度"]),
+    (6, ["我想在半年内存下 5000 块", "帮我制定一个攒钱计划"]),
+    (4, ["把我的储蓄计划目标改成 8000"]),
+    (2, ["删掉那个消费节制计划"]),
+    (5, ["把我的月预算改成 1500", "我这个月的生活费涨到 2500 了"]),
+    (5, ["今天心情不太好", "谢谢你"]),
+]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def sample_message(rng: random.Random) -> str:
+    weights = [w for w, _ in MESSAGE_MIX]
+    texts = rng.choices(MESSAGE_MIX, weights=weights)[0][1]
+    return rng.choice(texts)
+
+
+class LoadStats:
+    """线程安全地收集各节点与端到端耗时（毫秒）"""
+
+    def __init__(self):
+        """各节点耗时、端到端耗时和按类型计数的错误，初始均为空"""
+        self._lock = threading.Lock()
+        self.node_ms: Dict[str, List[float]] = defaultdict(list)
+        self.e2e_ms: List[float] = []
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, node_ms: Dict[str, List[float]], e2e_ms: float = None, error: str = None):
+        """合并一条消息的各节点耗时，并记录端到端耗时或错误类型"""
+        with self._lock:
+            for node, values in node_ms.items():
+                self.node_ms[node].extend(values)
+            if e2e_ms is not None:
+                self.e2e_ms.append(e2e_ms)
+            if error:
+                self.errors[error] += 1
+
+    @staticmethod
+    def _summary(values: List[float]) -> Dict[str, float]:
+        if not values:
+            return {"count": 0}
+        return {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 1),
+            "p50": round(_percentile(values, 0.50), 1),
+            "p95": round(_percentile(values, 0.95), 1),
+            "p99": round(_percentile(values, 0.99), 1),
+        }
+
+    def report(self, wall_seconds: float) -> Dict:
+        """按节点和端到端汇总耗时分位数、吞吐与错误数"""
+        completed = len(self.e2e_ms)
+        return {
+            "wall_seconds": round(wall_seconds, 2),
+            "messages_ok": completed,
+            "messages_failed": sum(self.errors.values()),
+            "throughput_msg_per_s": round(completed / wall_seconds, 2) if wall_seconds else 0,
+            "end_to_end_ms": self._summary(self.e2e_ms),
+            "nodes_ms": {node: self._summary(values) for node, values in sorted(self.node_ms.items())},
+            "errors": dict(self.errors),
+        }
+
+
+def run_user(app, user_index: int, messages: int, stats: LoadStats, seed: int):
+    """一个模拟用户依次发送若干条消息，按 stream 的节点更新计时"""
+    rng = random.Random(seed + user_index)
+    user_id = f"load_user_{user_index}"
+    config = {"configurable": {"thread_id": user_id}}
+    for _ in range(messages):
+        inputs = {"user_id": user_id, "messages": [("user", sample_message(rng))]}
+        node_ms: Dict[str, List[float]] = defaultdict(list)
+        started = last = time.perf_counter()
+        try:
+            # 图按顺序执行节点，相邻两次更新的间隔即为该节点耗时
+            for update in app.stream(inputs, config=config, stream_mode="updates"):
+                now = time.perf_counter()
+                for node in update:
+                    node_ms[node].append((now - last) * 1000)
+                last = now
+        except Exception as e:
+            stats.record(node_ms, error=type(e).__name__)
+            continue
+        stats.record(node_ms, (time.perf_counter() - started) * 1000)
+
+
+def print_report(report: Dict):
+    e2e = report["end_to_end_ms"]
+    print(f"完成 {report['messages_ok']} 条消息，失败 {report['messages_failed']} 条，"
+          f"耗时 {report['wall_seconds']}s，吞吐 {report['throughput_msg_per_s']} 条/秒")
+    print(f"{'node':<28}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = list(report["nodes_ms"].items()) + [("end_to_end", e2e)]
+    for node, s in rows:
+        if not s.get("count"):
+            continue
+        print(f"{node:<28}{s['count']:>8}{s['mean']:>10}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}")
+    if report["errors"]:
+        print("errors:", json.dumps(report["errors"], ensure_ascii=False))
+    classes = (report.get("llm_scheduler") or {}).get("classes") or {}
+    if classes:
+        print(f"{'llm class':<28}{'admitted':>10}{'shed':>8}{'wait p50':>10}{'wait p95':>10}")
+        for name, c in classes.items():
+            shed = c["shed_queue_full"] + c["shed_deadline"]
+            print(f"{name:<28}{c['admitted']:>10}{shed:>8}{c['p50_ms']:>10}{c['p95_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PocketWise 对话图压测")
+    parser.add_argument("--users", type=int, default=1000, help="模拟用户数")
+    parser.add_argument("--messages", type=int, default=3, help="每个用户发送的消息数")
+    parser.add_argument("--concurrency", type=int, default=64, help="同时在线的用户数")
+    parser.add_argument("--mode", default=None, help="图模式 two_call / fused，默认取 GRAPH_MODE")
+    parser.add_argument("--base-url", default=None, help="已启动的 mock 服务地址，不指定则在进程内启动")
+    parser.add_argument("--mock-latency", default="lognormal:300:0.5", help="进程内 mock 服务的延迟分布（毫秒）")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="进程内 mock 服务的错误注入比例")
+    parser.add_argument("--db-dir", default=None, help="压测数据库目录，默认使用临时目录")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        from mock_llm_server import MockLLM, start_server
+        server = start_server(MockLLM(latency=args.mock_latency, error_rate=args.mock_error_rate), port=0)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        os.environ["LLM_API_KEY_OVERRIDE"] = "mock"
+    # 必须在导入 model 之前设置，.env 中的 BASE_URL 不会覆盖它
+    os.environ["LLM_BASE_URL_OVERRIDE"] = base_url
+
+    import database as db
+
+    # 导入 graph 时 tools.py 会初始化数据库，必须先把分片切到压测目录，否则会写到真实数据库
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix="pocketwise-load-")
+    db.configure_shards(os.path.join(db_dir, "pocketwise.db"), db.router.shard_count)
+    db.init_db()
+
+    from graph import build_graph
+    from langgraph.checkpoint.memory import MemorySaver
+    from model import scheduler
+
+    app = build_graph(MemorySaver(), args.mode)
+
+    stats = LoadStats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i in range(args.users):
+            pool.submit(run_user, app, i, args.messages, stats, args.seed)
+    wall = time.perf_counter() - started
+
+    report = stats.report(wall)
+    report.update({"users": args.users, "concurrency": args.concurrency, "base_url": base_url, "db_dir": db_dir,
+                   "llm_scheduler": scheduler.metrics()})
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if db.write_queue is not None:
+        db.write_queue.flush()
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
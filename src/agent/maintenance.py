@@ -0,0 +1,232 @@
+"""数据库维护命令：归档历史支出、增量 VACUUM 与 ANALYZE。
+
+用法：
+    python maintenance.py archive [--days 365] [--batch 500]
+    python maintenance.py vacuum [--pages 1000]
+    python maintenance.py export --user student_01 --out expenses.csv
+    python maintenance.py stats
+    python maintenance.py parse-stats [--days 30]
+"""
+import argparse
+import csv
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import database as db
+from env_utils import ARCHIVE_HORIZON_DAYS
+from spending_stats import RunningStats
+
+ARCHIVE_BATCH_SIZE = 500
+
+
+def _archive_batch(conn: sqlite3.Connection, ids, schema: str = "main") -> None:
+    """在一个事务内把一批支出先汇总进月度表，再移入归档表（schema 为附加数据库时操作该库）"""
+    placeholders = ", ".join("?" for _ in ids)
+    conn.execute(
+        f"""INSERT INTO {schema}.monthly_expense_summary (user_id, month, category, total, count)
+            SELECT user_id, substr(timestamp, 1, 7), COALESCE(category, ''), SUM(amount), COUNT(*)
+            FROM {schema}.expenses WHERE id IN ({placeholders})
+            GROUP BY user_id, substr(timestamp, 1, 7), COALESCE(category, '')
+            ON CONFLICT (user_id, month, category)
+            DO UPDATE SET total = total + excluded.total, count = count + excluded.count""",
+        ids)
+    conn.execute(
+        f"""INSERT INTO {schema}.expenses_archive (id, user_id, description, amount, category, context, timestamp, ts)
+            SELECT id, user_id, description, amount, category, context, timestamp, ts
+            FROM {schema}.expenses WHERE id IN ({placeholders})""",
+        ids)
+    conn.execute(f"DELETE FROM {schema}.expenses WHERE id IN ({placeholders})", ids)
+
+
+def _expired_ids(conn: sqlite3.Connection, cutoff_ts: int, limit: int, schema: str = "main",
+                 user_id: str = None) -> List[int]:
+    """取出一批早于 cutoff_ts 的支出 id，user_id 不为空时只取该用户的"""
+    clause, params = "ts < ?", [cutoff_ts]
+    if user_id is not None:
+        clause += " AND user_id = ?"
+        params.append(user_id)
+    return [row[0] for row in conn.execute(
+        f"SELECT id FROM {schema}.expenses WHERE {clause} ORDER BY id LIMIT ?", (*params, limit))]
+
+
+def archive_before(conn: sqlite3.Connection, cutoff: str, schema: str = "main", user_id: str = None,
+                   batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """在调用方的事务内归档早于 cutoff（ISO 日期）的支出，不更新水位线，返回归档条数"""
+    cutoff_ts = db.to_epoch(cutoff)
+    archived = 0
+    while True:
+        ids = _expired_ids(conn, cutoff_ts, batch_size, schema, user_id)
+        if not ids:
+            return archived
+        _archive_batch(conn, ids, schema)
+        archived += len(ids)
+
+
+def archive_expenses(horizon_days: int = ARCHIVE_HORIZON_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """把所有分片中早于 horizon_days 天的支出分批移入 expenses_archive，返回归档条数"""
+    cutoff_date = (datetime.now() - timedelta(days=horizon_days)).date()
+    return sum(_archive_shard(path, cutoff_date, batch_size) for path in db.all_db_paths())
+
+
+def _archive_shard(path: str, cutoff_date, batch_size: int) -> int:
+    cutoff = cutoff_date.isoformat()
+    cutoff_ts = db.to_epoch(cutoff_date)
+    conn = sqlite3.connect(path)
+    archived = 0
+    try:
+        while True:
+            ids = _expired_ids(conn, cutoff_ts, batch_size)
+            if not ids:
+                break
+            # 每批一个短事务，避免长时间占用写锁
+            with conn:
+                _archive_batch(conn, ids)
+            archived += len(ids)
+
+        # 记录归档水位线，查询范围早于它时才需要合并冷表
+        with conn:
+            if cutoff > db.get_archive_cutoff(conn):
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('archive_cutoff', ?)", (cutoff,))
+    finally:
+        conn.close()
+    return archived
+
+
+def vacuum_and_analyze(pages: int = 1000) -> Dict[str, Dict[str, int]]:
+    """对每个分片增量回收空闲页并更新查询规划器统计信息"""
+    return {path: _vacuum_shard(path, pages) for path in db.all_db_paths()}
+
+
+def _vacuum_shard(path: str, pages: int) -> Dict[str, int]:
+    conn = sqlite3.connect(path)
+    try:
+        freelist_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if auto_vacuum != 2:
+            # 旧数据库需要一次完整 VACUUM 才能切换到增量模式
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+        freelist_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {"freelist_before": freelist_before, "freelist_after": freelist_after}
+
+
+def export_expenses(user_id: str, out_path: str, include_archive: bool = True) -> int:
+    """把用户的全部支出流式导出为 CSV，返回导出条数"""
+    count = 0
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(db.EXPENSE_COLUMNS)
+        for record in db.iter_expenses(user_id, include_archive=include_archive):
+            writer.writerow(record)
+            count += 1
+    return count
+
+
+def rebuild_spending_stats() -> int:
+    """按全部历史支出（含归档）重建每个用户的流式统计，返回用户数（运行期间应停止写入）"""
+    return sum(_rebuild_stats_shard(path) for path in db.all_db_paths())
+
+
+def _rebuild_stats_shard(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM spending_stats")
+        user_ids = [row[0] for row in conn.execute(
+            "SELECT user_id FROM expenses UNION SELECT user_id FROM expenses_archive")]
+        for user_id in user_ids:
+            stats: Dict[str, RunningStats] = {}
+            for category, amount in conn.execute(
+                    """SELECT category, amount FROM expenses WHERE user_id = ?
+                       UNION ALL SELECT category, amount FROM expenses_archive WHERE user_id = ?""",
+                    (user_id, user_id)):
+                for key in {"", category or ""}:
+                    stats.setdefault(key, RunningStats()).add(float(amount or 0))
+            with conn:
+                for category, user_stats in stats.items():
+                    db.put_spending_stats(conn, user_id, category, user_stats)
+    finally:
+        conn.close()
+    return len(user_ids)
+
+
+def expense_parse_stats(days: int = 30) -> Dict:
+    """统计最近 days 天记账快速通道的命中情况，以及有模型结果可比对的解析中金额/类别一致的比例"""
+    since = (datetime.now() - timedelta(days=days)).timestamp()
+    totals = {"parsed": 0, "fast_path": 0, "fallback": 0, "shadow": 0, "confident": 0,
+              "compared": 0, "amount_match": 0, "category_match": 0}
+    reasons: Dict[str, int] = {}
+    for path in db.all_db_paths():
+        conn = sqlite3.connect(path)
+        try:
+            for outcome, reason, confident, amount, category, llm_amount, llm_category in conn.execute(
+                    """SELECT outcome, reason, confident, amount, category, llm_amount, llm_category
+                       FROM expense_parse_log WHERE ts >= ?""", (since,)):
+                totals["parsed"] += 1
+                totals[outcome] = totals.get(outcome, 0) + 1
+                totals["confident"] += confident
+                if outcome == "fallback" and reason:
+                    key = reason if not confident else "触发冲动消费规则"
+                    reasons[key] = reasons.get(key, 0) + 1
+                if confident and llm_amount is not None:
+                    totals["compared"] += 1
+                    totals["amount_match"] += abs(amount - llm_amount) < 0.01
+                    totals["category_match"] += (category or "") == (llm_category or "")
+        finally:
+            conn.close()
+    compared = totals["compared"]
+    return {
+        **totals,
+        "fast_path_rate": round(totals["fast_path"] / totals["parsed"], 3) if totals["parsed"] else None,
+        "amount_precision": round(totals["amount_match"] / compared, 3) if compared else None,
+        "category_precision": round(totals["category_match"] / compared, 3) if compared else None,
+        "fallback_reasons": reasons,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PocketWise 数据库维护")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = sub.add_parser("archive", help="归档历史支出")
+    archive_parser.add_argument("--days", type=int, default=ARCHIVE_HORIZON_DAYS)
+    archive_parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH_SIZE)
+
+    vacuum_parser = sub.add_parser("vacuum", help="增量 VACUUM 并 ANALYZE")
+    vacuum_parser.add_argument("--pages", type=int, default=1000)
+
+    export_parser = sub.add_parser("export", help="导出用户的全部支出为 CSV")
+    export_parser.add_argument("--user", required=True)
+    export_parser.add_argument("--out", required=True)
+    export_parser.add_argument("--hot-only", action="store_true", help="不包含已归档的支出")
+
+    sub.add_parser("stats", help="按全部历史重建每个用户的消费统计")
+
+    parse_stats_parser = sub.add_parser("parse-stats", help="记账快速通道的命中率与解析准确率")
+    parse_stats_parser.add_argument("--days", type=int, default=30)
+
+    args = parser.parse_args()
+    db.init_db()
+    if args.command == "archive":
+        print(f"已归档 {archive_expenses(args.days, args.batch)} 条支出")
+    elif args.command == "vacuum":
+        print(vacuum_and_analyze(args.pages))
+    elif args.command == "export":
+        print(f"已导出 {export_expenses(args.user, args.out, not args.hot_only)} 条支出")
+    elif args.command == "stats":
+        print(f"已重建 {rebuild_spending_stats()} 个用户的消费统计")
+    elif args.command == "parse-stats":
+        print(json.dumps(expense_parse_stats(args.days), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""本地 mock LLM 服务：实现 OpenAI chat-completions 接口，用于离线压测。
+
+按用户消息中的关键词返回脚本化的意图或工具调用，支持可配置的延迟分布和错误注入。
+用法：
+    python mock_llm_server.py --port 8765 --latency lognormal:300:0.5 --error-rate 0.01
+    LLM_BASE_URL_OVERRIDE=http://127.0.0.1:8765/v1 python cli.py
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+# 脚本规则：按顺序匹配最后一条用户消息中的关键词，命中后给出意图和（若可用）工具调用
+DEFAULT_SCRIPT = [
+    {"keywords": ["有哪些计划", "计划进度", "看看我的计划"], "intent": "review_plan", "tool": "view_plan", "args": {}},
+    {"keywords": ["删掉", "删了", "不要这个计划"], "intent": "delete_plan", "tool": "delete_plan", "args": {"plan_id": 1}},
+    {"keywords": ["预算", "生活费"], "intent": "edit_profile", "tool": "edit_user_profile",
+     "args": {"updates": {"monthly_budget": 1500}}},
+    {"keywords": ["改成", "推迟"], "intent": "update_plan", "tool": "update_plan", "args": {"plan_id": 1, "goal_amount": 8000}},
+    {"keywords": ["存下", "制定", "攒钱"], "intent": "generate_plan", "tool": "log_plan",
+     "args": {"plan_type": "储蓄", "content": "半年存下 5000 元", "start_date": "2026-01-01",
+              "goal_amount": 5000, "stages_amount": 850}},
+    {"keywords": ["值得", "要不要", "划算"], "intent": "consult", "tool": "detect_impulse_buying",
+     "args": {"description": "球鞋", "amount": 899, "category": "购物"}},
+    {"keywords": ["复盘", "花在哪", "消费情况"], "intent": "review_profile", "tool": "analyze_spending", "args": {"months": 3}},
+    {"keywords": ["最近"], "intent": "view_recent_expenses", "tool": "view_recent_expenses", "args": {}},
+    {"keywords": ["花了", "记一下", "买了"], "intent": "log_expense", "tool": "log_notable_expense",
+     "args": {"description": "午饭", "amount": 35, "category": "餐饮", "context": "日常"}},
+]
+
+ROUTE_TOOL = "route_turn"
+DEFAULT_REPLY = "好的，我了解了。还有什么可以帮你的吗？"
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """解析延迟分布（毫秒），返回采样函数（秒）
+
+    const:200 / uniform:100:400 / normal:300:80 / lognormal:300:0.5（中位数与 sigma）
+    """
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    samplers = {
+        "const": lambda: values[0],
+        "uniform": lambda: random.uniform(values[0], values[1]),
+        "normal": lambda: random.gauss(values[0], values[1]),
+        "lognormal": lambda: random.lognormvariate(math.log(values[0]), values[1]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"未知的延迟分布: {spec}")
+    sample = samplers[kind]
+    return lambda: max(0.0, sample()) / 1000
+
+
+class MockLLM:
+    """根据请求内容生成 chat-completions 响应"""
+
+    def __init__(self, script: List[Dict[str, Any]] = None, latency: str = "const:0",
+                 error_rate: float = 0.0, error_statuses: List[int] = None):
+        """Script 为按关键词匹配的响应脚本；latency 见 parse_latency，error_rate 为注入错误响应的比例"""
+        self.script = script or DEFAULT_SCRIPT
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses or [500]
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0, "tool_call_responses": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def match(self, text: str) -> Optional[Dict[str, Any]]:
+        """返回第一条关键词出现在 text 中的脚本规则"""
+        for rule in self.script:
+            if any(k in text for k in rule["keywords"]):
+                return rule
+        return None
+
+    @staticmethod
+    def _last_user_text(messages: List[Dict[str, Any]]) -> str:
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                content = message.get("content")
+                if isinstance(content, list):
+                    content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+                return content or ""
+        return ""
+
+    @staticmethod
+    def _user_id(messages: List[Dict[str, Any]]) -> str:
+        for message in messages:
+            if message.get("role") == "system":
+                found = re.search(r"用户 ID：\s*(\S+)", str(message.get("content") or ""))
+                if found:
+                    return found.group(1)
+        return "mock_user"
+
+    @staticmethod
+    def _tool_call(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        return {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)}}
+
+    def respond(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """返回响应消息（role/content/tool_calls），不含延迟和错误注入"""
+        messages = body.get("messages") or []
+        tools = {t["function"]["name"]: t["function"] for t in body.get("tools") or []}
+        system_text = "".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+        rule = self.match(self._last_user_text(messages))
+
+        # 工具结果之后给出最终回复，避免无限循环调用工具
+        if not tools or (messages and messages[-1].get("role") == "tool"):
+            if not tools and "意图识别" in system_text:
+                return {"role": "assistant", "content": rule["intent"] if rule else "unknown"}
+            return {"role": "assistant", "content": DEFAULT_REPLY}
+
+        calls = []
+        if rule and rule["tool"] in tools:
+            args = dict(rule["args"])
+            if "user_id" in (tools[rule["tool"]].get("parameters") or {}).get("properties", {}):
+                args["user_id"] = self._user_id(messages)
+            calls.append(self._tool_call(rule["tool"], args))
+        if ROUTE_TOOL in tools:
+            intent = rule["intent"] if rule else "unknown"
+            calls.insert(0, self._tool_call(ROUTE_TOOL, {"intent": intent, "reply": None if calls else DEFAULT_REPLY}))
+        if not calls and body.get("tool_choice") == "required":
+            name = next(iter(tools))
+            calls.append(self._tool_call(name, {}))
+        if calls:
+            return {"role": "assistant", "content": "", "tool_calls": calls}
+        return {"role": "assistant", "content": DEFAULT_REPLY}
+
+    def complete(self, body: Dict[str, Any]):
+        """返回 (HTTP 状态码, 响应体)，包含延迟和错误注入"""
+        self._count("requests")
+        time.sleep(self.sample_latency())
+        if self.error_rate and random.random() < self.error_rate:
+            self._count("errors_injected")
+            status = random.choice(self.error_statuses)
+            return status, {"error": {"message": "injected error", "type": "mock_error", "code": status}}
+
+        message = self.respond(body)
+        if message.get("tool_calls"):
+            self._count("tool_call_responses")
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in body.get("messages") or [])
+        completion_chars = len(message.get("content") or "") + sum(
+            len(c["function"]["arguments"]) for c in message.get("tool_calls") or [])
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": {"prompt_tokens": prompt_chars, "completion_tokens": completion_chars,
+                      "total_tokens": prompt_chars + completion_chars},
+        }
+
+
+def make_handler(mock: MockLLM):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: Dict[str, Any]):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send(400, {"error": {"message": "invalid json"}})
+                return
+            self._send(*mock.complete(body))
+
+        def do_GET(self):
+            self._send(200, {"status": "ok", **mock.stats})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def make_server(mock: MockLLM, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    return server
+
+
+def start_server(mock: MockLLM, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """在后台线程启动服务，返回 server（port=0 时由系统分配端口）"""
+    server = make_server(mock, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的 mock LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:300:0.5",
+                        help="延迟分布（毫秒）：const:200 / uniform:100:400 / normal:300:80 / lognormal:300:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的请求比例")
+    parser.add_argument("--error-status", default="500", help="注入错误时随机返回的状态码，逗号分隔，如 429,500")
+    parser.add_argument("--script", default=None, help="自定义脚本规则 JSON 文件")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+    mock = MockLLM(script, args.latency, args.error_rate, [int(s) for s in args.error_status.split(",")])
+    server = make_server(mock, args.host, args.port)
+    print(f"mock LLM 服务已启动：http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(mock.stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
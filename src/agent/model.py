@@ -1,14 +1,43 @@
+"""模型配置：通义千问的 ChatOpenAI 客户端，按用途接入 LLMScheduler 的优先级调度。"""
+from env_utils import (
+    LLM_QUEUE_LIMIT,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    QWEN_API_KEY,
+    QWEN_BASE_URL,
+)
 from langchain_openai import ChatOpenAI
-from env_utils import QWEN_API_KEY,QWEN_BASE_URL
-llm_chat = ChatOpenAI(
+from llm_scheduler import LLMScheduler
+
+# 进程内所有 LLM 调用共用的准入控制
+scheduler = LLMScheduler(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_QUEUE_LIMIT)
+
+
+def _scheduled(llm: ChatOpenAI, priority_class: str) -> ChatOpenAI:
+    """复制一个按 priority_class 排队、并把 token 用量记入调度器的模型（共用底层 HTTP 客户端）"""
+    return llm.model_copy(update={"rate_limiter": scheduler.rate_limiter(priority_class),
+                                  "callbacks": [scheduler.usage_callback(priority_class)]})
+
+
+_llm_chat = ChatOpenAI(
     model="qwen-flash-2025-07-28",
     temperature=0.3,
     api_key=QWEN_API_KEY,
     base_url=QWEN_BASE_URL
 )
-llm_plan = ChatOpenAI(
+_llm_plan = ChatOpenAI(
     model="qwen-flash-2025-07-28",
     temperature=0.7,
     api_key=QWEN_API_KEY,
     base_url=QWEN_BASE_URL
-)
\ No newline at end of file
+)
+# 交互回复
+llm_chat = _scheduled(_llm_chat, "chat")
+# 意图识别
+llm_intent = _scheduled(_llm_chat, "intent")
+# 计划 agent
+llm_plan = _scheduled(_llm_plan, "plan")
+# 对话中顺带执行的性格总结（额度不足时直接跳过）
+llm_background = _scheduled(_llm_chat, "background")
+# 月度报告点评等离线批量任务
+llm_batch = _scheduled(_llm_chat, "batch")
@@ -0,0 +1,134 @@
+"""储蓄计划可行性计算（纯计算，不访问数据库和 LLM）。
+
+由 calculate_saving_plan 工具调用：根据目标金额、期限、收入、预算、存款和历史月均支出，
+给出每月需存金额（即 log_plan 的 stages_amount）、可行性评级、分阶段存款表和备选期限，
+计划 agent 只需整理结果，不再自行推算。
+"""
+import math
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from plan_progress import DAYS_PER_STAGE
+
+# 每月结余中可以长期稳定用于储蓄的比例，其余留作应急
+SUSTAINABLE_SHARE = 0.8
+# 每月存款占结余的比例上限及对应评级（按顺序匹配第一个）
+FEASIBILITY_LEVELS = [
+    (0.6, "comfortable", "轻松可行"),
+    (SUSTAINABLE_SHARE, "feasible", "可行"),
+    (1.0, "tight", "偏紧，需要严格控制支出"),
+]
+INFEASIBLE = ("infeasible", "按当前收支无法按期完成")
+# 备选期限相对目标期限的倍数
+ALTERNATIVE_FACTORS = (1.5, 2.0)
+# 分阶段存款表最多列出的阶段数，其余只给出汇总
+MAX_SCHEDULE_ROWS = 12
+
+
+def _round(value: float) -> float:
+    return round(float(value or 0), 2)
+
+
+def _add_months(start: date, months: int) -> date:
+    index = start.year * 12 + start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def stages_between(start: date, deadline: date) -> int:
+    """返回 start 到 deadline 之间的阶段（月）数，至少为 1"""
+    return max(1, round((deadline - start).days / DAYS_PER_STAGE))
+
+
+def monthly_surplus(income: float, monthly_budget: float, avg_monthly_spend: Optional[float]) -> Optional[float]:
+    """每月可用于储蓄的结余：收入减去预算和历史月均支出中较大的一个；没有收入数据时返回 None"""
+    if not income or income <= 0:
+        return None
+    spend = max(monthly_budget or 0, avg_monthly_spend or 0)
+    return income - spend
+
+
+def schedule(goal_amount: float, stages: int, start: date) -> Dict[str, Any]:
+    """每阶段存款额向上取整到元（目标很小时取整到分），最后一阶段补齐差额；返回 stages_amount 与分阶段累计表"""
+    unit = 1 if goal_amount >= stages else 0.01
+    stages_amount = _round(math.ceil(goal_amount / stages / unit) * unit)
+    if unit == 1:
+        stages_amount = int(stages_amount)
+    last_amount = _round(max(0.0, goal_amount - stages_amount * (stages - 1)))
+    rows: List[Dict[str, Any]] = []
+    for i in range(1, min(stages, MAX_SCHEDULE_ROWS) + 1):
+        amount = last_amount if i == stages else stages_amount
+        rows.append({
+            "stage": i,
+            "month": _add_months(start, i - 1).strftime("%Y-%m"),
+            "amount": amount,
+            "cumulative": _round(goal_amount if i == stages else min(goal_amount, stages_amount * i)),
+        })
+    result = {"stages_amount": stages_amount, "last_stage_amount": last_amount, "rows": rows}
+    if stages > MAX_SCHEDULE_ROWS:
+        result["omitted_stages"] = stages - MAX_SCHEDULE_ROWS
+    return result
+
+
+def _feasibility(required: float, surplus: Optional[float]) -> Dict[str, Any]:
+    if surplus is None:
+        return {"level": "unknown", "label": "缺少收入数据，无法评估", "surplus_share": None}
+    share = required / surplus if surplus > 0 else math.inf
+    for limit, level, label in FEASIBILITY_LEVELS:
+        if share <= limit:
+            return {"level": level, "label": label, "surplus_share": round(share, 3)}
+    return {"level": INFEASIBLE[0], "label": INFEASIBLE[1],
+            "surplus_share": round(share, 3) if share != math.inf else None}
+
+
+def saving_plan(goal_amount: float, income: float, monthly_budget: float, saving: float = 0,
+                avg_monthly_spend: Optional[float] = None, stages: int = None, deadline: date = None,
+                start: date = None) -> Dict[str, Any]:
+    """计算储蓄计划：goal_amount 为计划开始后需要新存下的金额，期限由 stages（月数）或 deadline 给出"""
+    start = start or date.today()
+    if stages is None:
+        stages = stages_between(start, deadline) if deadline else 12
+    stages = max(1, int(stages))
+    surplus = monthly_surplus(income, monthly_budget, avg_monthly_spend)
+    plan = schedule(goal_amount, stages, start)
+    required = plan["stages_amount"]
+
+    result: Dict[str, Any] = {
+        "goal_amount": _round(goal_amount),
+        "start_date": start.isoformat(),
+        "stages": stages,
+        "deadline": (start + timedelta(days=stages * DAYS_PER_STAGE)).isoformat(),
+        "stages_amount": required,
+        "monthly_surplus": _round(surplus) if surplus is not None else None,
+        "spend_basis": {"monthly_budget": _round(monthly_budget), "avg_monthly_spend":
+                        _round(avg_monthly_spend) if avg_monthly_spend is not None else None},
+        "feasibility": _feasibility(required, surplus),
+        "schedule": plan,
+    }
+    if saving and saving >= goal_amount:
+        result["note"] = "现有存款已超过目标金额，可以考虑提高目标或缩短期限"
+
+    if surplus is not None and surplus > 0:
+        sustainable = surplus * SUSTAINABLE_SHARE
+        shortest = max(1, math.ceil(goal_amount / sustainable))
+        result["shortest_sustainable"] = {
+            "stages": shortest,
+            "stages_amount": math.ceil(goal_amount / shortest),
+            "deadline": (start + timedelta(days=shortest * DAYS_PER_STAGE)).isoformat(),
+        }
+        result["reachable_goal_by_deadline"] = _round(math.floor(sustainable * stages))
+    if surplus is not None and required > surplus:
+        # 按期完成需要在预算之外每月额外节省的金额
+        result["monthly_cut_needed"] = _round(required - max(surplus, 0))
+
+    alternatives = []
+    for factor in ALTERNATIVE_FACTORS:
+        alt_stages = math.ceil(stages * factor)
+        alt_amount = math.ceil(goal_amount / alt_stages)
+        alternatives.append({
+            "stages": alt_stages,
+            "stages_amount": alt_amount,
+            "deadline": (start + timedelta(days=alt_stages * DAYS_PER_STAGE)).isoformat(),
+            "feasibility": _feasibility(alt_amount, surplus)["level"],
+        })
+    result["alternatives"] = alternatives
+    return result
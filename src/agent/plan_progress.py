@@ -0,0 +1,153 @@
+"""计划进度的纯计算：阶段、状态、预计完成日期和阶段提醒时间（不访问数据库）。"""
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+# 每个阶段按一个月计
+DAYS_PER_STAGE = 30.44
+
+SAVING_PLAN_TYPES = ("储蓄", "saving", "存钱", "攒钱")
+LIMIT_PLAN_TYPES = ("消费节制", "节省", "limit", "控制消费", "预算")
+
+STATUS_LABELS = {
+    "on_track": "按计划进行",
+    "behind": "落后于计划",
+    "achieved": "已完成",
+    "exceeded": "已超出额度",
+    "unknown": "进度未知",
+}
+
+
+def plan_kind(plan_type: str) -> str:
+    """储蓄类计划按存款增长计进度，消费节制类按计划开始后的支出计进度"""
+    plan_type = (plan_type or "").lower()
+    if any(t in plan_type for t in SAVING_PLAN_TYPES):
+        return "saving"
+    if any(t in plan_type for t in LIMIT_PLAN_TYPES):
+        return "limit"
+    return "other"
+
+
+def parse_start_date(start_date: str, default: datetime = None) -> datetime:
+    """解析计划开始日期，格式不规范时退回 default（默认当前时间）"""
+    try:
+        return datetime.fromisoformat(str(start_date)[:10])
+    except ValueError:
+        return default or datetime.now()
+
+
+def derive_progress(kind: str, goal_amount: Optional[float], stages_amount: Optional[float],
+                    start: datetime, achieved: float, now: datetime = None) -> Dict[str, Any]:
+    """根据已达成金额计算当前阶段、状态和预计完成日期（纯计算，O(1)）
+
+    储蓄计划：achieved 为计划开始后新增的存款，达到 goal_amount 即完成；
+    消费节制计划：achieved 为计划开始后的支出，goal_amount 为总额度、stages_amount 为每阶段额度。
+    """
+    now = now or datetime.now()
+    days = max(0.0, (now - start).total_seconds() / 86400)
+    stages_elapsed = days / DAYS_PER_STAGE
+    goal = goal_amount or 0
+    stage = stages_amount or 0
+
+    current_stage = None
+    if stage > 0:
+        if kind == "saving":
+            current_stage = int(achieved // stage) + 1
+            if goal > 0:
+                current_stage = min(current_stage, math.ceil(goal / stage))
+        else:
+            current_stage = int(stages_elapsed) + 1
+
+    if kind == "saving":
+        if goal > 0 and achieved >= goal:
+            status = "achieved"
+        elif stage > 0:
+            status = "on_track" if achieved >= stage * stages_elapsed else "behind"
+        else:
+            status = "unknown"
+    elif kind == "limit":
+        if goal > 0 and achieved > goal:
+            status = "exceeded"
+        elif stage > 0:
+            status = "on_track" if achieved <= stage * max(1.0, stages_elapsed) else "behind"
+        else:
+            status = "on_track" if goal > 0 else "unknown"
+    else:
+        status = "unknown"
+
+    # 按当前速度推算 achieved 达到 goal_amount 的日期（消费节制计划即额度耗尽日期）
+    projected = None
+    if goal > 0:
+        if achieved >= goal:
+            projected = now
+        elif achieved > 0 and days > 0:
+            projected = now + timedelta(days=(goal - achieved) / (achieved / days))
+        elif kind == "saving" and stage > 0:
+            projected = start + timedelta(days=goal / stage * DAYS_PER_STAGE)
+
+    return {
+        "current_stage": current_stage,
+        "progress_status": status,
+        "projected_completion": projected.date().isoformat() if projected else None,
+    }
+
+
+# 阶段提醒在当天的这个钟点触发
+REMINDER_HOUR = 9
+# 提醒文案中计划内容的最大长度
+REMINDER_NAME_LENGTH = 20
+
+
+def total_stages(goal_amount: Optional[float], stages_amount: Optional[float]) -> Optional[int]:
+    """计划的阶段总数；缺少目标或每阶段金额时返回 None（按月无限期提醒）"""
+    if not goal_amount or not stages_amount or stages_amount <= 0:
+        return None
+    return max(1, math.ceil(goal_amount / stages_amount))
+
+
+def stage_start(start: datetime, stage: int) -> datetime:
+    """第 stage 阶段（从 1 开始）开始当天的提醒时间；stage 为总阶段数 + 1 时即计划到期"""
+    day = start + timedelta(days=(stage - 1) * DAYS_PER_STAGE)
+    return datetime(day.year, day.month, day.day, REMINDER_HOUR)
+
+
+def next_reminder(start: datetime, goal_amount: Optional[float], stages_amount: Optional[float],
+                  now: datetime = None) -> Optional[Tuple[int, datetime]]:
+    """返回 now 之后的下一次阶段提醒 (阶段序号, 触发时间)：每个新阶段开始时及计划到期时各一次，之后返回 None"""
+    now = now or datetime.now()
+    total = total_stages(goal_amount, stages_amount)
+    # 第 1 阶段在建计划时开始，从第 2 阶段起提醒
+    stage = max(2, int((now - start).total_seconds() / 86400 // DAYS_PER_STAGE) + 1)
+    while stage_start(start, stage) <= now:
+        stage += 1
+    if total is not None and stage > total + 1:
+        return None
+    return stage, stage_start(start, stage)
+
+
+def reminder_message(plan: Dict[str, Any], stage: int) -> str:
+    """阶段提醒的文案（plan 含 content/stages_amount/goal_amount 及进度字段）"""
+    name = plan.get("content") or plan.get("plan_type") or "你的计划"
+    if len(name) > REMINDER_NAME_LENGTH:
+        name = name[:REMINDER_NAME_LENGTH] + "…"
+    kind = plan_kind(plan.get("plan_type"))
+    status = STATUS_LABELS.get(plan.get("progress_status") or "unknown")
+    achieved = plan.get("amount_achieved") or 0
+    total = total_stages(plan.get("goal_amount"), plan.get("stages_amount"))
+    if total is not None and stage > total:
+        head = f"计划「{name}」已到期"
+    else:
+        head = f"计划「{name}」进入第 {stage} 阶段" + (f"（共 {total} 个阶段）" if total else "")
+    if kind == "saving":
+        body = f"已存下 {achieved:.2f} 元"
+        if plan.get("goal_amount"):
+            body += f"，目标 {plan['goal_amount']:.2f} 元"
+        if plan.get("stages_amount") and (total is None or stage <= total):
+            body += f"，本阶段计划存 {plan['stages_amount']:.2f} 元"
+    elif kind == "limit":
+        body = f"计划开始后已支出 {achieved:.2f} 元"
+        if plan.get("goal_amount"):
+            body += f"，总额度 {plan['goal_amount']:.2f} 元"
+    else:
+        body = "记得回顾一下进展"
+    return f"{head}：{body}，目前{status}。"
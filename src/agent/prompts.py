@@ -1,5 +1,7 @@
-from typing import Dict, Any, List
+"""提示词管理：意图识别、对话、计划 agent 和性格总结的提示词，以及意图到工具的映射与回复模板。"""
 import json
+from typing import Any, Dict, List
+
 from jinja2 import Template
 
 
@@ -31,7 +33,8 @@ class PromptManager:
         return template.render()
 
     @staticmethod
-    def get_chatbot_system_prompt(user_id: str, profile: Dict[str, Any], extra_guidance: str = "") -> str:
+    def get_chatbot_system_prompt(user_id: str, profile: Dict[str, Any], extra_guidance: str = "",
+                                  recalled_memory: str = "") -> str:
         """chatbot主要系统提示词"""
         template_str = """
         <system>
@@ -49,6 +52,12 @@ class PromptManager:
         当前用户上下文：
         - 用户 ID：{{ user_id }}
         - 用户档案：{{ profile_json }}
+        {% if recalled_memory %}
+        以往对话中与当前问题可能相关的片段（仅供参考，以最新对话和工具数据为准）：
+        <memory>
+        {{ recalled_memory }}
+        </memory>
+        {% endif %}
         </system>
 
         <instruction>
@@ -65,7 +74,8 @@ class PromptManager:
         return template.render(
             user_id=user_id,
             profile_json=profile_json,
-            extra_guidance=extra_guidance
+            extra_guidance=extra_guidance,
+            recalled_memory=recalled_memory
         )
 
     @staticmethod
@@ -78,8 +88,9 @@ class PromptManager:
         用户想制定储蓄或消费计划。请引导设定目标金额和周期。
         针对给定的目标，请制定一个简洁的分步计划。
         提取关键信息：目标金额、时间线、目标类型。
-        可行性评估：使用view_user_profile获取用户经济状况，基于用户当前的月收入、月预算、现有存款，初步判断目标是否在"可实现"范围内。
-        使用log_plan写入长期记忆
+        可行性评估：储蓄计划使用calculate_saving_plan计算（已结合收入、预算、存款和历史支出），
+        直接采用其中的可行性评级、每月存款额和备选期限，不要自行计算；不可行时向用户说明备选期限或需要每月少花的金额。
+        使用log_plan写入长期记忆，stages_amount 填写 calculate_saving_plan 返回的 stages_amount。
 
         2.更新或删除计划
         用户想更新或删除计划。请引导选择计划ID。
@@ -111,15 +122,106 @@ class PromptManager:
     def get_intent_guidance_map() -> Dict[str, str]:
         """意图指导映射"""
         return {
-            "log_expense": "用户想记录一笔支出。请主动询问金额、类别和是否值得，再调用 log_notable_expense。",
-            "view_recent_expenses": "用户想查看最近5笔支出。请调用 view_recent_expenses 获取最近5笔支出。",
+            "log_expense": "用户想记录一笔支出。请主动询问金额、类别和是否值得，再调用 log_notable_expense；金额较大或可能是冲动消费时，先调用 detect_impulse_buying 并据此提醒用户。",
+            "view_recent_expenses": "用户想查看支出记录。请调用 view_recent_expenses 获取最近的支出；用户想看更早的记录时，传入上次结果中的 next_cursor 继续翻页。",
             "edit_profile": "用户想更新预算或收入信息。请先确认要修改的字段和新值，再调用 edit_user_profile。",
             "consult": "用户在咨询某笔消费是否值得。请结合用户财务状况分析，并可调用 detect_impulse_buying 辅助判断。",
-            "review_profile": "用户想复盘财务状况。可调用 view_user_profile 获取最新数据，并总结趋势。",
+            "review_profile": "用户想复盘财务状况。可调用 view_user_profile 获取最新数据，调用 analyze_spending 获取预先统计好的消费摘要，并据此总结趋势。",
             "review_plan": "用户想查看当前计划，可调用view_plan获取用户计划",
             "unknown": "请自由回应用户，必要时使用工具。"
         }
 
+    @staticmethod
+    def get_intent_tool_map() -> Dict[str, List[str]]:
+        """意图到可用工具的映射：每轮只绑定该意图需要的工具，未列出的意图使用全部工具"""
+        return {
+            # 记账快速通道因冲动消费规则回退时，模型需要能调用 detect_impulse_buying 给出提醒
+            "log_expense": ["log_notable_expense", "detect_impulse_buying"],
+            "view_recent_expenses": ["view_recent_expenses"],
+            "edit_profile": ["view_user_profile", "edit_user_profile"],
+            "consult": ["view_user_profile", "view_recent_expenses", "detect_impulse_buying"],
+            "review_profile": ["view_user_profile", "view_recent_expenses", "analyze_spending"],
+            "review_plan": ["view_plan"],
+            "generate_plan": ["view_plan"],
+            "update_plan": ["view_plan"],
+            "delete_plan": ["view_plan"],
+        }
+
+    @staticmethod
+    def get_fused_guidance() -> str:
+        """单次调用模式的指导：列出全部意图及其指导，要求模型在回复的同时给出意图"""
+        template_str = """
+        每轮回复都必须调用 route_turn 给出用户最新一句话的 intent，可选值及处理方式：
+        {% for intent, guidance in guidance_map.items() %}
+        - {{ intent }}: {{ guidance }}
+        {% endfor %}
+        - generate_plan / update_plan / delete_plan: 用户想制定、更新或删除计划。只需调用 route_turn 给出 intent，reply 留空，计划由专门的模块处理。
+        需要数据时，在调用 route_turn 的同时调用相应工具；可以直接回答时，把回复写在 route_turn 的 reply 中。
+        """
+        template = Template(template_str, trim_blocks=True, lstrip_blocks=True)
+        return template.render(guidance_map=PromptManager.get_intent_guidance_map())
+
+    @staticmethod
+    def get_response_templates() -> Dict[str, Dict[str, Any]]:
+        """只读意图的回复模板：工具结果形状符合时直接渲染回复，不再调用 LLM
+
+        tool 为该意图对应的只读工具；用户消息包含 llm_followup_words 中的词（需要分析或建议）时仍交给 LLM 回复。
+        渲染结果会去掉每行首尾空白和空行。
+        """
+        return {
+            "review_plan": {
+                "tool": "view_plan",
+                "llm_followup_words": ["为什么", "怎么", "如何", "建议", "分析", "调整", "能不能", "来得及", "合理"],
+                "template": """
+                {% if not plans %}
+                你目前没有进行中的计划。想制定一个储蓄或消费节制计划吗？
+                {% else %}
+                你目前有 {{ plans|length }} 个进行中的计划：
+                {% for p in plans %}
+                {{ loop.index }}. {{ p.content }}（{{ p.plan_type }}，ID {{ p.id }}）
+                {%- if p.goal_amount %}：目标 {{ "%.2f"|format(p.goal_amount) }} 元
+                {%- if p.amount_achieved is number %}，{{ "已存" if p.kind == "saving" else "已花费" }} {{ "%.2f"|format(p.amount_achieved) }} 元{% endif %}
+                {%- endif %}
+                {%- if p.status_label %}，{{ p.status_label }}{% endif %}
+                {%- if p.projected_completion and p.progress_status != "achieved" %}，预计 {{ p.projected_completion }} {{ "完成" if p.kind == "saving" else "用完额度" }}{% endif %}。
+                {% endfor %}
+                需要调整哪个计划可以告诉我。
+                {% endif %}
+                """,
+            },
+            "view_recent_expenses": {
+                "tool": "view_recent_expenses",
+                "llm_followup_words": ["为什么", "怎么", "如何", "建议", "分析", "哪些是", "冲动", "值得", "多不多", "合理"],
+                "template": """
+                {% if not expenses %}
+                {{ "还没有支出记录。" if first_page else "没有更早的支出记录了。" }}
+                {% else %}
+                {{ "最近" if first_page else "更早" }}的 {{ expenses|length }} 笔支出：
+                {% for e in expenses %}
+                - {{ ((e.timestamp[:10] ~ " ") if e.timestamp else "") ~ e.description }} {{ "%.2f"|format(e.amount or 0) }} 元{{ "（" ~ e.category ~ "）" if e.category else "" }}
+                {% endfor %}
+                合计 {{ "%.2f"|format(total) }} 元。{% if has_more %}想看更早的记录可以继续告诉我。{% endif %}
+                {% endif %}
+                """,
+            },
+        }
+
+    @staticmethod
+    def get_report_narrative_prompt(report: Dict[str, Any]) -> str:
+        """月度报告点评的提示词"""
+        template_str = """
+        <system>
+        你是 PocketWise 的月度报告撰写模块。根据 <report> 中已统计好的数据，为用户写一段不超过 120 字的月度点评。
+        只使用报告中的数字，不要编造；语气温暖、鼓励，指出一个做得好的地方和一个可以改进的地方。
+        </system>
+
+        <report>
+        {{ report_json }}
+        </report>
+        """
+        template = Template(template_str)
+        return template.render(report_json=json.dumps(report, ensure_ascii=False))
+
     @staticmethod
     def summarize_character_prompt(hum_msg: List[str]) -> str:
         """总结用户性格的提示词"""
@@ -147,9 +249,10 @@ def get_intent_prompt() -> str:
     """获取意图识别提示词"""
     return PromptManager.get_intent_recognition_prompt()
 
-def get_chatbot_prompt(user_id: str, profile: Dict[str, Any], extra_guidance: str = "") -> str:
+def get_chatbot_prompt(user_id: str, profile: Dict[str, Any], extra_guidance: str = "",
+                       recalled_memory: str = "") -> str:
     """获取chatbot系统提示词"""
-    return PromptManager.get_chatbot_system_prompt(user_id, profile, extra_guidance)
+    return PromptManager.get_chatbot_system_prompt(user_id, profile, extra_guidance, recalled_memory)
 
 def get_plan_prompt() -> str:
     """获取计划生成提示词"""
@@ -159,6 +262,22 @@ def get_guidance_map() -> Dict[str, str]:
     """获取意图指导映射"""
     return PromptManager.get_intent_guidance_map()
 
+def get_intent_tool_map() -> Dict[str, List[str]]:
+    """获取意图到工具的映射"""
+    return PromptManager.get_intent_tool_map()
+
+def get_fused_guidance() -> str:
+    """获取单次调用模式的意图指导"""
+    return PromptManager.get_fused_guidance()
+
+def get_response_templates() -> Dict[str, Dict[str, Any]]:
+    """获取只读意图的回复模板配置"""
+    return PromptManager.get_response_templates()
+
+def get_report_narrative_prompt(report: Dict[str, Any]) -> str:
+    """获取月度报告点评提示词"""
+    return PromptManager.get_report_narrative_prompt(report)
+
 def get_summarize_character_prompt(hum_msg: List[str]) -> str:
     """获取总结用户性格的提示词"""
     return PromptManager.summarize_character_prompt(hum_msg)
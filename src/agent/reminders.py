@@ -0,0 +1,213 @@
+"""计划阶段提醒调度：数据库中按 next_fire_at 索引的提醒表 + 进程内分层时间轮。
+
+提醒行由 add_plan / update_plan 维护（database.plan_reminders，每个计划一行）。调度线程每隔
+RELOAD_SECONDS 按索引读出 LOAD_AHEAD_SECONDS 内到期的提醒放入时间轮，内存只与近期窗口内的
+提醒数有关，与提醒总数无关；到期时经 database.fire_reminder 原子地推进 next_fire_at 并写入
+待送达消息（多个进程同时运行调度器也只会触发一次），再回调订阅者。
+重启后首次加载会取出所有已过期未触发的提醒立即补发。时间轮为空时线程只在下一次加载时醒来。
+
+用法：
+    python reminders.py    # 前台运行调度器，把触发的提醒打印到终端
+"""
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# 从数据库加载提醒的间隔，以及每次加载的提前量（须大于加载间隔，窗口之间不留空隙）
+RELOAD_SECONDS = 300
+LOAD_AHEAD_SECONDS = 600
+# 时间轮的精度（秒）
+TICK_SECONDS = 1.0
+
+
+class TimingWheel:
+    """分层时间轮：每层 slots 个槽，第 i 层每槽跨 slots**i 个 tick。
+
+    插入 O(1)；推进时每个 tick 只处理当前槽，高层槽在跨越边界时整体下放到低层（摊还 O(1)）。
+    同一 key 重复插入时以最后一次为准，旧条目在轮到时惰性丢弃。
+    """
+
+    def __init__(self, tick: float = TICK_SECONDS, slots: int = 64, levels: int = 4, now: float = None):
+        """从 now（默认当前时间）开始计时，最远可直接放置 slots**levels 个 tick 之后的条目"""
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._spans = [slots ** i for i in range(levels + 1)]
+        self._wheels: List[List[list]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        # 已处理到的 tick
+        self._current = int((time.time() if now is None else now) // tick)
+        # key -> 条目 [到期 tick, key, 到期时间]
+        self._entries: Dict[Hashable, list] = {}
+
+    def __len__(self) -> int:
+        """尚未触发的条目数"""
+        return len(self._entries)
+
+    def _place(self, entry: list):
+        delay = entry[0] - self._current
+        for level in range(self.levels):
+            if delay <= self._spans[level + 1]:
+                target = entry[0]
+                break
+        else:
+            # 超出最高层范围时先放在最高层最远的槽，下放时再按真实到期时间重新放置
+            level = self.levels - 1
+            target = self._current + self._spans[self.levels]
+        self._wheels[level][(target // self._spans[level]) % self.slots].append(entry)
+
+    def schedule(self, key: Hashable, due: float):
+        """在 due（epoch 秒）时触发 key；已过期的在下一个 tick 触发"""
+        existing = self._entries.get(key)
+        if existing is not None and existing[2] == due:
+            return
+        entry = [max(math.ceil(due / self.tick), self._current + 1), key, due]
+        self._entries[key] = entry
+        self._place(entry)
+
+    def cancel(self, key: Hashable):
+        """取消 key 的定时，不存在时忽略"""
+        self._entries.pop(key, None)
+
+    def advance(self, now: float = None) -> List[Tuple[Hashable, float]]:
+        """推进到 now，返回期间到期的 [(key, 到期时间)]"""
+        target = int((time.time() if now is None else now) // self.tick)
+        fired = []
+        while self._current < target:
+            if not self._entries:
+                self._current = target
+                break
+            tick = self._current + 1
+            # 从高层到低层下放跨越边界的槽，下放到的低层槽可能在同一 tick 继续下放
+            for level in range(self.levels - 1, 0, -1):
+                if tick % self._spans[level] == 0:
+                    slot = self._wheels[level][(tick // self._spans[level]) % self.slots]
+                    self._wheels[level][(tick // self._spans[level]) % self.slots] = []
+                    for entry in slot:
+                        if self._entries.get(entry[1]) is entry:
+                            self._place(entry)
+            self._current = tick
+            slot = self._wheels[0][tick % self.slots]
+            self._wheels[0][tick % self.slots] = []
+            for entry in slot:
+                if self._entries.get(entry[1]) is entry:
+                    del self._entries[entry[1]]
+                    fired.append((entry[1], entry[2]))
+        return fired
+
+
+class ReminderScheduler:
+    """后台线程：定期从各分片加载近期提醒，到期后触发并回调订阅者
+
+    前端可以 subscribe(callback) 实时接收提醒，也可以在展示对话时调用
+    database.pop_reminder_messages(user_id) 取出离线期间积累的提醒。
+    """
+
+    def __init__(self, reload_seconds: float = RELOAD_SECONDS, load_ahead: float = LOAD_AHEAD_SECONDS,
+                 tick: float = TICK_SECONDS):
+        """每隔 reload_seconds 加载 load_ahead 秒内到期的提醒，load_ahead 至少比加载间隔多一个 tick"""
+        self.reload_seconds = reload_seconds
+        self.load_ahead = max(load_ahead, reload_seconds + tick)
+        self.wheel = TimingWheel(tick)
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._next_reload = 0.0
+        self._metrics = {"loaded": 0, "fired": 0, "stale": 0, "callback_errors": 0}
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        """callback(reminder) 在调度线程中调用，reminder 含 user_id/plan_id/stage/message"""
+        self._listeners.append(callback)
+
+    def load(self, now: float = None):
+        """按索引加载 now + load_ahead 之前到期的提醒（含停机期间错过的）"""
+        now = time.time() if now is None else now
+        loaded = 0
+        for path in db.all_db_paths():
+            for user_id, plan_id, due in db.load_due_reminders(path, now + self.load_ahead):
+                self.wheel.schedule((user_id, plan_id), due)
+                loaded += 1
+        self._metrics["loaded"] += loaded
+        self._next_reload = now + self.reload_seconds
+
+    def run_once(self, now: float = None) -> List[Dict[str, Any]]:
+        """到了加载时间先加载，再推进时间轮并触发到期提醒，返回本次送达的提醒"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if now >= self._next_reload:
+                self.load(now)
+            due = self.wheel.advance(now)
+        delivered = []
+        for (user_id, plan_id), due_at in due:
+            reminder = db.fire_reminder(user_id, plan_id, due_at)
+            if reminder is None:
+                self._metrics["stale"] += 1
+                continue
+            self._metrics["fired"] += 1
+            delivered.append(reminder)
+            for callback in self._listeners:
+                try:
+                    callback(reminder)
+                except Exception:
+                    self._metrics["callback_errors"] += 1
+                    logger.exception("Plan reminder callback failed for plan %s", reminder.get("plan_id"))
+        return delivered
+
+    def _sleep_seconds(self) -> float:
+        # 时间轮为空时一直睡到下一次加载
+        if not len(self.wheel):
+            return max(0.0, self._next_reload - time.time())
+        return self.wheel.tick
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # 出错后在下一次唤醒时重试，不让调度线程退出
+                logger.exception("Plan reminder scheduler iteration failed")
+            self._stop.wait(self._sleep_seconds())
+
+    def start(self) -> "ReminderScheduler":
+        """启动后台调度线程，已启动时不重复启动"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="plan-reminders", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止调度线程并等待其退出"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def metrics(self) -> Dict[str, Any]:
+        """累计加载、触发、过期和回调出错的次数，以及时间轮中的提醒数"""
+        return {**self._metrics, "scheduled": len(self.wheel)}
+
+
+def main():
+    db.init_db()
+    scheduler = ReminderScheduler()
+    scheduler.subscribe(lambda r: print(f"[{r['user_id']}] {r['message']}", flush=True))
+    scheduler.start()
+    print("提醒调度器已启动，Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""批量生成月度报告：按分片流式读取 users 表，多进程用 SQL 聚合每个用户的当月数据。
+
+报告包括类别支出、预算执行、计划进度和被规则引擎标记的冲动消费，
+写入各分片的 reports 表或 JSONL 文件；可选调用 LLM 批量生成简短点评。
+用法：
+    python reports.py [--month 2026-09] [--workers 4] [--chunk 500] [--output table|files] [--out-dir reports]
+    python reports.py --narrative --llm-concurrency 8
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import database as db
+import impulse_rules
+from spending_stats import RunningStats
+
+REPORT_CHUNK_SIZE = 500
+MAX_IMPULSE_FLAGS = 5
+# 计算 recent_avg 时参考的前序支出笔数，与 detect_impulse_buying 读取的最近支出数一致
+RECENT_WINDOW = 5
+
+
+def _round(value: float) -> float:
+    return round(float(value or 0), 2)
+
+
+def month_range(month: str = None) -> Tuple[date, date]:
+    """返回 [月初, 下月初)，month 形如 '2026-09'，默认上个月"""
+    if month:
+        start = datetime.strptime(month, "%Y-%m").date()
+    else:
+        today = datetime.now().date()
+        index = today.year * 12 + today.month - 2
+        start = date(index // 12, index % 12 + 1, 1)
+    index = start.year * 12 + start.month
+    return start, date(index // 12, index % 12 + 1, 1)
+
+
+def iter_user_chunks(path: str, chunk_size: int = REPORT_CHUNK_SIZE) -> Iterator[List[Tuple[str, str]]]:
+    """按 user_id 键集分页流式读取分片中的用户档案"""
+    conn = sqlite3.connect(path)
+    try:
+        last = ""
+        while True:
+            rows = conn.execute("SELECT user_id, profile_json FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                                (last, chunk_size)).fetchall()
+            if not rows:
+                break
+            yield rows
+            last = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def _placeholders(values) -> str:
+    return ", ".join("?" for _ in values)
+
+
+def _category_totals(conn: sqlite3.Connection, source: str, user_ids: List[str], start_ts: int, end_ts: int):
+    rows = conn.execute(
+        f"""SELECT user_id, COALESCE(NULLIF(category, ''), '未分类') AS cat, SUM(amount), COUNT(*)
+            FROM {source} WHERE user_id IN ({_placeholders(user_ids)}) AND ts >= ? AND ts < ?
+            GROUP BY user_id, cat ORDER BY user_id, SUM(amount) DESC""",
+        (*user_ids, start_ts, end_ts))
+    totals: Dict[str, List[Tuple[str, float, int]]] = {}
+    for user_id, cat, total, count in rows:
+        totals.setdefault(user_id, []).append((cat, total or 0, count))
+    return totals
+
+
+def _impulse_flags(conn: sqlite3.Connection, source: str, user_ids: List[str], start_ts: int, end_ts: int,
+                   profiles: Dict[str, Dict]) -> Dict[str, List[Dict[str, Any]]]:
+    """用窗口函数还原每笔支出发生时的当月已花费和最近平均金额，连同用户的支出统计交给规则引擎打分
+
+    统计与 detect_impulse_buying 读取的是同一份 spending_stats，两处按同一套规则判断。
+    """
+    rows = conn.execute(
+        f"""SELECT id, user_id, description, amount, category,
+                   COALESCE(SUM(amount) OVER (PARTITION BY user_id ORDER BY ts, id
+                                              ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0),
+                   AVG(amount) OVER (PARTITION BY user_id ORDER BY ts, id
+                                     ROWS BETWEEN {RECENT_WINDOW} PRECEDING AND 1 PRECEDING)
+            FROM {source} WHERE user_id IN ({_placeholders(user_ids)}) AND ts >= ? AND ts < ?""",
+        (*user_ids, start_ts, end_ts)).fetchall()
+    stats: Dict[Tuple[str, str], Optional[RunningStats]] = {}
+
+    def user_stats(user_id: str, category: str) -> Optional[RunningStats]:
+        key = (user_id, category or "")
+        if key not in stats:
+            stats[key] = db.read_spending_stats(conn, *key)
+        return stats[key]
+
+    flags: Dict[str, List[Dict[str, Any]]] = {}
+    for expense_id, user_id, description, amount, category, month_spent, recent_avg in rows:
+        profile = profiles.get(user_id) or {}
+        features = impulse_rules.compute_features(amount or 0, profile.get("monthly_budget", 0) or 0,
+                                                  recent_avg or 0, profile.get("personality_tags", []), month_spent,
+                                                  user_stats(user_id, ""),
+                                                  user_stats(user_id, category) if category else None)
+        assessment = impulse_rules.engine.assess(features, description or "",
+                                                 profile.get("trigger_keywords", []), category)
+        if assessment["is_impulse"] or assessment["is_suspicious"]:
+            flags.setdefault(user_id, []).append({
+                "id": expense_id,
+                "description": description,
+                "amount": _round(amount),
+                "category": category,
+                "score": assessment["score"],
+                "is_impulse": assessment["is_impulse"],
+                "reasons": assessment["reasons"],
+            })
+    return flags
+
+
+def _plans(conn: sqlite3.Connection, user_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        f"""SELECT p.id, p.user_id, p.plan_type, p.content, p.start_date, p.goal_amount, p.stages_amount,
+                   g.amount_achieved
+            FROM plans p LEFT JOIN plan_progress g ON g.plan_id = p.id
+            WHERE p.user_id IN ({_placeholders(user_ids)}) AND p.status = 'active'""",
+        user_ids).fetchall()
+    conn.row_factory = None
+    plans: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        plan = db.with_live_progress(dict(row))
+        plans.setdefault(plan.pop("user_id"), []).append(plan)
+    return plans
+
+
+def build_chunk_reports(path: str, month: str, users: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """在工作进程中为一批同分片用户生成报告（每类数据一次聚合查询）"""
+    start, end = month_range(month)
+    start_ts, end_ts = db.to_epoch(start), db.to_epoch(end)
+    user_ids = [user_id for user_id, _ in users]
+    profiles = {user_id: json.loads(profile_json or "{}") for user_id, profile_json in users}
+
+    conn = sqlite3.connect(path)
+    try:
+        source = db.expense_source(conn, start.isoformat())
+        totals = _category_totals(conn, source, user_ids, start_ts, end_ts)
+        flags = _impulse_flags(conn, source, user_ids, start_ts, end_ts, profiles)
+        plans = _plans(conn, user_ids)
+    finally:
+        conn.close()
+
+    reports = []
+    for user_id in user_ids:
+        categories = totals.get(user_id, [])
+        spent = sum(total for _, total, _ in categories)
+        budget = profiles[user_id].get("monthly_budget", 0) or 0
+        user_flags = sorted(flags.get(user_id, []), key=lambda f: (f["score"], f["amount"]), reverse=True)
+        report = {
+            "user_id": user_id,
+            "month": month,
+            "total": _round(spent),
+            "count": sum(count for _, _, count in categories),
+            "by_category": [
+                {"category": cat, "total": _round(total), "count": count,
+                 "share": round(total / spent, 3) if spent else 0}
+                for cat, total, count in categories
+            ],
+            "budget": {"monthly_budget": _round(budget)},
+            "plans": plans.get(user_id, []),
+            "impulse_count": sum(f["is_impulse"] for f in user_flags),
+            "suspicious_count": sum(not f["is_impulse"] for f in user_flags),
+            "impulse_flags": user_flags[:MAX_IMPULSE_FLAGS],
+        }
+        if budget:
+            report["budget"].update({
+                "used": round(spent / budget, 3),
+                "remaining": _round(budget - spent),
+                "within_budget": spent <= budget,
+            })
+        reports.append(report)
+    return reports
+
+
+def add_narratives(reports: List[Dict[str, Any]], concurrency: int) -> None:
+    """为有支出的报告批量生成点评（最低优先级，限额紧张时推迟），单个请求失败或被限流丢弃只跳过该用户"""
+    from langchain_core.messages import HumanMessage
+    from model import llm_batch
+    from prompts import get_report_narrative_prompt
+
+    targets = [r for r in reports if r["count"]]
+    if not targets:
+        return
+    inputs = [[HumanMessage(content=get_report_narrative_prompt(r))] for r in targets]
+    responses = llm_batch.batch(inputs, config={"max_concurrency": concurrency}, return_exceptions=True)
+    for report, response in zip(targets, responses):
+        if not isinstance(response, Exception):
+            report["narrative"] = str(response.content).strip()
+
+
+def write_reports_table(path: str, reports: List[Dict[str, Any]]) -> None:
+    created_at = datetime.now().isoformat()
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO reports (user_id, month, report_json, narrative, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(r["user_id"], r["month"], json.dumps(r, ensure_ascii=False), r.get("narrative"), created_at)
+                 for r in reports])
+    finally:
+        conn.close()
+
+
+def generate_reports(month: str = None, workers: int = None, chunk_size: int = REPORT_CHUNK_SIZE,
+                     output: str = "table", out_dir: str = "reports", narrative: bool = False,
+                     llm_concurrency: int = 8) -> Dict[str, Any]:
+    """生成所有分片中全部用户的月度报告，返回统计信息"""
+    month = month or month_range()[0].strftime("%Y-%m")
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    stats = {"month": month, "users": 0, "with_spending": 0, "flagged_users": 0}
+
+    out_file = None
+    if output == "files":
+        os.makedirs(out_dir, exist_ok=True)
+        out_file = open(os.path.join(out_dir, f"report-{month}.jsonl"), "w", encoding="utf-8")
+
+    def handle(path: str, reports: List[Dict[str, Any]]):
+        if narrative:
+            add_narratives(reports, llm_concurrency)
+        if out_file is not None:
+            out_file.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in reports)
+        else:
+            # 只有主进程写库，避免多个进程争抢同一分片的写锁
+            write_reports_table(path, reports)
+        stats["users"] += len(reports)
+        stats["with_spending"] += sum(1 for r in reports if r["count"])
+        stats["flagged_users"] += sum(1 for r in reports if r["impulse_count"])
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            pending = {}
+            for path in db.all_db_paths():
+                for users in iter_user_chunks(path, chunk_size):
+                    # 限制在途批次数，用户表不会被整体读入内存
+                    while len(pending) >= workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            handle(pending.pop(future), future.result())
+                    pending[pool.submit(build_chunk_reports, path, month, users)] = path
+            for future in list(pending):
+                handle(pending.pop(future), future.result())
+    finally:
+        if out_file is not None:
+            out_file.close()
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量生成 PocketWise 月度报告")
+    parser.add_argument("--month", default=None, help="报告月份，形如 2026-09，默认上个月")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认 CPU 数")
+    parser.add_argument("--chunk", type=int, default=REPORT_CHUNK_SIZE, help="每批处理的用户数")
+    parser.add_argument("--output", choices=("table", "files"), default="table", help="写入 reports 表或 JSONL 文件")
+    parser.add_argument("--out-dir", default="reports", help="--output files 时的输出目录")
+    parser.add_argument("--narrative", action="store_true", help="调用 LLM 为每份报告生成点评")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="生成点评时的最大并发请求数")
+    args = parser.parse_args()
+
+    db.init_db()
+    stats = generate_reports(args.month, args.workers, args.chunk, args.output, args.out_dir,
+                             args.narrative, args.llm_concurrency)
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
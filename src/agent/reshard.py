@@ -0,0 +1,170 @@
+"""离线重新分片：按新的分片数把用户数据迁移到一致性哈希指定的数据库文件。
+
+用法（迁移期间需停止服务，完成后把 DB_SHARDS 改为新的分片数）：
+    python reshard.py --from-shards 1 --to-shards 4 [--dry-run]
+"""
+import argparse
+import sqlite3
+from typing import Dict, List
+
+import database as db
+import maintenance
+from sharding import ShardRouter
+
+# 按用户存储的表及其主键处理方式：
+#   keep    —— 以 user_id 为主键的表，原样复制
+#   new     —— 自增 id，在目标分片重新分配
+#   archive —— 归档表的 id 取自 expenses 的序列，需要在目标分片预留
+#   plan    —— 同 new，同时记录新旧 plan id 的映射
+#   plan_ref —— 以 plan_id 关联计划的表，按映射改写 plan_id（须排在 plans 之后）
+USER_TABLES = [
+    ("users", "keep"),
+    ("monthly_expense_summary", "keep"),
+    ("reports", "keep"),
+    ("spending_stats", "keep"),
+    ("expense_parse_log", "keep"),
+    ("sessions", "keep"),
+    ("expenses", "new"),
+    ("expenses_archive", "archive"),
+    ("tool_calls", "new"),
+    ("conversation_memory", "new"),
+    ("plans", "plan"),
+    ("plan_progress", "plan_ref"),
+    ("plan_reminders", "plan_ref"),
+]
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+
+
+def _users_in_shard(conn: sqlite3.Connection) -> List[str]:
+    union = " UNION ".join(f"SELECT user_id FROM main.{table}" for table, _ in USER_TABLES)
+    return [row[0] for row in conn.execute(f"SELECT user_id FROM ({union}) WHERE user_id IS NOT NULL")]
+
+
+def _reserve_expense_ids(conn: sqlite3.Connection, count: int) -> int:
+    """在目标分片的 expenses 序列中预留 count 个 id，返回预留前的序列值"""
+    row = conn.execute("SELECT seq FROM dst.sqlite_sequence WHERE name = 'expenses'").fetchone()
+    if row is None:
+        seq = conn.execute("""SELECT MAX(COALESCE((SELECT MAX(id) FROM dst.expenses), 0),
+                                         COALESCE((SELECT MAX(id) FROM dst.expenses_archive), 0))""").fetchone()[0]
+        conn.execute("INSERT INTO dst.sqlite_sequence (name, seq) VALUES ('expenses', ?)", (seq + count,))
+    else:
+        seq = row[0]
+        conn.execute("UPDATE dst.sqlite_sequence SET seq = ? WHERE name = 'expenses'", (seq + count,))
+    return seq
+
+
+def _align_archive_cutoff(conn: sqlite3.Connection, user_id: str):
+    """迁移前让两个分片对 user_id 使用同一条归档水位线
+
+    analytics 认为水位线所在月之前的月份已整月汇总，只读 monthly_expense_summary，
+    所以水位线较旧的一方要先把水位线之间的支出归档并汇总：迁出用户较旧时只归档该用户，
+    目标分片较旧时归档目标分片的全部用户并推进其水位线。
+    """
+    src_cutoff = db.get_archive_cutoff(conn)
+    row = conn.execute("SELECT value FROM dst.meta WHERE key = 'archive_cutoff'").fetchone()
+    dst_cutoff = row[0] if row else ""
+    if src_cutoff < dst_cutoff:
+        maintenance.archive_before(conn, dst_cutoff, user_id=user_id)
+    elif src_cutoff > dst_cutoff:
+        maintenance.archive_before(conn, src_cutoff, schema="dst")
+        conn.execute("INSERT OR REPLACE INTO dst.meta (key, value) VALUES ('archive_cutoff', ?)", (src_cutoff,))
+
+
+def _move_user(conn: sqlite3.Connection, user_id: str) -> Dict[int, int]:
+    """在同一事务内把 user_id 的数据从 main 移到 dst，返回 plan id 映射"""
+    plan_ids: Dict[int, int] = {}
+    _align_archive_cutoff(conn, user_id)
+    for table, mode in USER_TABLES:
+        columns = _columns(conn, table)
+        if mode == "keep":
+            cols = ", ".join(columns)
+            conn.execute(f"INSERT OR REPLACE INTO dst.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE user_id = ?",
+                         (user_id,))
+        elif mode == "new":
+            cols = ", ".join(c for c in columns if c != "id")
+            conn.execute(f"INSERT INTO dst.{table} ({cols}) SELECT {cols} FROM main.{table} WHERE user_id = ? ORDER BY id",
+                         (user_id,))
+        elif mode == "archive":
+            count = conn.execute(f"SELECT COUNT(*) FROM main.{table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if count:
+                base = _reserve_expense_ids(conn, count)
+                cols = ", ".join(c for c in columns if c != "id")
+                conn.execute(f"""INSERT INTO dst.{table} (id, {cols})
+                                 SELECT ? + ROW_NUMBER() OVER (ORDER BY id), {cols}
+                                 FROM main.{table} WHERE user_id = ?""",
+                             (base, user_id))
+        elif mode == "plan":
+            cols = [c for c in columns if c != "id"]
+            placeholders = ", ".join("?" for _ in cols)
+            rows = conn.execute(f"SELECT id, {', '.join(cols)} FROM main.{table} WHERE user_id = ? ORDER BY id",
+                                (user_id,)).fetchall()
+            for row in rows:
+                cur = conn.execute(f"INSERT INTO dst.{table} ({', '.join(cols)}) VALUES ({placeholders})", row[1:])
+                plan_ids[row[0]] = cur.lastrowid
+        elif mode == "plan_ref":
+            placeholders = ", ".join("?" for _ in columns)
+            plan_col = columns.index("plan_id")
+            for row in conn.execute(f"SELECT {', '.join(columns)} FROM main.{table} WHERE user_id = ?",
+                                    (user_id,)).fetchall():
+                row = list(row)
+                if row[plan_col] not in plan_ids:
+                    continue
+                row[plan_col] = plan_ids[row[plan_col]]
+                conn.execute(f"INSERT INTO dst.{table} ({', '.join(columns)}) VALUES ({placeholders})", row)
+        conn.execute(f"DELETE FROM main.{table} WHERE user_id = ?", (user_id,))
+    return plan_ids
+
+
+def reshard(from_shards: int, to_shards: int, dry_run: bool = False) -> Dict[str, int]:
+    """把每个用户迁移到新分片数下的归属分片，返回各目标文件迁入的用户数"""
+    old_router = ShardRouter(db.DB_PATH, from_shards)
+    new_router = ShardRouter(db.DB_PATH, to_shards)
+    for path in new_router.paths():
+        db.init_shard(path)
+
+    moved: Dict[str, int] = {}
+    for src_path in old_router.paths():
+        db.init_shard(src_path)
+        conn = sqlite3.connect(src_path, isolation_level=None)
+        try:
+            for user_id in _users_in_shard(conn):
+                dst_path = new_router.path_for(user_id)
+                if dst_path == src_path:
+                    continue
+                moved[dst_path] = moved.get(dst_path, 0) + 1
+                if dry_run:
+                    continue
+                conn.execute("ATTACH DATABASE ? AS dst", (dst_path,))
+                try:
+                    # 跨文件的单个事务，迁移中断不会出现一半数据在新分片
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        _move_user(conn, user_id)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        conn.execute("ROLLBACK")
+                        raise
+                finally:
+                    conn.execute("DETACH DATABASE dst")
+        finally:
+            conn.close()
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PocketWise 离线重新分片")
+    parser.add_argument("--from-shards", type=int, required=True)
+    parser.add_argument("--to-shards", type=int, required=True)
+    parser.add_argument("--dry-run", action="store_true", help="只统计需要迁移的用户")
+    args = parser.parse_args()
+    moved = reshard(args.from_shards, args.to_shards, args.dry_run)
+    for path, count in sorted(moved.items()):
+        print(f"{path}: {count} 个用户")
+    print(f"共迁移 {sum(moved.values())} 个用户，请将 DB_SHARDS 设为 {args.to_shards}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""多用户会话管理：按 (user_id, session_id) 隔离对话线程，空闲会话换出到数据库。"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+import database as db
+from env_utils import SESSION_IDLE_SECONDS, SESSION_MAX_LIVE
+
+DEFAULT_SESSION_ID = "default"
+# 计划 agent 与主对话共用 checkpointer，线程 id 为 "<会话线程>:<后缀>"（与 GraphConstants.PLAN_AGENT_THREAD_ID 一致）
+PLAN_THREAD_SUFFIX = "plan_agent"
+
+
+def session_thread_id(user_id: str, session_id: str = DEFAULT_SESSION_ID) -> str:
+    return f"{user_id}:{session_id}"
+
+
+class _Session:
+    __slots__ = ("user_id", "thread_id", "lock", "last_active", "evicted", "restored")
+
+    def __init__(self, user_id: str, thread_id: str):
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.lock = threading.Lock()
+        self.last_active = time.monotonic()
+        self.evicted = False
+        self.restored = False
+
+
+class SessionManager:
+    """多个用户会话复用同一张编译好的图
+
+    - (user_id, session_id) 映射到独立的 thread_id，互不串话
+    - 同一会话的多轮请求串行执行，不同会话可并行
+    - 内存中只保留最近使用的 max_sessions 个会话，空闲超过 idle_seconds 或超出上限时，
+      把最新 checkpoint 写入数据库 sessions 表并从内存 checkpointer 中删除，下次访问时恢复
+    """
+
+    def __init__(self, app, checkpointer, max_sessions: int = SESSION_MAX_LIVE,
+                 idle_seconds: float = SESSION_IDLE_SECONDS, sweep_interval: float = 60):
+        """App 为编译好的图，checkpointer 为它使用的内存 checkpointer；每隔 sweep_interval 秒清理一次空闲会话"""
+        self.app = app
+        self.checkpointer = checkpointer
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.sweep_interval = sweep_interval
+        self._sessions: OrderedDict[Tuple[str, str], _Session] = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._metrics = {"evicted": 0, "restored": 0}
+
+    def run(self, user_id: str, text: str, session_id: str = DEFAULT_SESSION_ID) -> Dict[str, Any]:
+        """在会话中处理一条用户消息，返回图的最终状态"""
+        key = (user_id, session_id)
+        session = self._acquire(key)
+        try:
+            if not session.restored:
+                self._restore(session)
+            config = {"configurable": {"thread_id": session.thread_id}}
+            return self.app.invoke({"user_id": user_id, "messages": [("user", text)]}, config=config)
+        finally:
+            session.last_active = time.monotonic()
+            session.lock.release()
+            self._evict_if_needed()
+
+    def _acquire(self, key: Tuple[str, str]) -> _Session:
+        """取得会话并持有其锁；会话正被淘汰时等待淘汰完成后重新创建"""
+        while True:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is None:
+                    session = _Session(key[0], session_thread_id(*key))
+                    self._sessions[key] = session
+                self._sessions.move_to_end(key)
+            session.lock.acquire()
+            if not session.evicted:
+                return session
+            session.lock.release()
+
+    def _config(self, thread_id: str) -> Dict[str, Any]:
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+    def _restore(self, session: _Session):
+        """内存中没有该会话的 checkpoint 时，从数据库恢复最近一次淘汰时保存的状态"""
+        session.restored = True
+        if self.checkpointer.get_tuple(self._config(session.thread_id)) is not None:
+            return
+        saved = db.load_session_checkpoint(session.user_id, session.thread_id)
+        if saved is None:
+            return
+        checkpoint, metadata = self.checkpointer.serde.loads_typed(saved)
+        self.checkpointer.put(self._config(session.thread_id), checkpoint, metadata,
+                              checkpoint["channel_versions"])
+        with self._lock:
+            self._metrics["restored"] += 1
+
+    def _evict(self, key: Tuple[str, str], session: _Session):
+        """保存最新 checkpoint 后释放内存（调用方持有会话锁）"""
+        latest = self.checkpointer.get_tuple(self._config(session.thread_id))
+        if latest is not None:
+            checkpoint_type, data = self.checkpointer.serde.dumps_typed((latest.checkpoint, latest.metadata))
+            db.save_session_checkpoint(session.user_id, session.thread_id, checkpoint_type, data)
+        self.checkpointer.delete_thread(session.thread_id)
+        self.checkpointer.delete_thread(f"{session.thread_id}:{PLAN_THREAD_SUFFIX}")
+        session.evicted = True
+        with self._lock:
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+            self._metrics["evicted"] += 1
+
+    def _victims(self, force_idle: bool) -> List[Tuple[Tuple[str, str], _Session]]:
+        """按 LRU 顺序挑出超出上限或空闲超时、且当前没有在处理请求的会话（已持有其锁）"""
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            overflow = len(self._sessions) - self.max_sessions
+            for key, session in self._sessions.items():
+                idle = force_idle and now - session.last_active > self.idle_seconds
+                if overflow <= 0 and not idle:
+                    # 越往后越是最近使用的会话
+                    break
+                if session.lock.acquire(blocking=False):
+                    victims.append((key, session))
+                    overflow -= 1
+        return victims
+
+    def _evict_if_needed(self):
+        now = time.monotonic()
+        sweep = now - self._last_sweep >= self.sweep_interval
+        if sweep:
+            self._last_sweep = now
+        elif len(self._sessions) <= self.max_sessions:
+            return
+        self.evict(sweep)
+
+    def evict(self, idle: bool = True) -> int:
+        """淘汰超出上限的会话；idle 为 True 时同时淘汰空闲超时的会话。返回淘汰数"""
+        victims = self._victims(idle)
+        for key, session in victims:
+            try:
+                self._evict(key, session)
+            finally:
+                session.lock.release()
+        return len(victims)
+
+    def close(self):
+        """把所有会话写回数据库（进程退出前调用）"""
+        with self._lock:
+            items = list(self._sessions.items())
+        for key, session in items:
+            with session.lock:
+                if not session.evicted:
+                    self._evict(key, session)
+
+    def metrics(self) -> Dict[str, Any]:
+        """内存中的会话数及累计换出、恢复次数"""
+        return {"live_sessions": len(self._sessions), **self._metrics}
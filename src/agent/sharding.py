@@ -0,0 +1,67 @@
+"""按 user_id 分片：一致性哈希把用户映射到若干个 SQLite 数据库文件。"""
+import bisect
+import hashlib
+from pathlib import Path
+from typing import List
+
+# 每个分片在哈希环上的虚拟节点数，越多分布越均匀
+VIRTUAL_NODES = 128
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class ConsistentHashRing:
+    """一致性哈希环：增减分片时只有约 1/N 的用户需要迁移"""
+
+    def __init__(self, shard_count: int, vnodes: int = VIRTUAL_NODES):
+        """每个分片在环上放 vnodes 个虚拟节点"""
+        self.shard_count = shard_count
+        points = []
+        for shard in range(shard_count):
+            for v in range(vnodes):
+                points.append((_hash(f"shard{shard}#{v}"), shard))
+        points.sort()
+        self._keys = [p[0] for p in points]
+        self._shards = [p[1] for p in points]
+
+    def shard_for(self, key: str) -> int:
+        """返回 key 顺时针方向遇到的第一个虚拟节点所属的分片"""
+        if self.shard_count == 1:
+            return 0
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._shards[i]
+
+
+class ShardRouter:
+    """把 user_id 映射到分片数据库文件
+
+    分片 0 使用 base_path 本身，因此单分片部署与原来的 pocketwise.db 完全一致；
+    其余分片为同目录下的 <stem>-shard<i>.db。
+    """
+
+    def __init__(self, base_path: str, shard_count: int = 1):
+        """base_path 为分片 0 的数据库文件，shard_count 小于 1 时按 1 处理"""
+        self.base_path = base_path
+        self.shard_count = max(1, int(shard_count))
+        self.ring = ConsistentHashRing(self.shard_count)
+
+    def shard_path(self, shard: int) -> str:
+        """第 shard 个分片的数据库文件路径"""
+        if shard == 0:
+            return self.base_path
+        base = Path(self.base_path)
+        return str(base.with_name(f"{base.stem}-shard{shard}{base.suffix}"))
+
+    def shard_for(self, user_id: str) -> int:
+        """user_id 所在的分片序号"""
+        return self.ring.shard_for(user_id or "")
+
+    def path_for(self, user_id: str) -> str:
+        """user_id 所在分片的数据库文件路径"""
+        return self.shard_path(self.shard_for(user_id))
+
+    def paths(self) -> List[str]:
+        """按分片序号排列的全部数据库文件路径"""
+        return [self.shard_path(i) for i in range(self.shard_count)]
@@ -0,0 +1,131 @@
+"""支出金额的流式统计：Welford 均值/方差和对数分桶分位数草图，可序列化后按用户存入数据库。"""
+import json
+import math
+from typing import Dict, Optional
+
+# 分位数草图的相对误差与最大桶数
+SKETCH_RELATIVE_ACCURACY = 0.02
+SKETCH_MAX_BUCKETS = 256
+# 样本数少于该值时不给出 z 分数和百分位，规则回退到近期平均
+MIN_HISTORY = 10
+
+
+class QuantileSketch:
+    """对数分桶的分位数草图（DDSketch）：O(1) 插入，分位数的相对误差不超过 relative_accuracy
+
+    桶数超过上限时合并最小的几个桶，只影响最低端的分位数。
+    """
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY, max_buckets: int = SKETCH_MAX_BUCKETS):
+        """relative_accuracy 决定对数桶的底数，max_buckets 为合并前允许的最大桶数"""
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value: float):
+        """计入一个样本，非正数单独计数"""
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.buckets)
+        merged = sum(self.buckets.pop(k) for k in keys[:len(keys) - self.max_buckets + 1])
+        target = keys[len(keys) - self.max_buckets]
+        self.buckets[target] = self.buckets.get(target, 0) + merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        """返回第 q 分位数的近似值"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+    def percentile_of(self, value: float) -> Optional[float]:
+        """返回 value 在历史样本中的百分位（0~1），同桶的样本按一半计入"""
+        if not self.count:
+            return None
+        if value <= 0:
+            return self.zeros / 2 / self.count
+        target = self._index(value)
+        below = self.zeros + sum(c for i, c in self.buckets.items() if i < target)
+        return (below + self.buckets.get(target, 0) / 2) / self.count
+
+    def to_json(self) -> str:
+        """序列化为紧凑的 JSON，存入 spending_stats.sketch"""
+        return json.dumps({"a": self.relative_accuracy, "z": self.zeros, "b": self.buckets}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text: str) -> "QuantileSketch":
+        """从 to_json 的结果还原草图"""
+        data = json.loads(text)
+        sketch = cls(data["a"])
+        sketch.zeros = data["z"]
+        sketch.buckets = {int(k): v for k, v in data["b"].items()}
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
+
+
+class RunningStats:
+    """单个用户（或用户 + 类别）的流式统计：Welford 均值/方差 + 分位数草图"""
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0, sketch: QuantileSketch = None):
+        """从数据库读出的 count/mean/m2 和草图恢复统计，默认为空"""
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.sketch = sketch or QuantileSketch()
+
+    def add(self, value: float):
+        """计入一笔支出金额"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sketch.add(value)
+
+    @property
+    def std(self) -> float:
+        """样本标准差，少于两个样本时为 0"""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def zscore(self, value: float) -> Optional[float]:
+        """返回 value 相对均值的 z 分数；样本不足 MIN_HISTORY 或标准差为 0 时返回 None"""
+        if self.count < MIN_HISTORY or not self.std:
+            return None
+        return (value - self.mean) / self.std
+
+    def percentile_of(self, value: float) -> Optional[float]:
+        """返回 value 在历史样本中的百分位；样本不足 MIN_HISTORY 时返回 None"""
+        if self.count < MIN_HISTORY:
+            return None
+        return self.sketch.percentile_of(value)
+
+    def summary(self) -> Dict[str, float]:
+        """样本数、均值、标准差与中位数/90 分位数，供工具结果展示"""
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 2),
+            "std": round(self.std, 2),
+            "p50": round(self.sketch.quantile(0.5) or 0, 2),
+            "p90": round(self.sketch.quantile(0.9) or 0, 2),
+        }
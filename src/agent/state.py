@@ -1,9 +1,12 @@
-from typing import Any, Annotated, Literal, TypedDict, List, Dict
+"""对话图的状态定义：意图类型、工具调用记录和 PocketWiseState。"""
+from typing import Annotated, Any, Dict, List, Literal, Optional, TypedDict
+
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
 
 Intent = Literal[
     "log_expense",  # 记录一笔消费
+    "view_recent_expenses",  # 查看支出记录
     "consult",  # 咨询某次消费/是否值得
     "generate_plan",  # 制定计划
     "update_plan",  # 更新计划
@@ -15,12 +18,15 @@ Intent = Literal[
 ]
 
 # 定义工具调用记录的类型
-ToolCallRecord = TypedDict('ToolCallRecord', {
-    'name': str,
-    'arguments': Dict[str, Any],
-    'result': str,
-    'timestamp': float # 可选，用于排序或显示
-})
+class ToolCallRecord(TypedDict):
+    name: str
+    arguments: Dict[str, Any]
+    result: str
+    timestamp: float  # 可选，用于排序或显示
+
+# state 中只保留最近 N 条工具调用记录，完整历史由 ToolExecutor 写入 tool_calls 表
+MAX_TOOL_HISTORY = 20
+
 # 定义一个合并 tool_call_history 的函数
 def merge_tool_histories(left: List[ToolCallRecord], right: List[ToolCallRecord]) -> List[ToolCallRecord]:
     # 如果左侧没有历史（例如，初始化时），则使用右侧
@@ -29,7 +35,8 @@ def merge_tool_histories(left: List[ToolCallRecord], right: List[ToolCallRecord]
     # 如果右侧没有历史（例如，某次迭代未调用工具），则使用左侧
     if right is None:
         right = []
-    return left + right
+    # 环形缓冲：超出上限的旧记录已在 tool_calls 表中，这里直接丢弃，避免 checkpoint 越来越大
+    return (left + right)[-MAX_TOOL_HISTORY:]
 
 class PocketWiseState(TypedDict):
     # 对话通道
@@ -39,5 +46,9 @@ class PocketWiseState(TypedDict):
     user_profile:dict[str,Any]
     # 意图路由分发
     last_intent:Intent
+    # 本轮从已归档对话中检索到的相关片段（每轮覆盖）
+    recalled_memory: str
+    # 本轮记账快速通道的解析记录 id（未入账、交给 LLM 流程时用于补记模型的结果）
+    expense_parse_id: Optional[str]
     # 工具调用历史
     tool_call_history: Annotated[List[ToolCallRecord], merge_tool_histories]
@@ -0,0 +1,251 @@
+"""工具结果整形：把工具返回值裁剪成精简的 JSON，控制写入 ToolMessage 的 token 数。"""
+import base64
+import binascii
+import json
+import re
+from typing import Any, Callable, Dict, Optional
+
+# 写入 ToolMessage 的工具结果的默认 token 上限
+DEFAULT_TOKEN_BUDGET = 400
+# 个别工具的 token 上限
+TOOL_TOKEN_BUDGETS = {
+    "analyze_spending": 600,
+    # 按单页上限留足空间，尽量不裁剪分页结果
+    "view_recent_expenses": 600,
+}
+# 字符串字段截短后至少保留的字符数
+MIN_STRING_CHARS = 8
+
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文按每字 1 个，其余按每 4 个字符 1 个"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def to_json(obj: Any) -> str:
+    """紧凑 JSON，中文不转义，无法序列化的对象转为字符串"""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def round_numbers(obj: Any, ndigits: int = 2) -> Any:
+    """递归地把浮点数保留 ndigits 位小数"""
+    if isinstance(obj, float):
+        return round(obj, ndigits)
+    if isinstance(obj, dict):
+        return {k: round_numbers(v, ndigits) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [round_numbers(v, ndigits) for v in obj]
+    return obj
+
+
+def _date(value: Any) -> str:
+    """ISO 时间只保留日期部分"""
+    return str(value or "")[:10]
+
+
+def encode_cursor(before_id: int) -> str:
+    """把分页位置编码为不透明的游标，模型只需原样传回"""
+    return base64.urlsafe_b64encode(f"e:{before_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str = None) -> Optional[int]:
+    """还原 encode_cursor 编码的分页位置，cursor 为空时返回 None，格式不对时抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, value = text.split(":", 1)
+        if prefix != "e":
+            raise ValueError(cursor)
+        return int(value)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(cursor) from e
+
+
+def _expense_row(e: Dict[str, Any]) -> Dict[str, Any]:
+    row = {
+        "id": e.get("id"),
+        "date": _date(e.get("timestamp")),
+        "description": e.get("description"),
+        "amount": e.get("amount"),
+        "category": e.get("category"),
+    }
+    if e.get("context"):
+        row["context"] = e["context"]
+    return row
+
+
+def _plan_row(p: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in p.items() if k != "user_id" and v is not None}
+
+
+def _shape_expenses(result: Any) -> Any:
+    if isinstance(result, list):
+        return [_expense_row(e) for e in result]
+    if isinstance(result, dict) and "expenses" in result:
+        return {**result, "expenses": [_expense_row(e) for e in result["expenses"]]}
+    return result
+
+
+def _shape_plans(result: Any) -> Any:
+    if isinstance(result, list):
+        return [_plan_row(p) for p in result]
+    return result
+
+
+def _shape_impulse(result: Any) -> Any:
+    if not isinstance(result, dict):
+        return result
+    remind = result.get("remind", {}) or {}
+    shaped = {
+        "is_impulse": result.get("is_impulse"),
+        "score": result.get("score"),
+        "reason": result.get("reason"),
+        "recommendation": result.get("recommendation"),
+        "monthly_budget": remind.get("monthly_budget"),
+        "month_spent": remind.get("month_spent_estimate"),
+        "month_remaining": remind.get("month_remaining_estimate"),
+        "spending_history": remind.get("spending_history"),
+    }
+    plans = remind.get("active_plans") or []
+    if plans:
+        shaped["active_plans"] = [
+            {k: p.get(k) for k in ("id", "content", "goal_amount", "amount_achieved", "progress_status")
+             if p.get(k) is not None}
+            for p in plans
+        ]
+    similar = remind.get("similar_past_expenses") or []
+    if similar:
+        shaped["similar_past_expenses"] = [
+            {"date": _date(e.get("timestamp")), "description": e.get("description"), "amount": e.get("amount")}
+            for e in similar
+        ]
+    return {k: v for k, v in shaped.items() if v is not None}
+
+
+# 每个工具只保留模型需要的字段；未注册的工具原样序列化
+SHAPERS: Dict[str, Callable[[Any], Any]] = {
+    "view_recent_expenses": _shape_expenses,
+    "view_plan": _shape_plans,
+    "detect_impulse_buying": _shape_impulse,
+}
+
+
+def _expense_cursor(row: Dict[str, Any]) -> str:
+    return encode_cursor(row["id"])
+
+
+# 分页工具：结果被裁剪时按最后保留的一条重新生成 next_cursor，被省略的记录在下一页中返回
+PAGE_CURSORS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "view_recent_expenses": _expense_cursor,
+}
+
+
+def _longest_list(obj: Any):
+    """返回 obj（或其第一层字段）中最长的列表及其字段名"""
+    if isinstance(obj, list):
+        return None, obj
+    if isinstance(obj, dict):
+        lists = [(k, v) for k, v in obj.items() if isinstance(v, list) and v]
+        if lists:
+            return max(lists, key=lambda kv: len(kv[1]))
+    return None, None
+
+
+def _longest_string(obj: Any, parent: Any = None, key: Any = None):
+    """返回 obj 中最长的字符串字段 (所在容器, 键或下标, 值)，没有时返回 None"""
+    if isinstance(obj, str):
+        return parent, key, obj
+    children = obj.items() if isinstance(obj, dict) else enumerate(obj) if isinstance(obj, list) else ()
+    found = None
+    for child_key, child in children:
+        candidate = _longest_string(child, obj, child_key)
+        if candidate is not None and (found is None or len(candidate[2]) > len(found[2])):
+            found = candidate
+    return found
+
+
+def _largest_field(obj: Any):
+    """返回序列化后最长的字段 (所在 dict, 键)：obj 为列表时在其第一条记录中查找"""
+    container = obj[0] if isinstance(obj, list) and obj else obj
+    if not isinstance(container, dict) or not container:
+        return None
+    return container, max(container, key=lambda k: len(to_json(container[k])))
+
+
+def fit_to_budget(obj: Any, budget: int, cursor_for: Callable[[Dict[str, Any]], str] = None) -> str:
+    """序列化并裁剪到 token 上限，裁剪后仍是合法的 JSON
+
+    依次：从最长的列表末尾删减并注明省略条数（cursor_for 不为空时，把 next_cursor 改为最后保留的一条）；
+    截短最长的字符串字段；删除最长的字段并注明。纯文本结果直接按比例截断。
+    """
+    if isinstance(obj, str):
+        if estimate_tokens(obj) <= budget:
+            return obj
+        keep = max(1, len(obj) * budget // max(1, estimate_tokens(obj)))
+        return obj[:keep] + "…(已截断)"
+    text = to_json(obj)
+    if estimate_tokens(text) <= budget:
+        return text
+    # 复制为纯 JSON 值，裁剪不影响写入 tool_call_history 的完整结果
+    obj = json.loads(text)
+    omitted: Dict[Any, int] = {}
+    while estimate_tokens(text) > budget:
+        key, items = _longest_list(obj)
+        if not items or len(items) <= 1:
+            break
+        # 按超出比例一次删减多条，避免逐条重新序列化
+        keep = min(len(items) - 1, max(1, len(items) * budget // estimate_tokens(text)))
+        omitted[key] = omitted.get(key, 0) + len(items) - keep
+        items = items[:keep]
+        if key is None:
+            obj = items
+        else:
+            obj[key] = items
+            if cursor_for is not None and "next_cursor" in obj and isinstance(items[-1], dict):
+                obj["next_cursor"] = cursor_for(items[-1])
+        text = _with_omitted(obj, omitted)
+    while estimate_tokens(text) > budget:
+        found = _longest_string(obj)
+        if found is None or len(found[2]) <= MIN_STRING_CHARS + 1:
+            break
+        parent, key, value = found
+        # 按超出的 token 数成比例截短，加上省略号后也至少短一个字符
+        excess = estimate_tokens(text) - budget
+        keep = len(value) * max(0, estimate_tokens(value) - excess) // max(1, estimate_tokens(value))
+        parent[key] = value[:max(MIN_STRING_CHARS, min(keep, len(value) - 2))] + "…"
+        text = _with_omitted(obj, omitted)
+    while estimate_tokens(text) > budget:
+        found = _largest_field(obj)
+        if found is None:
+            break
+        container, key = found
+        del container[key]
+        omitted["fields"] = omitted.get("fields", 0) + 1
+        text = _with_omitted(obj, omitted)
+    return text
+
+
+def _with_omitted(obj: Any, omitted: Dict[Any, int]) -> str:
+    notes = {"omitted" if key is None else f"{key}_omitted": count for key, count in omitted.items()}
+    if isinstance(obj, list):
+        return to_json(obj + [notes] if notes else obj)
+    return to_json({**obj, **notes})
+
+
+def shape_tool_result(tool_name: str, result: Any) -> str:
+    """把工具结果整理成写入 ToolMessage 的紧凑文本"""
+    shaper = SHAPERS.get(tool_name)
+    shaped = shaper(result) if shaper else result
+    shaped = round_numbers(shaped)
+    return fit_to_budget(shaped, TOOL_TOKEN_BUDGETS.get(tool_name, DEFAULT_TOKEN_BUDGET), PAGE_CURSORS.get(tool_name))
+
+
+def serialize_full_result(result: Any) -> str:
+    """完整结果的序列化，仅写入 tool_call_history"""
+    if isinstance(result, str):
+        return result
+    return json.dumps(result, ensure_ascii=False, default=str)
@@ -1,14 +1,28 @@
-from typing import Dict
-from langchain_core.tools import tool
+"""提供给模型调用的业务工具：用户档案、支出记录、消费分析、冲动消费检测和计划管理。"""
+from datetime import date, datetime
+from typing import Dict, Optional
+
+import analytics
 import database as db
+import impulse_rules
+import plan_calculator
+import plan_progress
+from langchain_core.tools import tool
+from tool_results import decode_cursor, encode_cursor
+
+# view_recent_expenses 单页最多返回的支出数
+MAX_EXPENSE_PAGE = 10
+# 计算历史月均支出时参考的完整月份数
+SPEND_HISTORY_MONTHS = 3
+
 
 # 初始化数据库
 db.init_db()
 
 @tool
 def view_user_profile(user_id: str) -> Dict:
-    """
-    获取当前用户的档案，包括收入、预算、现有存款和性格标签。
+    """获取当前用户的档案，包括收入、预算、现有存款和性格标签。
+
     用于了解用户的财务基准情况。
     :param user_id: 用户 ID。
     """
@@ -17,8 +31,8 @@ def view_user_profile(user_id: str) -> Dict:
 
 @tool
 def edit_user_profile(user_id: str, updates: Dict):
-    """
-    更新用户档案中的特定字段。
+    """更新用户档案中的特定字段。
+
     :param user_id: 用户 ID。
     :param updates: 要更新的字段字典（例如：{"monthly_budget": 5000}）。
     """
@@ -29,8 +43,8 @@ def edit_user_profile(user_id: str, updates: Dict):
 @tool
 def log_notable_expense(user_id: str, description: str, amount: float, category: str,
                         context: str):
-    """
-    记录一笔值得追踪或分析的支出。
+    """记录一笔值得追踪或分析的支出。
+
     :param user_id: 用户 ID。
     :param description: 购买了什么。
     :param amount: 花费金额。
@@ -42,28 +56,51 @@ def log_notable_expense(user_id: str, description: str, amount: float, category:
 
 
 @tool
-def view_recent_expenses(user_id: str):
-    """
-    查看用户最近5笔支出。
+def view_recent_expenses(user_id: str, cursor: Optional[str] = None, limit: int = 5):
+    """按时间倒序分页查看用户的支出记录，默认最近5笔。
+
     :param user_id: 用户 ID。
-    :return: 最近5笔支出列表。
+    :param cursor: 上次结果中的 next_cursor，用于继续查看更早的支出；不传则从最新一笔开始。
+    :param limit: 每页条数，默认 5，最多 10。
+    :return: dict:{'expenses': 支出列表, 'next_cursor': 下一页游标，没有更早的记录时为 null}
     """
-    return db.get_recent_expenses(user_id)
+    try:
+        before_id = decode_cursor(cursor)
+    except ValueError:
+        return {"error": "无效的游标，请不传 cursor 从最新一笔重新查看"}
+    limit = max(1, min(int(limit or 5), MAX_EXPENSE_PAGE))
+    records, next_id = db.get_expense_page(user_id, before_id, limit)
+    return {
+        "expenses": [record._asdict() for record in records],
+        "next_cursor": encode_cursor(next_id) if next_id is not None else None,
+    }
 
 
 @tool
-def detect_impulse_buying(user_id: str, description: str, amount: float):
+def analyze_spending(user_id: str, months: int = 3):
+    """基于全部历史记录统计用户的消费情况，返回预先计算好的摘要。
+
+    包括类别占比、月度环比、最常见的消费项目、星期分布和本月预算消耗速度。
+    :param user_id: 用户 ID。
+    :param months: 统计最近几个月（含本月），默认 3。
+    :return: 消费统计摘要。
     """
-    基于用户当前状态，分析某笔消费是否可能属于冲动消费。
+    return analytics.summarize_spending(user_id, months)
+
+
+@tool
+def detect_impulse_buying(user_id: str, description: str, amount: float, category: str = None):
+    """基于用户当前状态，分析某笔消费是否可能属于冲动消费。
+
     :param user_id: 用户 ID。
     :param description: 商品描述。
     :param amount: 消费金额。
+    :param category: 支出类别（可选，用于匹配该类别的触发词）。
     :return: dict:{'is_impulse': bool, 'reason': str}
     """
-    # 从 user_id 获取用户状态、阶段计划与历史支出
+    # 从 user_id 获取用户状态、计划进度与历史支出
     user_state = db.get_user_profile(user_id)
     active_plans = db.get_active_plans(user_id) or []
-    stage_plan = db.get_stage_plan(user_id) or {}
     recent_expenses = db.get_recent_expenses(user_id) or []
 
     budget = user_state.get("monthly_budget", 0)
@@ -72,113 +109,70 @@ def detect_impulse_buying(user_id: str, description: str, amount: float):
     reasons = []
     is_impulse = False
 
-    # 1) 阶段性计划参考：若存在活跃计划且本次消费可能影响目标达成，则提醒
+    # 1) 计划进度参考：结合已维护的计划进度，提醒本次消费对未完成计划的影响
     plan_reasons = []
     for plan in active_plans:
-        # 只对储蓄/消费节制类计划做简单判断
-        plan_type = plan.get("plan_type", "").lower() if plan else ""
-        stages_amount = plan.get("stages_amount")
-        if plan_type in ("储蓄", "saving", "消费节制", "节省") and stages_amount:
-            plan_reasons.append(f"存在阶段计划（每阶段目标 {stages_amount}），本次消费可能影响计划进度。")
+        kind = plan_progress.plan_kind(plan.get("plan_type"))
+        achieved = plan.get("amount_achieved")
+        status = plan.get("progress_status")
+        if kind == "other" or achieved is None or status == "achieved":
+            continue
+        goal = plan.get("goal_amount") or 0
+        label = plan_progress.STATUS_LABELS.get(status, status)
+        if kind == "saving":
+            plan_reasons.append(f"储蓄计划「{plan.get('content')}」已存 {achieved:.2f}/{goal}（{label}），本次消费可能影响计划进度。")
+        else:
+            plan_reasons.append(f"消费节制计划「{plan.get('content')}」已花费 {achieved:.2f}/{goal}（{label}），本次消费后将达到 {achieved + amount:.2f}。")
     if plan_reasons:
         reasons.extend(plan_reasons)
 
-    # 2) 简单判定算法（多条件打分）
-    score = 0
-    # a) 相对于月预算比例
-    if budget > 0:
-        ratio = amount / budget
-        if ratio >= 0.1:
-            score += 2
-            reasons.append(f"金额占月预算的 {ratio:.1%}（阈值 10%）")
-        elif ratio >= 0.05:
-            score += 1
-            reasons.append(f"金额占月预算的 {ratio:.1%}（较高）")
-
-    # b) 相对于最近消费均值
+    # 2) 规则引擎打分（规则定义见 impulse_rules.json）
     avg_recent = 0
     if recent_expenses:
         try:
             avg_recent = sum(e.get("amount", 0) for e in recent_expenses) / len(recent_expenses)
         except Exception:
             avg_recent = 0
-    if avg_recent > 0:
-        if amount > avg_recent * 3:
-            score += 2
-            reasons.append(f"消费远高于近期平均（{avg_recent:.2f}），超过 3 倍")
-        elif amount > avg_recent * 1.5:
-            score += 1
-            reasons.append(f"消费高于近期平均（{avg_recent:.2f}）")
-
-    # c) 描述关键词触发
-    impulse_keywords = ["盲盒", "限时", "促销", "折扣", "不需要", "冲动", "买买买"]
-    if any(k in (description or "").lower() for k in impulse_keywords):
-        score += 2
-        reasons.append("商品描述包含冲动消费触发词")
-
-    # d) 用户自我标签
-    if any("impuls" in t.lower() or "冲动" in t for t in personality):
-        score += 1
-        reasons.append("用户档案包含“容易冲动”相关标签")
-
-    # e) 当月已花费与剩余额度（基于最近记录的近似当月支出）
-    from datetime import datetime
-    now = datetime.now()
-    month = now.month
-    year = now.year
-    month_spent = 0
-    for e in recent_expenses:
-        t = e.get("timestamp", "")
-        if t:
-            time = t.split("T")[0]
-            t_year = time.split("-")[0]
-            t_month = time.split("-")[1]
-        if t_year == year and t_month == month:
-            month_spent += float(e.get("amount", 0))
-    
+
+    # 当月已花费（按 ts 索引在 SQL 中汇总当月支出）
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_spent = db.sum_expenses_between(user_id, month_start)
     remaining = max(0, budget - month_spent) if budget else None
-    if remaining is not None:
-        if remaining <= 0:
-            score += 2
-            reasons.append("本月预算已接近或超支")
-        elif amount > remaining:
-            score += 2
-            reasons.append(f"本次消费超过本月剩余额度（剩余 {remaining:.2f}）")
-        elif amount > remaining * 0.5:
-            score += 1
-            reasons.append(f"本次消费占本月剩余额度较高（剩余 {remaining:.2f}）")
-
-    # 判定阈值：score >=3 认定为冲动消费；2 为可疑；否则非冲动
-    if score >= 3:
-        is_impulse = True
-    elif score == 2:
+
+    # 全部历史支出的流式统计（记账时增量维护），O(1) 读取
+    stats = db.get_spending_stats(user_id, category)
+    features = impulse_rules.compute_features(amount, budget, avg_recent, personality, month_spent,
+                                              stats["overall"], stats["category"])
+    assessment = impulse_rules.engine.assess(features, description,
+                                             user_state.get("trigger_keywords", []), category)
+    score = assessment["score"]
+    is_impulse = assessment["is_impulse"]
+    reasons.extend(assessment["reasons"])
+    if assessment["is_suspicious"]:
         # 可疑，需要用户确认
-        is_impulse = False
         reasons.append("判定为可疑消费，建议二次确认")
-    else:
-        is_impulse = False
 
-    # 找到与本次描述相似的历史消费例子（简单文本包含匹配）
-    category = []
-    for e in recent_expenses:
-        if category and category.lower() in (e.get("category", "") or "").lower():
-            category.append(e)
+    # 通过全文索引在全部历史中查找与本次描述相似的消费
+    similar_expenses = db.find_similar_expenses(user_id, description, 5)
+    if similar_expenses:
+        names = "、".join(e.get("description") or "" for e in similar_expenses[:3])
+        reasons.append(f"历史上有 {len(similar_expenses)} 笔相似消费（{names}）")
 
-    # 组装提醒信息（包含阶段计划、活跃计划与历史记录摘要）
+    # 组装提醒信息（包含活跃计划及其进度与历史记录摘要）
     remind = {
         "active_plans": active_plans,
-        "stage_plan": stage_plan,
         "recent_expenses_sample": recent_expenses[:5],
-        "similar_past_expenses": category[:5],
+        "similar_past_expenses": similar_expenses,
         "monthly_budget": budget,
         "month_spent_estimate": month_spent,
         "month_remaining_estimate": remaining,
+        "spending_history": stats["overall"].summary() if stats["overall"] else None,
     }
 
     recommendation = "无特别建议。"
     if is_impulse:
         recommendation = "该消费可能为冲动消费，建议考虑推迟购买、设置等待期或采用预算外决定流程。"
-    elif score == 2:
+    elif assessment["is_suspicious"]:
         recommendation = "该消费可疑，建议二次确认或缩小购买金额。"
     else:
         recommendation = "看起来是理性消费，可记录入账以便后续分析。"
@@ -195,8 +189,8 @@ def detect_impulse_buying(user_id: str, description: str, amount: float):
 @tool
 def log_plan(user_id: str, plan_type: str, content: str, start_date: str,
              goal_amount: float = None, stages_amount: float = None):
-    """
-    记录用户的财务计划或目标。
+    """记录用户的财务计划或目标。
+
     :param user_id: 用户ID。
     :param plan_type: 计划类型（例如：'储蓄'、'消费节制'）。
     :param content: 计划具体内容。
@@ -208,10 +202,51 @@ def log_plan(user_id: str, plan_type: str, content: str, start_date: str,
     return f"计划已保存：{content}"
 
 
+def _average_monthly_spend(user_id: str):
+    """最近 SPEND_HISTORY_MONTHS 个完整月份的月均支出，没有支出记录时返回 None"""
+    this_month = date.today().replace(day=1)
+    index = this_month.year * 12 + this_month.month - 1 - SPEND_HISTORY_MONTHS
+    total = db.sum_expenses_between(user_id, date(index // 12, index % 12 + 1, 1), this_month)
+    return total / SPEND_HISTORY_MONTHS if total else None
+
+
 @tool
-def view_plan(user_id: str):
+def calculate_saving_plan(user_id: str, goal_amount: float, months: int = None, deadline: str = None,
+                          start_date: str = None):
+    """计算储蓄计划的可行性与每月存款额（根据用户收入、预算、存款和历史支出精确计算，不要自行推算）。
+
+    :param user_id: 用户ID。
+    :param goal_amount: 计划开始后需要存下的金额。
+    :param months: 计划期限（月数），与 deadline 二选一，都不提供时按 12 个月计算。
+    :param deadline: 截止日期（ISO 格式字符串）。
+    :param start_date: 开始日期（ISO 格式字符串），默认今天。
+    :return: 每月存款额 stages_amount（可直接用于 log_plan）、可行性评级、分阶段存款表和备选期限。
     """
-    查看用户计划
+    profile = db.get_user_profile(user_id)
+    start = plan_progress.parse_start_date(start_date).date() if start_date else date.today()
+    end = None
+    if deadline and not months:
+        try:
+            end = date.fromisoformat(str(deadline)[:10])
+        except ValueError:
+            # 截止日期格式不规范时按默认期限计算
+            end = None
+    return plan_calculator.saving_plan(
+        goal_amount,
+        profile.get("income", 0) or 0,
+        profile.get("monthly_budget", 0) or 0,
+        profile.get("saving", 0) or 0,
+        _average_monthly_spend(user_id),
+        stages=months,
+        deadline=end,
+        start=start,
+    )
+
+
+@tool
+def view_plan(user_id: str):
+    """查看用户计划及进度（已达成金额、当前阶段、进度状态、预计完成日期）
+
     :param user_id: 用户ID。
     :return:
     """
@@ -221,8 +256,8 @@ def view_plan(user_id: str):
 @tool
 def update_plan(plan_id: int, user_id: str, plan_type: str = None, content: str = None,
                 start_date: str = None, goal_amount: float = None, stages_amount: float = None, status: str = None):
-    """
-    更新用户计划
+    """更新用户计划
+
     :param plan_id: 计划ID。
     :param user_id: 用户ID。
     :param plan_type: 计划类型。
@@ -236,8 +271,8 @@ def update_plan(plan_id: int, user_id: str, plan_type: str = None, content: str
 
 @tool
 def delete_plan(plan_id: int, user_id: str):
-    """
-    删除用户计划
+    """删除用户计划
+
     :param plan_id: 计划ID。
     :param user_id: 用户ID。
     """
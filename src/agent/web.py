@@ -1,21 +1,90 @@
-import streamlit as st
+"""Streamlit 网页前端：用户 id 取自 URL 参数或侧边栏输入，每个浏览器会话是该用户的一个对话线程。"""
 import json
+import uuid
 from datetime import datetime
+from typing import Optional
+
+import database as db
+import streamlit as st
 from cli import process_input
 
+# 侧边栏每页显示的工具调用条数
+TOOL_HISTORY_PAGE_SIZE = 10
+
+
+def current_user_id() -> Optional[str]:
+    """用户 id 保存在 URL 的 ?user= 参数中，还没有时在侧边栏输入
+
+    刷新页面、新开标签页或打开收藏的链接后仍是同一用户；浏览器会话只决定 session_id（对话线程），
+    支出、计划等数据都按用户 id 保存。
+    """
+    user_id = (st.query_params.get("user") or "").strip()
+    if not user_id:
+        user_id = st.sidebar.text_input("用户 ID", key="login_user_id").strip()
+        if user_id:
+            st.query_params["user"] = user_id
+    return user_id or None
+
+
+def switch_user():
+    """清除 URL 中的用户 id 并开始新的对话线程"""
+    del st.query_params["user"]
+    for key in ("login_user_id", "session_id", "tool_page_cursors"):
+        st.session_state.pop(key, None)
+    st.rerun()
+
+
+def render_tool_history(user_id: str):
+    """分页显示工具调用历史，只读取和渲染当前页"""
+    # 游标栈：每个元素是对应页的 before_id，None 表示第一页
+    if "tool_page_cursors" not in st.session_state:
+        st.session_state.tool_page_cursors = [None]
+
+    before_id = st.session_state.tool_page_cursors[-1]
+    # 多取一条用于判断是否还有下一页
+    records = db.get_tool_calls(user_id, limit=TOOL_HISTORY_PAGE_SIZE + 1, before_id=before_id)
+    has_next = len(records) > TOOL_HISTORY_PAGE_SIZE
+    records = records[:TOOL_HISTORY_PAGE_SIZE]
+
+    if not records:
+        st.info("No tool calls executed yet.")
+        return
+
+    # 最新的在上面
+    for record in records:
+        with st.expander(f"`{record['name']}` · {datetime.fromtimestamp(float(record['timestamp']))}"):
+            st.text("Arguments:")
+            st.code(json.dumps(record['arguments'], indent=2, ensure_ascii=False), language="json")
+            st.text("Result:")
+            st.code(record['result'], language="text", height = 200)
+
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("上一页", disabled=len(st.session_state.tool_page_cursors) == 1):
+        st.session_state.tool_page_cursors.pop()
+        st.rerun()
+    if next_col.button("下一页", disabled=not has_next):
+        st.session_state.tool_page_cursors.append(records[-1]["id"])
+        st.rerun()
+
+
 def main():
     st.set_page_config(page_title="PocketWise")
     st.title("🤖 Welcome to PocketWise - Your Personal Finance Companion")
-    # 初始化 session state 来存储历史记录
-    if "tool_history" not in st.session_state:
-        st.session_state.tool_history = []
+
+    user_id = current_user_id()
+    if user_id is None:
+        st.info("请先在侧边栏输入用户 ID，之后可以收藏当前链接直接回到自己的记录。")
+        st.stop()
+
+    # 每个浏览器会话是该用户的一个独立对话线程
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
     user_input = st.chat_input("You:")
     if user_input:
-        result = process_input(user_input)
-
-        if "tool_call_history" in result:
-            st.session_state.tool_history = result["tool_call_history"]
+        result = process_input(user_input, user_id, st.session_state.session_id)
+        # 有新的工具调用时回到第一页
+        st.session_state.tool_page_cursors = [None]
 
         human_message = st.chat_message("human")
         human_message.write(user_input)
@@ -23,21 +92,17 @@ def main():
         ai_message = st.chat_message("ai")
         ai_message.write(result["messages"][-1].content)
 
+    # 计划阶段提醒（离线期间触发的也在这里送达）
+    for reminder in db.pop_reminder_messages(user_id):
+        st.info(f"🔔 {reminder['message']}")
+
     # --- 侧边栏显示工具调用历史 ---
     with st.sidebar:
+        st.caption(f"User ID: {user_id}")
+        if st.button("切换用户"):
+            switch_user()
         st.header("🛠️ Tool Call History")
-        if st.session_state.tool_history:
-            # 逆序显示，最新的在上面
-            for record in reversed(st.session_state.tool_history):
-                st.subheader(f"`{record['name']}`")
-                st.text("Arguments:")
-                st.code(json.dumps(record['arguments'], indent=2, ensure_ascii=False), language="json")
-                st.text("Result:")
-                st.code(record['result'], language="text", height = 200)
-                st.caption(f"Timestamp: {datetime.fromtimestamp(float(record['timestamp']))}")
-                st.divider()
-        else:
-            st.info("No tool calls executed yet.")
+        render_tool_history(user_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""多进程工作池：每个分片固定归属一个工作进程，同一用户的请求总在同一进程内串行执行。
+
+用法：
+    python workers.py --workers 4
+    然后每行输入 "<user_id>: <消息>"
+"""
+import argparse
+import itertools
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+import database as db
+
+
+def _worker_main(inbox, outbox):
+    """工作进程入口：独立构建图，按顺序处理分配给本进程的请求"""
+    from graph import build_graph
+    from langgraph.checkpoint.memory import MemorySaver
+
+    app = build_graph(MemorySaver())
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        request_id, user_id, thread_id, text = item
+        try:
+            config = {"configurable": {"thread_id": thread_id}}
+            result = app.invoke({"user_id": user_id, "messages": [("user", text)]}, config=config)
+            outbox.put((request_id, True, result["messages"][-1].content))
+        except Exception as e:
+            outbox.put((request_id, False, f"{type(e).__name__}: {e}"))
+
+
+class ShardWorkerPool:
+    """按分片把用户固定到工作进程，使每个 SQLite 文件只有一个进程写入"""
+
+    def __init__(self, num_workers: Optional[int] = None):
+        """启动 num_workers 个工作进程（默认取 CPU 数），不超过分片数"""
+        shard_count = db.router.shard_count
+        self.num_workers = max(1, min(num_workers or os.cpu_count() or 1, shard_count))
+        ctx = mp.get_context("spawn")
+        self._outbox = ctx.Queue()
+        self._inboxes = [ctx.Queue() for _ in range(self.num_workers)]
+        self._processes = [
+            ctx.Process(target=_worker_main, args=(inbox, self._outbox), daemon=True)
+            for inbox in self._inboxes
+        ]
+        self._futures: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        for process in self._processes:
+            process.start()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def worker_for(self, user_id: str) -> int:
+        """处理 user_id 所在分片的工作进程序号"""
+        return db.router.shard_for(user_id) % self.num_workers
+
+    def submit(self, user_id: str, text: str, thread_id: Optional[str] = None) -> Future:
+        """把一条用户消息派发给其分片所属的工作进程，返回回复内容的 Future"""
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._futures[request_id] = future
+        self._inboxes[self.worker_for(user_id)].put((request_id, user_id, thread_id or user_id, text))
+        return future
+
+    def _collect(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                break
+            request_id, ok, payload = item
+            with self._lock:
+                future = self._futures.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(RuntimeError(payload))
+
+    def shutdown(self):
+        """通知所有工作进程退出并等待结束"""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join()
+        self._outbox.put(None)
+        self._collector.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按分片启动 PocketWise 工作进程")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认取 CPU 数与分片数的较小值")
+    args = parser.parse_args()
+
+    db.init_db()
+    pool = ShardWorkerPool(args.workers)
+    print(f"已启动 {pool.num_workers} 个工作进程，分片数 {db.router.shard_count}")
+    try:
+        while True:
+            line = input("> ").strip()
+            if line.lower() in ("exit", "quit"):
+                break
+            user_id, sep, text = line.partition(":")
+            if not sep:
+                print("格式：<user_id>: <消息>")
+                continue
+            print(pool.submit(user_id.strip(), text.strip()).result())
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""写后缓冲：把写操作交给后台线程，按数据库文件合并成批次事务提交。"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+WriteOp = Callable[[sqlite3.Connection], Any]
+
+
+class WriteBehindQueue:
+    """异步写队列：由单独的写线程把多次写操作合并到一个事务中提交（group commit）
+
+    - submit() 立即返回 Future，写操作在下一次刷盘时执行
+    - 每批写操作按数据库文件分组，每个文件一个事务、一次 fsync
+    - wait_user() 在读之前等待该用户已提交的写操作落盘，保证同进程内读到自己的写
+    """
+
+    def __init__(self, path_for: Callable[[str], str], flush_interval: float = 0.05, batch_size: int = 256):
+        """path_for 把 user_id 映射到数据库文件；每隔 flush_interval 秒或攒够 batch_size 个写操作刷盘一次"""
+        self._path_for = path_for
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue: queue.Queue[Tuple[str, WriteOp, Future]] = queue.Queue()
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._cond = threading.Condition()
+        self._flush_now = threading.Event()
+        self._stopping = False
+        self._connections: Dict[str, sqlite3.Connection] = {}
+        self._metrics = {
+            "batches": 0,
+            "ops_written": 0,
+            "ops_failed": 0,
+            "max_queue_depth": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: str, op: WriteOp) -> Future:
+        """提交一个写操作，op 接收目标分片的连接，不应自行提交事务"""
+        if self._stopping:
+            raise RuntimeError("write-behind queue is stopped")
+        future: Future = Future()
+        with self._cond:
+            self._pending[user_id] += 1
+        self._queue.put((user_id, op, future))
+        depth = self._queue.qsize()
+        if depth > self._metrics["max_queue_depth"]:
+            self._metrics["max_queue_depth"] = depth
+        if depth >= self.batch_size:
+            self._flush_now.set()
+        return future
+
+    def wait_user(self, user_id: str, timeout: float = None) -> bool:
+        """等待该用户所有已提交的写操作落盘"""
+        with self._cond:
+            if not self._pending.get(user_id):
+                return True
+            self._flush_now.set()
+            return self._cond.wait_for(lambda: not self._pending.get(user_id), timeout)
+
+    def flush(self, timeout: float = None) -> bool:
+        """等待队列中所有写操作落盘"""
+        with self._cond:
+            self._flush_now.set()
+            return self._cond.wait_for(lambda: not any(self._pending.values()), timeout)
+
+    def stop(self, timeout: float = None):
+        """停止接收新写操作，写完队列中剩余的操作后退出写线程"""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._flush_now.set()
+        self._thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        """写入与失败的操作数、批次统计、平均批大小和当前队列深度"""
+        metrics = dict(self._metrics)
+        metrics["queue_depth"] = self._queue.qsize()
+        metrics["avg_batch_size"] = round(metrics["ops_written"] / metrics["batches"], 2) if metrics["batches"] else 0
+        return metrics
+
+    def _run(self):
+        while True:
+            self._flush_now.wait(self.flush_interval)
+            self._flush_now.clear()
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                self._write_batch(batch)
+                if len(batch) < self.batch_size:
+                    break
+            if self._stopping and self._queue.empty():
+                break
+        for conn in self._connections.values():
+            conn.close()
+
+    def _drain(self) -> List[Tuple[str, WriteOp, Future]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _connection(self, path: str) -> sqlite3.Connection:
+        conn = self._connections.get(path)
+        if conn is None:
+            # 手动管理事务，check_same_thread 默认即可（只在写线程中使用）
+            conn = sqlite3.connect(path, isolation_level=None)
+            self._connections[path] = conn
+        return conn
+
+    def _write_batch(self, batch: List[Tuple[str, WriteOp, Future]]):
+        started = time.perf_counter()
+        by_path: Dict[str, List[Tuple[str, WriteOp, Future]]] = defaultdict(list)
+        for item in batch:
+            by_path[self._path_for(item[0])].append(item)
+
+        for path, items in by_path.items():
+            conn = self._connection(path)
+            results = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for user_id, op, future in items:
+                    # 每个操作一个 savepoint，单个操作失败不影响同批其他写入
+                    conn.execute("SAVEPOINT op")
+                    try:
+                        results.append((future, True, op(conn)))
+                        conn.execute("RELEASE op")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO op")
+                        conn.execute("RELEASE op")
+                        results.append((future, False, e))
+                conn.execute("COMMIT")
+            except Exception as e:
+                logger.exception("Write-behind batch failed for %s", path)
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                results = [(future, False, e) for _, _, future in items]
+
+            for future, ok, value in results:
+                if ok:
+                    future.set_result(value)
+                    self._metrics["ops_written"] += 1
+                else:
+                    future.set_exception(value)
+                    self._metrics["ops_failed"] += 1
+                    logger.error("Write-behind op failed: %r", value)
+
+        with self._cond:
+            for user_id, _, _ in batch:
+                self._pending[user_id] -= 1
+                if not self._pending[user_id]:
+                    del self._pending[user_id]
+            self._cond.notify_all()
+
+        self._metrics["batches"] += 1
+        self._metrics["last_batch_size"] = len(batch)
+        self._metrics["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
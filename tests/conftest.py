@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+from typing import List
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field
+
+# src/agent 下的模块按扁平方式互相导入（import database as db），测试同样从该目录导入
+AGENT_DIR = Path(__file__).resolve().parent.parent / "src" / "agent"
+sys.path.insert(0, str(AGENT_DIR))
+
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    """把数据库切到临时目录下的两个分片，测试结束后恢复。"""
+    import database as db
+
+    monkeypatch.setattr(db, "write_queue", None)
+    base_path, router = db.DB_PATH, db.router
+    db.configure_shards(str(tmp_path / "pocketwise.db"), 2)
+    for path in db.all_db_paths():
+        db.init_shard(path)
+    yield db
+    db.DB_PATH, db.router = base_path, router
+
+
+class ScriptedChatModel(BaseChatModel):
+    """按顺序返回预设回复的聊天模型，记录每次调用收到的消息"""
+
+    replies: List[AIMessage] = Field(default_factory=list)
+    calls: List[list] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls.append(messages)
+        return ChatResult(generations=[ChatGeneration(message=self.replies.pop(0))])
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+@pytest.fixture
+def graph_module(scratch_db, monkeypatch):
+    """在临时数据库上导入 graph（tools 导入时会初始化数据库），并把各用途的模型换成 ScriptedChatModel"""
+    import env_utils
+
+    # .env 中的空 key 会让 ChatOpenAI 在导入 model 时报错
+    monkeypatch.setattr(env_utils, "QWEN_API_KEY", env_utils.QWEN_API_KEY or "test")
+    import graph
+
+    for name in ("llm_chat", "llm_intent", "llm_plan", "llm_background"):
+        monkeypatch.setattr(graph, name, ScriptedChatModel())
+    return graph
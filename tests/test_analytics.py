@@ -0,0 +1,56 @@
+import sqlite3
+from datetime import date, datetime
+
+import analytics
+import maintenance
+
+
+def _month(today: date, back: int, day: int) -> datetime:
+    start = analytics._month_start(today, back)
+    return datetime(start.year, start.month, day, 12)
+
+
+def _insert(db, user_id, when: datetime, description, amount, category):
+    conn = db.connect(user_id)
+    with conn:
+        conn.execute(
+            "INSERT INTO expenses (user_id, description, amount, category, context, timestamp, ts) VALUES (?, ?, ?, ?, '', ?, ?)",
+            (user_id, description, amount, category, when.isoformat(), db.to_epoch(when)))
+    conn.close()
+
+
+def test_archived_months_read_from_summaries(scratch_db):
+    db = scratch_db
+    today = datetime.now().date()
+    for back in (3, 2, 1):
+        _insert(db, "u1", _month(today, back, 5), "午饭", 30 + back, "餐饮")
+        _insert(db, "u1", _month(today, back, 20), "电影", 50 + back, "")
+    _insert(db, "u1", datetime.combine(today, datetime.min.time()), "奶茶", 18, "餐饮")
+    _insert(db, "u2", _month(today, 2, 5), "午饭", 999, "餐饮")
+
+    before = analytics.summarize_spending("u1", 4)
+    path = db.router.path_for("u1")
+    cutoff = _month(today, 1, 15).date()
+    assert maintenance._archive_shard(path, cutoff, 2) > 0
+    after = analytics.summarize_spending("u1", 4)
+    for key in ("total", "count", "by_category", "monthly"):
+        assert after[key] == before[key], key
+
+    # 整月归档的月份只读汇总表：清空这些月份的冷表明细后结果不变
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("DELETE FROM expenses_archive WHERE ts < ?", (db.to_epoch(cutoff.replace(day=1)),))
+    conn.close()
+    assert analytics.summarize_spending("u1", 4)["monthly"] == before["monthly"]
+    assert {"category": "未分类", "total": 156.0, "count": 3, "share": 0.578} in before["by_category"]
+
+
+def test_partial_start_month_scans_rows(scratch_db):
+    db = scratch_db
+    conn = sqlite3.connect(db.router.path_for("u1"))
+    with conn:
+        conn.execute("INSERT INTO meta (key, value) VALUES ('archive_cutoff', '2025-06-15')")
+    assert db.summarized_months(conn, "2025-03-01") == ("2025-06", "2025-06-01")
+    assert db.summarized_months(conn, "2025-03-10") == ("", "2025-03-10")
+    assert db.summarized_months(conn, "2025-06-01") == ("", "2025-06-01")
+    conn.close()
@@ -0,0 +1,49 @@
+import sqlite3
+
+import backup
+import pytest
+
+
+def _fill(path, rows=3000):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS t (id INTEGER PRIMARY KEY, payload TEXT)")
+    conn.executemany("INSERT INTO t (payload) VALUES (?)", [("x" * 200,) for _ in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def test_progress_reaches_total_without_busy_steps(tmp_path):
+    src = tmp_path / "src.db"
+    _fill(src)
+    calls = []
+    stats = backup.backup_file(str(src), str(tmp_path / "dst.db"), pages=16, sleep_ms=0,
+                               progress=lambda name, copied, total: calls.append((copied, total)))
+    assert stats["busy_steps"] == 0
+    assert stats["restarts"] == 0
+    assert calls[-1][0] == calls[-1][1] == stats["pages"]
+    assert stats["steps"] == len(calls)
+    assert backup.integrity_check(str(tmp_path / "dst.db")) == "ok"
+
+
+def test_print_progress_ends_line(capsys):
+    backup._print_progress("p.db", 5, 10)
+    backup._print_progress("p.db", 10, 10)
+    assert capsys.readouterr().out.endswith("10/10 页\n")
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_snapshot_verify_and_rotate(scratch_db, tmp_path, compress):
+    scratch_db.add_expense("u1", "午饭", 25, "餐饮", "")
+    root = tmp_path / "backups"
+    manifests = []
+    for _ in range(3):
+        manifest = backup.create_snapshot(pages=8, sleep_ms=0, compress=compress, keep=2, root=root)
+        manifests.append(manifest)
+    snapshots = backup.list_snapshots(root)
+    assert [p.name for p in snapshots] == [m["snapshot"] for m in manifests[-2:]]
+    assert manifests[-1]["removed"] == [manifests[0]["snapshot"]]
+    assert set(manifests[-1]["shards"]) == {p.split("/")[-1] for p in scratch_db.all_db_paths()}
+    for stats in manifests[-1]["shards"].values():
+        assert stats["integrity"] == "ok"
+        assert stats["file"].endswith(".gz") == compress
+    assert set(backup.verify_snapshot(snapshots[-1]).values()) == {"ok"}
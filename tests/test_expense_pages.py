@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import maintenance
+import pytest
+
+
+@pytest.fixture
+def tools(scratch_db):
+    # tools 导入时会初始化数据库，放在临时数据库配置好之后
+    import tools
+
+    return tools
+
+
+def add_at(db, user_id, description, when: datetime):
+    conn = db.connect(user_id)
+    with conn:
+        conn.execute("INSERT INTO expenses (user_id, description, amount, category, context, timestamp, ts) "
+                     "VALUES (?, ?, 10, '餐饮', '', ?, ?)", (user_id, description, when.isoformat(), db.to_epoch(when)))
+    conn.close()
+
+
+def all_pages(tools, user_id, limit):
+    pages, cursor = [], None
+    while True:
+        page = tools.view_recent_expenses.invoke({"user_id": user_id, "cursor": cursor, "limit": limit})
+        pages.append([e["description"] for e in page["expenses"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_round_trip_rows_sharing_a_timestamp(tools, scratch_db):
+    same_time = datetime.now().replace(microsecond=0)
+    for i in range(7):
+        add_at(scratch_db, "u1", f"e{i}", same_time)
+    add_at(scratch_db, "u2", "other", same_time)
+    # 同一时间的记录按 id 倒序，不重复也不遗漏
+    assert all_pages(tools, "u1", 3) == [["e6", "e5", "e4"], ["e3", "e2", "e1"], ["e0"]]
+
+
+def test_full_last_page_has_no_cursor(tools, scratch_db):
+    for i in range(6):
+        scratch_db.add_expense("u1", f"e{i}", 10, "餐饮", "")
+    assert all_pages(tools, "u1", 3) == [["e5", "e4", "e3"], ["e2", "e1", "e0"]]
+    assert all_pages(tools, "nobody", 3) == [[]]
+
+
+def test_pages_continue_into_archived_rows(tools, scratch_db):
+    old = datetime.now() - timedelta(days=800)
+    for i in range(3):
+        add_at(scratch_db, "u1", f"old{i}", old)
+    for i in range(2):
+        scratch_db.add_expense("u1", f"new{i}", 10, "餐饮", "")
+    maintenance.archive_expenses(horizon_days=400)
+    assert all_pages(tools, "u1", 2) == [["new1", "new0"], ["old2", "old1"], ["old0"]]
+
+
+def test_limit_is_clamped_and_bad_cursor_reported(tools, scratch_db):
+    for i in range(12):
+        scratch_db.add_expense("u1", f"e{i}", 10, "餐饮", "")
+    page = tools.view_recent_expenses.invoke({"user_id": "u1", "limit": 50})
+    assert len(page["expenses"]) == tools.MAX_EXPENSE_PAGE and page["next_cursor"]
+    assert "error" in tools.view_recent_expenses.invoke({"user_id": "u1", "cursor": "garbage"})
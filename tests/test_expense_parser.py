@@ -0,0 +1,56 @@
+import expense_parser
+import pytest
+
+
+@pytest.mark.parametrize("text, amount, category", [
+    ("午饭 25 元", 25.0, "餐饮"),
+    ("买了本书 58", 58.0, "学习"),
+    ("打车 30 块", 30.0, "交通"),
+    ("今天晚饭 40 元", 40.0, "餐饮"),
+    ("充了话费 50", 50.0, "通讯"),
+])
+def test_clear_expense_is_confident(text, amount, category):
+    parsed = expense_parser.parse(text)
+    assert parsed.confident, parsed.reason
+    assert parsed.amount == amount
+    assert parsed.category == category
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("我不想花 50 元看电影", "包含否定或不记账用语"),
+    ("别记 午饭 25", "包含否定或不记账用语"),
+    ("不用记 奶茶 15", "包含否定或不记账用语"),
+    ("卖了耳机 300 元", "收入或出售，不是支出"),
+    ("明天要交房租 1500", "不是当天的消费"),
+    ("下个月买电脑 5000 元", "不是当天的消费"),
+    ("昨天午饭 25 元", "不是当天的消费"),
+    ("上周打车 30 块", "不是当天的消费"),
+    ("10月1日 午饭 25", "不是当天的消费"),
+    ("周三 打车 30", "不是当天的消费"),
+])
+def test_ambiguous_messages_go_to_model(text, reason):
+    parsed = expense_parser.parse(text)
+    assert not parsed.confident
+    assert parsed.reason == reason
+
+
+@pytest.mark.parametrize("text, reason", [
+    ("午饭 25 元，晚饭 40 元", "包含多个金额"),
+    ("这个耳机 300 元值得买吗", "包含咨询或计划类用词"),
+])
+def test_existing_blocking_rules(text, reason):
+    assert expense_parser.parse(text).reason == reason
+
+
+def test_quantities_are_not_amounts():
+    parsed = expense_parser.parse("买了 2 本书 58 元")
+    assert parsed.amount == 58.0
+
+
+def test_no_amount_returns_none():
+    assert expense_parser.parse("今天心情不错") is None
+
+
+def test_chinese_numerals():
+    assert expense_parser.chinese_number("一百零八") == 108
+    assert expense_parser.parse("奶茶十五块").amount == 15.0
@@ -0,0 +1,88 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from llm_scheduler import LLMScheduler
+
+
+def run_turn(app, text, user_id="u1", thread_id="t1"):
+    return app.invoke({"user_id": user_id, "messages": [HumanMessage(content=text)]},
+                      config={"configurable": {"thread_id": thread_id}})
+
+
+def shed(model, name):
+    """让模型的每次调用都因队列已满被调度器丢弃"""
+    model.rate_limiter = LLMScheduler(queue_limit=0).rate_limiter(name)
+    return model
+
+
+def test_shed_chat_call_replies_busy(graph_module):
+    graph_module.llm_intent.replies = [AIMessage(content="consult")]
+    shed(graph_module.llm_chat, "chat")
+    app = graph_module.build_graph(MemorySaver(), mode="two_call")
+    result = run_turn(app, "这个月还能买耳机吗")
+    assert result["messages"][-1].content == graph_module.GraphConstants.BUSY_REPLY
+    assert graph_module.llm_chat.calls == []
+
+
+def test_shed_fused_call_replies_busy(graph_module):
+    shed(graph_module.llm_chat, "chat")
+    app = graph_module.build_graph(MemorySaver(), mode="fused")
+    result = run_turn(app, "这个月还能买耳机吗")
+    assert result["messages"][-1].content == graph_module.GraphConstants.BUSY_REPLY
+    assert result["last_intent"] == "unknown"
+
+
+def test_shed_plan_call_ends_turn(graph_module):
+    graph_module.llm_intent.replies = [AIMessage(content="generate_plan")]
+    shed(graph_module.llm_plan, "plan")
+    app = graph_module.build_graph(MemorySaver(), mode="two_call")
+    result = run_turn(app, "帮我制定一个三个月存 3000 元的计划")
+    assert result["messages"][-1].content == graph_module.GraphConstants.BUSY_REPLY
+    # 计划 agent 没有结果时不再调用 chatbot
+    assert graph_module.llm_chat.calls == []
+
+
+def _parse_log(db, user_id):
+    conn = db.connect(user_id)
+    try:
+        return conn.execute("SELECT outcome, reason, llm_amount FROM expense_parse_log WHERE user_id = ?",
+                            (user_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+def _all_calls(graph_module):
+    return sum(len(getattr(graph_module, name).calls)
+               for name in ("llm_chat", "llm_intent", "llm_plan", "llm_background"))
+
+
+def test_confident_expense_is_logged_without_llm(graph_module, monkeypatch):
+    monkeypatch.setattr(graph_module, "FAST_EXPENSE_PATH", "on")
+    app = graph_module.build_graph(MemorySaver())
+    result = run_turn(app, "午饭 25 元")
+    assert result["messages"][-1].content.startswith("已记录：午饭 25.00 元（餐饮）")
+    assert result["last_intent"] == "log_expense"
+    assert _all_calls(graph_module) == 0
+    [expense] = graph_module.db.get_recent_expenses("u1")
+    assert (expense["description"], expense["amount"], expense["category"]) == ("午饭", 25.0, "餐饮")
+    assert _parse_log(graph_module.db, "u1") == [("fast_path", "", None)]
+
+
+def test_suspicious_expense_falls_back_to_full_graph(graph_module, monkeypatch):
+    monkeypatch.setattr(graph_module, "FAST_EXPENSE_PATH", "on")
+    graph_module.llm_intent.replies = [AIMessage(content="log_expense")]
+    graph_module.llm_chat.replies = [
+        AIMessage(content="", tool_calls=[{"name": "log_notable_expense", "id": "call_1",
+                                           "args": {"description": "盲盒", "amount": 59, "category": "娱乐",
+                                                    "context": ""}}]),
+        AIMessage(content="已记录盲盒 59 元，这类消费本月已经出现过，留意一下哦。"),
+    ]
+    app = graph_module.build_graph(MemorySaver(), mode="two_call")
+    result = run_turn(app, "买了个盲盒 59 元")
+
+    # 触发冲动消费关键词，交给模型结合计划给出提醒，只由模型的工具调用入账一次
+    assert result["messages"][-1].content.startswith("已记录盲盒 59 元")
+    assert len(graph_module.llm_intent.calls) == 1 and len(graph_module.llm_chat.calls) == 2
+    assert [e["description"] for e in graph_module.db.get_recent_expenses("u1")] == ["盲盒"]
+    [(outcome, reason, llm_amount)] = _parse_log(graph_module.db, "u1")
+    assert outcome == "fallback" and "盲盒" in reason
+    assert llm_amount == 59
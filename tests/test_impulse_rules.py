@@ -0,0 +1,80 @@
+import json
+import os
+
+import impulse_rules
+import pytest
+from impulse_rules import DEFAULT_RULES_PATH, AhoCorasick, RuleEngine, compute_features
+
+
+def test_automaton_finds_overlapping_keywords_in_order():
+    matcher = AhoCorasick(["盲盒", "盲盒手办", "手办", "he", "she", "his", "hers"])
+    assert matcher.find_all("买了盲盒手办") == ["盲盒", "盲盒手办", "手办"]
+    # 经典用例：失败指针让 she 中的 he、hers 都被找到
+    assert matcher.find_all("USHERS") == ["she", "he", "hers"]
+    assert matcher.find_all("午饭") == []
+    assert matcher.find_all(None) == []
+
+
+def test_automaton_dedupes_repeated_hits():
+    assert AhoCorasick(["限时"]).find_all("限时折扣，限时秒杀") == ["限时"]
+
+
+@pytest.fixture
+def engine():
+    return RuleEngine(DEFAULT_RULES_PATH)
+
+
+def test_large_purchase_near_month_end_is_impulse(engine):
+    features = compute_features(400, 3000, 0, [], 2800)
+    result = engine.assess(features, "耳机", [], "数码")
+    assert result["is_impulse"]
+    # 占预算 13%（+2）且超过本月剩余额度（+2）
+    assert result["score"] == 4
+    assert result["reasons"] == ["金额占月预算的 13.3%（阈值 10%）", "本次消费超过本月剩余额度（剩余 200.00）"]
+
+
+def test_everyday_purchase_scores_zero(engine):
+    result = engine.assess(compute_features(20, 3000, 25, [], 100), "午饭", [], "餐饮")
+    assert result == {"score": 0, "reasons": [], "is_impulse": False, "is_suspicious": False}
+
+
+def test_keyword_and_category_keyword_make_it_suspicious(engine):
+    features = compute_features(30, 3000, 0, [], 100)
+    assert engine.assess(features, "盲盒", [], "")["is_suspicious"]
+    # 类别触发词只对该类别生效
+    assert engine.assess(features, "抽卡", [], "娱乐")["is_suspicious"]
+    assert not engine.assess(features, "抽卡", [], "餐饮")["is_suspicious"]
+
+
+def test_string_trigger_keywords_are_one_word(engine):
+    features = compute_features(15, 3000, 0, [], 100)
+    # 档案中的 trigger_keywords 写成了字符串：按一个词处理，而不是把每个字都当成触发词
+    assert engine.assess(features, "珍珠奶茶", "奶茶", "")["is_suspicious"]
+    assert not engine.assess(features, "茶叶蛋", "奶茶", "")["is_suspicious"]
+    assert impulse_rules.keyword_list("奶茶") == ("奶茶",)
+    assert impulse_rules.keyword_list(None) == ()
+
+
+def test_rules_reload_after_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(impulse_rules, "RELOAD_CHECK_INTERVAL", 0)
+    with open(DEFAULT_RULES_PATH, encoding="utf-8") as f:
+        config = json.load(f)
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    engine = RuleEngine(str(path))
+    features = compute_features(30, 3000, 0, [], 100)
+    assert engine.ruleset().version == 1
+    assert not engine.assess(features, "奶茶", [], "")["is_suspicious"]
+
+    config["keywords"] = config["keywords"] + ["奶茶"]
+    path.write_text(json.dumps(config, ensure_ascii=False), encoding="utf-8")
+    mtime = os.path.getmtime(path) + 10
+    os.utime(path, (mtime, mtime))
+    assert engine.assess(features, "奶茶", [], "")["is_suspicious"]
+    assert engine.ruleset().version == 2
+
+    # 写坏的文件不生效，沿用上一版规则
+    path.write_text("{", encoding="utf-8")
+    os.utime(path, (mtime + 10, mtime + 10))
+    assert engine.ruleset().version == 2
+    assert engine.assess(features, "奶茶", [], "")["is_suspicious"]
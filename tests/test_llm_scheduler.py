@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+from llm_scheduler import LLMOverloaded, LLMScheduler, PriorityClass, TokenBucket
+
+CLASSES = {
+    "chat": PriorityClass(0, 0.0, 2.0),
+    "background": PriorityClass(3, 0.5, 0.0),
+    "batch": PriorityClass(4, 0.0, 2.0),
+}
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert not bucket.has(1, 0)
+    bucket.refill(bucket._updated + 10)
+    assert bucket.level == pytest.approx(10)
+    assert bucket.seconds_until(20, 0) == pytest.approx(10)
+    bucket.refill(bucket._updated + 1000)
+    assert bucket.level == 60
+
+
+def test_token_bucket_reserve_and_unlimited():
+    bucket = TokenBucket(100)
+    bucket.take(60)
+    assert bucket.has(10, 0.3)
+    assert not bucket.has(11, 0.3)
+    unlimited = TokenBucket(0)
+    unlimited.take(10 ** 9)
+    assert unlimited.has(10 ** 9, 0.9) and unlimited.seconds_until(1, 0.9) == 0
+
+
+def test_unlimited_scheduler_admits_everything():
+    scheduler = LLMScheduler(classes=CLASSES)
+    for _ in range(100):
+        assert scheduler.acquire("batch")
+    metrics = scheduler.metrics()
+    assert metrics["requests_available"] is None
+    assert metrics["classes"]["batch"]["admitted"] == 100
+
+
+def test_background_sheds_below_reserve_without_waiting():
+    scheduler = LLMScheduler(requests_per_minute=10, classes=CLASSES)
+    for _ in range(5):
+        scheduler.acquire("chat")
+    started = time.monotonic()
+    with pytest.raises(LLMOverloaded):
+        scheduler.acquire("background")
+    assert time.monotonic() - started < 0.5
+    assert scheduler.acquire("chat")
+    assert scheduler.metrics()["classes"]["background"]["shed_deadline"] == 1
+
+
+def test_token_usage_blocks_reserved_classes():
+    scheduler = LLMScheduler(tokens_per_minute=1000, classes=CLASSES)
+    scheduler.record_tokens("chat", 600)
+    assert not scheduler.acquire("background", blocking=False)
+    assert scheduler.acquire("chat", blocking=False)
+    assert scheduler.metrics()["classes"]["chat"]["tokens"] == 600
+
+
+def test_queue_full_sheds():
+    scheduler = LLMScheduler(requests_per_minute=60, queue_limit=0, classes=CLASSES)
+    with pytest.raises(LLMOverloaded):
+        scheduler.acquire("chat")
+    assert scheduler.metrics()["classes"]["chat"]["shed_queue_full"] == 1
+
+
+def test_higher_priority_admitted_first():
+    # 每秒补充 20 个请求额度，清空后按优先级逐个准入
+    scheduler = LLMScheduler(requests_per_minute=1200, classes=CLASSES)
+    scheduler._requests.level = 0
+    order = []
+
+    def call(name):
+        scheduler.acquire(name)
+        order.append(name)
+
+    threads = [threading.Thread(target=call, args=("batch",)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.01)
+    chat = threading.Thread(target=call, args=("chat",))
+    chat.start()
+    for thread in threads + [chat]:
+        thread.join()
+    assert order.index("chat") <= 1
+    assert sorted(order) == ["batch", "batch", "batch", "chat"]
@@ -0,0 +1,74 @@
+from datetime import date
+
+import plan_calculator as pc
+import pytest
+
+
+@pytest.mark.parametrize("goal, stages", [(6000, 12), (1000, 3), (7, 12), (0.5, 4), (12345.67, 7), (100, 1)])
+def test_schedule_sums_to_goal(goal, stages):
+    plan = pc.schedule(goal, stages, date(2026, 1, 15))
+    total = plan["stages_amount"] * (stages - 1) + plan["last_stage_amount"]
+    assert total == pytest.approx(goal, abs=0.01)
+    assert 0 <= plan["last_stage_amount"] <= plan["stages_amount"]
+    assert plan["rows"][-1]["cumulative"] == pytest.approx(goal)
+
+
+def test_schedule_rounds_up_to_whole_yuan():
+    plan = pc.schedule(1000, 3, date(2026, 11, 1))
+    assert plan["stages_amount"] == 334
+    assert plan["last_stage_amount"] == 332
+    assert [row["month"] for row in plan["rows"]] == ["2026-11", "2026-12", "2027-01"]
+
+
+def test_schedule_truncates_long_plans():
+    plan = pc.schedule(36000, 36, date(2026, 1, 1))
+    assert len(plan["rows"]) == pc.MAX_SCHEDULE_ROWS
+    assert plan["omitted_stages"] == 36 - pc.MAX_SCHEDULE_ROWS
+
+
+def test_monthly_surplus_uses_larger_spend_basis():
+    assert pc.monthly_surplus(5000, 2000, 2600) == 2400
+    assert pc.monthly_surplus(5000, 3000, None) == 2000
+    assert pc.monthly_surplus(0, 2000, 1500) is None
+
+
+def test_stages_between_deadline():
+    assert pc.stages_between(date(2026, 1, 1), date(2026, 7, 1)) == 6
+    assert pc.stages_between(date(2026, 1, 1), date(2026, 1, 5)) == 1
+
+
+@pytest.mark.parametrize("required, surplus, level", [
+    (500, 1000, "comfortable"),
+    (700, 1000, "feasible"),
+    (950, 1000, "tight"),
+    (1200, 1000, "infeasible"),
+    (100, -200, "infeasible"),
+    (100, None, "unknown"),
+])
+def test_feasibility_levels(required, surplus, level):
+    assert pc._feasibility(required, surplus)["level"] == level
+
+
+def test_saving_plan_infeasible_suggests_cut_and_alternatives():
+    result = pc.saving_plan(12000, income=4000, monthly_budget=3000, stages=6, start=date(2026, 1, 1))
+    assert result["stages_amount"] == 2000
+    assert result["monthly_surplus"] == 1000
+    assert result["feasibility"]["level"] == "infeasible"
+    assert result["monthly_cut_needed"] == 1000
+    assert result["shortest_sustainable"]["stages"] == 15
+    assert result["reachable_goal_by_deadline"] == 4800
+    assert [alt["stages"] for alt in result["alternatives"]] == [9, 12]
+
+
+def test_saving_plan_without_income():
+    result = pc.saving_plan(3000, income=0, monthly_budget=1500, deadline=date(2026, 7, 1), start=date(2026, 1, 1))
+    assert result["stages"] == 6
+    assert result["feasibility"]["level"] == "unknown"
+    assert "shortest_sustainable" not in result
+    assert "monthly_cut_needed" not in result
+
+
+def test_saving_plan_notes_existing_savings():
+    result = pc.saving_plan(2000, income=5000, monthly_budget=2000, saving=3000, start=date(2026, 1, 1))
+    assert "note" in result
+    assert result["feasibility"]["level"] == "comfortable"
@@ -0,0 +1,15 @@
+import prompts
+
+
+def test_log_expense_can_check_impulse_buying():
+    # 快速通道因冲动消费规则回退给模型时，log_expense 意图必须能调用 detect_impulse_buying
+    tools = prompts.get_intent_tool_map()["log_expense"]
+    assert "log_notable_expense" in tools
+    assert "detect_impulse_buying" in tools
+
+
+def test_guidance_mentions_bound_tools():
+    guidance = prompts.get_guidance_map()
+    for intent, tools in prompts.get_intent_tool_map().items():
+        if intent in guidance:
+            assert any(tool in guidance[intent] for tool in tools), intent
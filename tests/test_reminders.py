@@ -0,0 +1,123 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from reminders import ReminderScheduler, TimingWheel
+
+
+def _drain(wheel, start, until):
+    """逐秒推进，记录每个 key 实际触发的时刻"""
+    fired = {}
+    for now in range(start + 1, until + 1):
+        for key, _ in wheel.advance(now):
+            fired[key] = now
+    return fired
+
+
+# 8 槽 3 层的轮覆盖 8 ** 3 = 512 个 tick，最后两个用例超出最高层范围
+@pytest.mark.parametrize("delay", [1, 2, 7, 8, 9, 63, 64, 65, 511, 512, 513, 5000])
+def test_fires_exactly_at_due_across_levels(delay):
+    start = 1_003
+    wheel = TimingWheel(tick=1, slots=8, levels=3, now=start)
+    wheel.schedule("k", start + delay)
+    assert wheel.advance(start + delay - 1) == []
+    assert wheel.advance(start + delay) == [("k", start + delay)]
+    assert len(wheel) == 0
+
+
+def test_random_schedule_never_fires_early_or_late():
+    rng = random.Random(3)
+    start = 500
+    wheel = TimingWheel(tick=1, slots=8, levels=3, now=start)
+    due = {i: start + rng.randint(1, 2000) for i in range(300)}
+    for key, at in due.items():
+        wheel.schedule(key, at)
+    assert _drain(wheel, start, start + 2000) == due
+
+
+def test_fractional_due_rounds_up_to_next_tick():
+    wheel = TimingWheel(tick=1, now=100)
+    wheel.schedule("k", 105.2)
+    assert wheel.advance(105.9) == []
+    assert wheel.advance(106) == [("k", 105.2)]
+
+
+def test_past_due_fires_on_next_tick():
+    wheel = TimingWheel(tick=1, now=100)
+    wheel.schedule("k", 50)
+    assert wheel.advance(101) == [("k", 50)]
+
+
+def test_cancel_and_reschedule():
+    wheel = TimingWheel(tick=1, now=0)
+    wheel.schedule("a", 10)
+    wheel.schedule("b", 10)
+    wheel.cancel("a")
+    wheel.schedule("b", 20)
+    assert wheel.advance(15) == []
+    assert wheel.advance(20) == [("b", 20)]
+    assert len(wheel) == 0
+
+
+def test_empty_wheel_jumps_to_now():
+    wheel = TimingWheel(tick=1, now=0)
+    assert wheel.advance(10 ** 9) == []
+    wheel.schedule("k", 10 ** 9 + 3)
+    assert wheel.advance(10 ** 9 + 3) == [("k", 10 ** 9 + 3)]
+
+
+def test_overdue_reminder_fires_once(scratch_db):
+    db = scratch_db
+    start = (datetime.now() - timedelta(days=45)).date().isoformat()
+    plan_id = db.add_plan("u1", "储蓄", "存钱买相机", start, goal_amount=3000, stages_amount=500)
+    # 模拟停机期间错过了第 2 阶段的提醒
+    overdue = time.time() - 100
+    conn = db.connect("u1")
+    with conn:
+        conn.execute("UPDATE plan_reminders SET next_fire_at = ? WHERE plan_id = ?", (overdue, plan_id))
+    conn.close()
+
+    scheduler = ReminderScheduler(tick=1)
+    received = []
+    scheduler.subscribe(received.append)
+    delivered = scheduler.run_once(time.time() + 2)
+    assert [(r["plan_id"], r["stage"]) for r in delivered] == [(plan_id, 2)]
+    assert received == delivered
+    assert "第 2 阶段" in delivered[0]["message"]
+    assert delivered[0]["next_fire_at"] > time.time()
+
+    assert db.fire_reminder("u1", plan_id, overdue) is None
+    messages = db.pop_reminder_messages("u1")
+    assert [m["plan_id"] for m in messages] == [plan_id]
+    assert db.pop_reminder_messages("u1") == []
+
+
+def test_deleted_plan_drops_reminder(scratch_db):
+    db = scratch_db
+    start = datetime.now().date().isoformat()
+    plan_id = db.add_plan("u1", "储蓄", "旅行基金", start, goal_amount=3000, stages_amount=1000)
+    path = db.router.path_for("u1")
+    assert [row[1] for row in db.load_due_reminders(path, time.time() + 86400 * 40)] == [plan_id]
+    db.delete_plan(plan_id, "u1")
+    assert db.load_due_reminders(path, time.time() + 86400 * 400) == []
+
+
+def test_loop_errors_are_logged_and_retried(caplog, monkeypatch):
+    scheduler = ReminderScheduler(tick=0.01)
+    calls = []
+
+    def failing_run_once(now=None):
+        calls.append(now)
+        if len(calls) == 1:
+            raise RuntimeError("shard offline")
+        scheduler._stop.set()
+        return []
+
+    monkeypatch.setattr(scheduler, "run_once", failing_run_once)
+    monkeypatch.setattr(scheduler, "_sleep_seconds", lambda: 0)
+    with caplog.at_level("ERROR", logger="reminders"):
+        scheduler._run()
+    assert len(calls) == 2
+    assert "scheduler iteration failed" in caplog.text
+    assert "shard offline" in caplog.text
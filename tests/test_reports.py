@@ -0,0 +1,33 @@
+from datetime import date
+
+import impulse_rules
+import reports
+
+
+def test_impulse_flags_use_spending_stats(scratch_db, monkeypatch):
+    db = scratch_db
+    db.update_user_profile("u1", {"monthly_budget": 3000})
+    for amount in [20, 25, 30, 22, 28, 35, 18, 26, 24, 31, 27]:
+        db.add_expense("u1", "午饭", amount, "餐饮", "")
+    db.add_expense("u1", "新耳机", 1200, "数码", "")
+
+    calls = []
+    compute_features = impulse_rules.compute_features
+
+    def spy(*args, **kwargs):
+        features = compute_features(*args, **kwargs)
+        calls.append(features)
+        return features
+
+    monkeypatch.setattr(impulse_rules, "compute_features", spy)
+    path = db.router.path_for("u1")
+    month = date.today().strftime("%Y-%m")
+    [report] = reports.build_chunk_reports(path, month, [("u1", '{"monthly_budget": 3000}')])
+
+    assert len(calls) == 12
+    assert all(f["history_count"] == 12 for f in calls)
+    headphones = next(f for f in calls if f["amount"] == 1200)
+    assert headphones["amount_zscore"] > 2
+    assert headphones["amount_percentile"] > 0.9
+    assert headphones["recent_avg_multiple"] is None
+    assert report["impulse_flags"][0]["description"] == "新耳机"
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+
+def turn_state(intent, tool, result, text="看看", args=None):
+    """一轮只读工具调用之后的状态：用户消息、工具调用、工具结果"""
+    call = {"name": tool, "args": args or {}, "id": "call_1"}
+    return {
+        "user_id": "u1",
+        "last_intent": intent,
+        "messages": [HumanMessage(content=text), AIMessage(content="", tool_calls=[call]),
+                     ToolMessage(content="{}", tool_call_id="call_1")],
+        "tool_call_history": [{"name": tool, "arguments": call["args"], "timestamp": 0.0,
+                               "result": result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)}],
+    }
+
+
+@pytest.fixture
+def renderer(graph_module):
+    return graph_module.ResponseRenderer(intents=["review_plan", "view_recent_expenses"])
+
+
+def render(renderer, state):
+    assert renderer.route_after_tools(state) == "render_response"
+    return renderer.render_response(state)["messages"][0].content
+
+
+PLANS = [
+    {"id": 3, "content": "旅行基金", "plan_type": "储蓄", "goal_amount": 5000, "amount_achieved": 1200.5,
+     "progress_status": "behind", "projected_completion": "2026-03-01"},
+    {"id": 4, "content": "少点外卖", "plan_type": "消费节制", "goal_amount": 800, "amount_achieved": 300,
+     "progress_status": "on_track"},
+]
+
+
+def test_review_plan_lists_each_plan(renderer):
+    reply = render(renderer, turn_state("review_plan", "view_plan", PLANS))
+    assert reply.splitlines() == [
+        "你目前有 2 个进行中的计划：",
+        "1. 旅行基金（储蓄，ID 3）：目标 5000.00 元，已存 1200.50 元，落后于计划，预计 2026-03-01 完成。",
+        "2. 少点外卖（消费节制，ID 4）：目标 800.00 元，已花费 300.00 元，按计划进行。",
+        "需要调整哪个计划可以告诉我。",
+    ]
+
+
+def test_review_plan_without_plans(renderer):
+    assert render(renderer, turn_state("review_plan", "view_plan", [])) == \
+        "你目前没有进行中的计划。想制定一个储蓄或消费节制计划吗？"
+
+
+def test_review_plan_skips_missing_optional_fields(renderer):
+    reply = render(renderer, turn_state("review_plan", "view_plan", [{"id": 5, "content": "攒钱", "plan_type": "储蓄"}]))
+    assert "1. 攒钱（储蓄，ID 5）。" in reply.splitlines()
+
+
+EXPENSES = [
+    {"id": 9, "description": "午饭", "amount": 25, "category": "餐饮", "timestamp": "2025-03-02T12:00:00"},
+    {"id": 8, "description": "打车", "amount": 30.5, "category": "", "timestamp": None},
+]
+
+
+def test_recent_expenses_first_page_with_more(renderer):
+    state = turn_state("view_recent_expenses", "view_recent_expenses", {"expenses": EXPENSES, "next_cursor": "ZTo4"})
+    assert render(renderer, state).splitlines() == [
+        "最近的 2 笔支出：",
+        "- 2025-03-02 午饭 25.00 元（餐饮）",
+        "- 打车 30.50 元",
+        "合计 55.50 元。想看更早的记录可以继续告诉我。",
+    ]
+
+
+def test_recent_expenses_later_and_empty_pages(renderer):
+    later = turn_state("view_recent_expenses", "view_recent_expenses", {"expenses": EXPENSES[:1], "next_cursor": None},
+                       args={"cursor": "ZTo5"})
+    assert render(renderer, later).splitlines() == ["更早的 1 笔支出：", "- 2025-03-02 午饭 25.00 元（餐饮）", "合计 25.00 元。"]
+    empty = turn_state("view_recent_expenses", "view_recent_expenses", {"expenses": [], "next_cursor": None})
+    assert render(renderer, empty) == "还没有支出记录。"
+    empty_later = turn_state("view_recent_expenses", "view_recent_expenses", {"expenses": [], "next_cursor": None},
+                             args={"cursor": "ZTo5"})
+    assert render(renderer, empty_later) == "没有更早的支出记录了。"
+
+
+@pytest.mark.parametrize("state", [
+    # 意图没有配置模板
+    turn_state("review_profile", "view_user_profile", {"monthly_budget": 3000}),
+    # 工具出错，结果是一段文字
+    turn_state("view_recent_expenses", "view_recent_expenses", "工具执行出错: boom"),
+    # 结果缺少模板需要的字段
+    turn_state("view_recent_expenses", "view_recent_expenses", {"error": "无效的游标"}),
+    turn_state("review_plan", "view_plan", {"plans": PLANS}),
+    # 字段类型不符合模板
+    turn_state("view_recent_expenses", "view_recent_expenses",
+               {"expenses": [{"description": "午饭", "amount": "二十五"}], "next_cursor": None}),
+    # 用户要求分析
+    turn_state("view_recent_expenses", "view_recent_expenses", {"expenses": EXPENSES, "next_cursor": None},
+               text="最近的支出合理吗"),
+    # 意图对应的工具与实际调用的不一致
+    turn_state("review_plan", "view_recent_expenses", {"expenses": EXPENSES, "next_cursor": None}),
+])
+def test_falls_back_to_chatbot(renderer, state):
+    assert renderer.route_after_tools(state) == "chatbot"
+
+
+def test_intents_not_enabled_use_chatbot(graph_module):
+    renderer = graph_module.ResponseRenderer(intents=["review_plan"])
+    state = turn_state("view_recent_expenses", "view_recent_expenses", {"expenses": EXPENSES, "next_cursor": None})
+    assert renderer.route_after_tools(state) == "chatbot"
@@ -0,0 +1,97 @@
+import threading
+import time
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import START, StateGraph
+from langgraph.graph.message import add_messages
+from sessions import SessionManager, session_thread_id
+
+
+class EchoState(TypedDict):
+    messages: Annotated[list, add_messages]
+    user_id: str
+
+
+def build_echo_app(checkpointer, delay: float = 0.0):
+    """回复 "本线程的用户消息数|同时执行的轮次数|本线程同时执行的轮次数" """
+    lock = threading.Lock()
+    active = {}
+
+    def reply(state: EchoState, config):
+        thread_id = config["configurable"]["thread_id"]
+        with lock:
+            active[thread_id] = active.get(thread_id, 0) + 1
+            running, overlap = sum(active.values()), active[thread_id]
+        time.sleep(delay)
+        with lock:
+            active[thread_id] -= 1
+        count = sum(isinstance(m, HumanMessage) for m in state["messages"])
+        return {"messages": [AIMessage(content=f"{count}|{running}|{overlap}")]}
+
+    builder = StateGraph(EchoState)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def _reply(result):
+    count, running, overlap = result["messages"][-1].content.split("|")
+    return int(count), int(running), int(overlap)
+
+
+def test_evicted_session_is_restored_from_database(scratch_db):
+    checkpointer = MemorySaver()
+    manager = SessionManager(build_echo_app(checkpointer), checkpointer, max_sessions=1, idle_seconds=3600)
+    assert _reply(manager.run("u1", "第一句", "a"))[0] == 1
+    assert _reply(manager.run("u1", "第二句", "a"))[0] == 2
+
+    # 超出上限时最久未用的会话被写入 sessions 表并从内存中删除
+    manager.run("u2", "你好", "b")
+    thread_a = session_thread_id("u1", "a")
+    assert checkpointer.get_tuple({"configurable": {"thread_id": thread_a, "checkpoint_ns": ""}}) is None
+    assert scratch_db.load_session_checkpoint("u1", thread_a) is not None
+    assert manager.metrics() == {"live_sessions": 1, "evicted": 1, "restored": 0}
+
+    result = manager.run("u1", "第三句", "a")
+    assert _reply(result)[0] == 3
+    assert [m.content for m in result["messages"] if isinstance(m, HumanMessage)] == ["第一句", "第二句", "第三句"]
+    assert manager.metrics()["restored"] == 1
+
+
+def test_idle_sessions_are_evicted_and_close_saves_all(scratch_db):
+    checkpointer = MemorySaver()
+    manager = SessionManager(build_echo_app(checkpointer), checkpointer, idle_seconds=0, sweep_interval=3600)
+    manager.run("u1", "你好", "a")
+    manager.run("u1", "你好", "b")
+    assert manager.evict(idle=False) == 0
+    assert manager.evict(idle=True) == 2
+    assert manager.metrics()["live_sessions"] == 0
+
+    manager.run("u2", "你好")
+    manager.close()
+    assert scratch_db.load_session_checkpoint("u2", session_thread_id("u2")) is not None
+    assert _reply(manager.run("u2", "再见"))[0] == 2
+
+
+def test_same_session_runs_serially_and_sessions_run_in_parallel(scratch_db):
+    checkpointer = MemorySaver()
+    manager = SessionManager(build_echo_app(checkpointer, delay=0.05), checkpointer)
+    results = []
+
+    def send(session_id):
+        results.append((session_id, _reply(manager.run("u1", "记一笔", session_id))))
+
+    threads = [threading.Thread(target=send, args=(session_id,)) for session_id in ("a", "a", "a", "b", "b", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 同一会话的轮次从不重叠，且每轮都看到前面所有轮次的消息
+    assert all(overlap == 1 for _, (_, _, overlap) in results)
+    for session_id in ("a", "b"):
+        assert sorted(count for s, (count, _, _) in results if s == session_id) == [1, 2, 3]
+    # 不同会话可以同时执行
+    assert max(running for _, (_, running, _) in results) == 2
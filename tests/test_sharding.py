@@ -0,0 +1,127 @@
+import sqlite3
+from collections import Counter
+from datetime import date, datetime
+
+import analytics
+import maintenance
+import reshard
+from sharding import ConsistentHashRing, ShardRouter
+
+USERS = [f"user_{i:03d}" for i in range(400)]
+
+
+def test_ring_is_deterministic_and_balanced():
+    ring = ConsistentHashRing(4)
+    assert [ring.shard_for(u) for u in USERS] == [ConsistentHashRing(4).shard_for(u) for u in USERS]
+    counts = Counter(ring.shard_for(u) for u in USERS)
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > len(USERS) / 4 * 0.6
+
+
+def test_adding_a_shard_moves_only_users_to_it():
+    before, after = ConsistentHashRing(3), ConsistentHashRing(4)
+    moved = [u for u in USERS if before.shard_for(u) != after.shard_for(u)]
+    assert all(after.shard_for(u) == 3 for u in moved)
+    assert len(moved) < len(USERS) / 2
+
+
+def test_router_paths():
+    router = ShardRouter("/data/pocketwise.db", 3)
+    assert router.paths() == ["/data/pocketwise.db", "/data/pocketwise-shard1.db", "/data/pocketwise-shard2.db"]
+    assert ShardRouter("/data/pocketwise.db").path_for("anyone") == "/data/pocketwise.db"
+
+
+def _count(path, table, user_id):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_reshard_moves_user_rows_and_remaps_plans(scratch_db, tmp_path):
+    db = scratch_db
+    (tmp_path / "resharded").mkdir()
+    db.configure_shards(str(tmp_path / "resharded" / "pocketwise.db"), 1)
+    db.init_shard(db.DB_PATH)
+    users = USERS[:12]
+    for i, user_id in enumerate(users):
+        db.update_user_profile(user_id, {"monthly_budget": 1000 + i})
+        db.add_expense(user_id, "午饭", 20 + i, "餐饮", "")
+        db.add_expense(user_id, "电影", 50, "娱乐", "")
+        db.add_plan(user_id, "储蓄", f"计划 {i}", date.today().isoformat(), goal_amount=1200, stages_amount=100)
+
+    moved = reshard.reshard(1, 3)
+    assert sum(moved.values()) > 0
+    db.configure_shards(db.DB_PATH, 3)
+    for user_id in users:
+        home = db.router.path_for(user_id)
+        for path in db.all_db_paths():
+            expected = 2 if path == home else 0
+            assert _count(path, "expenses", user_id) == expected, (user_id, path)
+        assert db.get_user_profile(user_id)["monthly_budget"] >= 1000
+        [plan] = db.get_active_plans(user_id)
+        conn = sqlite3.connect(home)
+        progress = conn.execute("SELECT plan_id FROM plan_progress WHERE plan_id = ?", (plan["id"],)).fetchone()
+        reminder = conn.execute("SELECT user_id FROM plan_reminders WHERE plan_id = ?", (plan["id"],)).fetchone()
+        conn.close()
+        assert progress is not None
+        assert reminder == (user_id,)
+        assert db.get_spending_stats(user_id)["overall"].count == 2
+
+
+def _insert_at(db, path, user_id, when: datetime, amount):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO expenses (user_id, description, amount, category, context, timestamp, ts) VALUES (?, '午饭', ?, '餐饮', '', ?, ?)",
+            (user_id, amount, when.isoformat(), db.to_epoch(when)))
+    conn.close()
+
+
+def _monthly(db, user_id, start):
+    conn = db.connect(user_id)
+    try:
+        return analytics.monthly_totals(conn, user_id, start)
+    finally:
+        conn.close()
+
+
+def test_reshard_aligns_mismatched_archive_cutoffs(scratch_db, tmp_path):
+    db = scratch_db
+    (tmp_path / "resharded").mkdir()
+    db.configure_shards(str(tmp_path / "resharded" / "pocketwise.db"), 1)
+    today = datetime.now().date()
+    months = [analytics._month_start(today, back) for back in (5, 4, 3, 2, 1)]
+    start = months[0].isoformat()
+    new_router = ShardRouter(db.DB_PATH, 3)
+    paths = new_router.paths()
+    for path in paths:
+        db.init_shard(path)
+
+    # 旧分片在第 3 个月中旬归档；新分片 1 的水位线更新（第 4 个月），新分片 2 更旧（第 2 个月）
+    cutoffs = {paths[0]: months[2], paths[1]: months[3], paths[2]: months[1]}
+    movers = [u for u in USERS[:40] if new_router.path_for(u) != paths[0]][:8]
+    residents = {path: next(f"resident_{i}" for i in range(1000) if new_router.path_for(f"resident_{i}") == path)
+                 for path in paths[1:]}
+    placed = [(paths[0], u) for u in movers] + [(path, u) for path, u in residents.items()]
+    for path, user_id in placed:
+        for i, month in enumerate(months):
+            _insert_at(db, path, user_id, datetime(month.year, month.month, 5, 12), 10 + i)
+            _insert_at(db, path, user_id, datetime(month.year, month.month, 25, 12), 100 + i)
+    for path, cutoff in cutoffs.items():
+        maintenance._archive_shard(path, cutoff.replace(day=15), 3)
+
+    before = {}
+    for path, user_id in placed:
+        db.configure_shards(db.DB_PATH, 1 if path == paths[0] else 3)
+        before[user_id] = _monthly(db, user_id, start)
+        assert len(before[user_id]) == 5
+
+    reshard.reshard(1, 3)
+    db.configure_shards(db.DB_PATH, 3)
+    for _, user_id in placed:
+        assert _monthly(db, user_id, start) == before[user_id], user_id
+    conn = sqlite3.connect(paths[2])
+    assert db.get_archive_cutoff(conn) == months[2].replace(day=15).isoformat()
+    conn.close()
@@ -0,0 +1,93 @@
+import pytest
+
+
+@pytest.fixture
+def expenses(scratch_db):
+    db = scratch_db
+    db.add_expense("u1", "买了盲盒", 59, "娱乐", "逛街时看到的")
+    db.add_expense("u1", "耳机 新款", 399, "数码", "")
+    db.add_expense("u1", "午饭", 25, "餐饮", "")
+    db.add_expense("u2", "盲盒", 69, "娱乐", "")
+    return db
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("买盲盒", "买了盲盒"),
+    ("盲盒手办", "买了盲盒"),
+    ("新款耳机", "耳机 新款"),
+    ("耳机", "耳机 新款"),
+    ("逛街看到的盲盒", "买了盲盒"),
+])
+def test_cjk_queries_recall_rewordings(expenses, query, expected):
+    results = expenses.find_similar_expenses("u1", query, k=3)
+    assert results, query
+    assert results[0]["description"] == expected
+
+
+def test_results_stay_within_user(expenses):
+    descriptions = [e["description"] for e in expenses.find_similar_expenses("u1", "盲盒", k=5)]
+    assert descriptions == ["买了盲盒"]
+
+
+def test_unrelated_query_returns_nothing(expenses):
+    assert expenses.find_similar_expenses("u1", "房租水电", k=3) == []
+
+
+def test_search_terms_skip_low_signal_bigrams():
+    import database as db
+
+    trigrams, bigrams = db._search_terms("买了盲盒")
+    assert "盲盒" in bigrams
+    assert "买了" not in bigrams and "了盲" not in bigrams
+
+
+def test_match_scores_only_the_users_documents(scratch_db):
+    db = scratch_db
+    # 同一分片上的其他用户（含 id 以 u1 开头的 u12）有大量更相关的同类支出
+    for user_id in ("u12", "u2"):
+        for _ in range(30):
+            db.add_expense(user_id, "周末买盲盒手办", 69, "娱乐", "盲盒手办")
+    db.add_expense("u1", "周末买盲盒手办", 59, "娱乐", "")
+    db.add_expense("u1", "午饭", 25, "餐饮", "")
+
+    results = db.find_similar_expenses("u1", "盲盒手办", k=1)
+    assert [(e["user_id"], e["amount"]) for e in results] == [("u1", 59)]
+
+    # 用户条件在 MATCH 内部生效：不再按 user_id 过滤，命中的也只有 u1 的文档
+    conn = db.connect("u1")
+    rows = conn.execute("SELECT e.user_id FROM expenses_fts JOIN expenses e ON e.id = expenses_fts.rowid "
+                        "WHERE expenses_fts MATCH ?", (db._fts_user_query("u1", ["盲盒手"]),)).fetchall()
+    conn.close()
+    assert rows == [("u1",)]
+
+
+def test_conversation_memory_stays_within_user(scratch_db):
+    db = scratch_db
+    db.archive_conversation_turns("u12", "t", [(f"m{i}", "用户：旅行基金怎么存\n助手：每月存 500") for i in range(20)])
+    db.archive_conversation_turns("u1", "t", [("m1", "用户：旅行基金还差多少\n助手：还差 1200")])
+    memories = db.search_conversation_memory("u1", "旅行基金", k=3)
+    assert [m["content"] for m in memories] == ["用户：旅行基金还差多少\n助手：还差 1200"]
+
+
+def test_old_fts_index_is_rebuilt_with_owner_column(tmp_path):
+    import sqlite3
+
+    import database as db
+
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE conversation_memory (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, thread_id TEXT, "
+                 "message_id TEXT, content TEXT, ts REAL, UNIQUE (user_id, message_id))")
+    conn.execute("CREATE VIRTUAL TABLE conversation_memory_fts USING fts5(content, user_id UNINDEXED, "
+                 "content='conversation_memory', content_rowid='id', tokenize='trigram')")
+    conn.execute("INSERT INTO conversation_memory (user_id, thread_id, message_id, content, ts) "
+                 "VALUES ('u1', 't', 'm1', '旅行基金还差多少', 0)")
+    conn.commit()
+    conn.close()
+
+    db.init_shard(path)
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT rowid FROM conversation_memory_fts WHERE conversation_memory_fts MATCH ?",
+                        (db._fts_user_query("u1", ["旅行基"]),)).fetchall()
+    conn.close()
+    assert rows == [(1,)]
@@ -0,0 +1,69 @@
+import json
+import random
+
+import pytest
+from spending_stats import MIN_HISTORY, QuantileSketch, RunningStats
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(3, 1) for _ in range(5000))
+    sketch = QuantileSketch()
+    for value in values:
+        sketch.add(value)
+    for q in (0.1, 0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=sketch.relative_accuracy * 1.5)
+
+
+def test_sketch_percentile_counts_zeros_and_buckets():
+    sketch = QuantileSketch()
+    for value in [0, 0, 10, 10, 100]:
+        sketch.add(value)
+    assert sketch.percentile_of(0) == pytest.approx(0.2)
+    assert sketch.percentile_of(10) == pytest.approx(0.6)
+    assert sketch.percentile_of(1000) == 1.0
+    assert QuantileSketch().percentile_of(10) is None
+
+
+def test_sketch_collapses_lowest_buckets():
+    sketch = QuantileSketch(max_buckets=8)
+    for exponent in range(40):
+        sketch.add(1.5 ** exponent)
+    assert len(sketch.buckets) == 8
+    assert sketch.count == 40
+    assert sketch.quantile(1.0) == pytest.approx(1.5 ** 39, rel=0.05)
+
+
+def test_sketch_json_roundtrip():
+    sketch = QuantileSketch()
+    for value in [0, 3.5, 12, 12, 480]:
+        sketch.add(value)
+    restored = QuantileSketch.from_json(sketch.to_json())
+    assert restored.count == sketch.count
+    assert restored.buckets == sketch.buckets
+    assert restored.quantile(0.5) == sketch.quantile(0.5)
+    assert json.loads(sketch.to_json())["z"] == 1
+
+
+def test_running_stats_matches_batch_mean_and_std():
+    values = [12.5, 30, 8, 45, 22, 19.9, 60, 15, 27, 33]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    mean = sum(values) / len(values)
+    std = (sum((v - mean) ** 2 for v in values) / (len(values) - 1)) ** 0.5
+    assert stats.mean == pytest.approx(mean)
+    assert stats.std == pytest.approx(std)
+    assert stats.zscore(mean + std) == pytest.approx(1.0)
+
+
+def test_running_stats_needs_history():
+    stats = RunningStats()
+    for value in range(1, MIN_HISTORY):
+        stats.add(value)
+    assert stats.zscore(100) is None
+    assert stats.percentile_of(100) is None
+    stats.add(MIN_HISTORY)
+    assert stats.zscore(100) > 0
+    assert stats.percentile_of(100) == 1.0
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+import tool_results as tr
+
+IMPULSE_RESULT = {
+    "is_impulse": True,
+    "score": 0.8123,
+    "reason": "金额超过该类别的 95 分位",
+    "recommendation": "建议等 24 小时再决定",
+    "remind": {
+        "monthly_budget": 3000,
+        "month_spent_estimate": 2450.456,
+        "month_remaining_estimate": 549.544,
+        "spending_history": {"category_p95": 200},
+        "active_plans": [{"id": 1, "user_id": "u1", "content": "旅行基金", "goal_amount": 5000,
+                          "amount_achieved": 1200, "progress_status": "behind", "stages_amount": None}],
+        "similar_past_expenses": [{"id": 9, "user_id": "u1", "timestamp": "2025-03-02T12:00:00",
+                                   "description": "盲盒", "amount": 69, "context": "逛街"}],
+    },
+}
+
+
+def test_impulse_shaper_keeps_only_needed_fields():
+    shaped = json.loads(tr.shape_tool_result("detect_impulse_buying", IMPULSE_RESULT))
+    assert shaped == {
+        "is_impulse": True,
+        "score": 0.81,
+        "reason": "金额超过该类别的 95 分位",
+        "recommendation": "建议等 24 小时再决定",
+        "monthly_budget": 3000,
+        "month_spent": 2450.46,
+        "month_remaining": 549.54,
+        "spending_history": {"category_p95": 200},
+        "active_plans": [{"id": 1, "content": "旅行基金", "goal_amount": 5000, "amount_achieved": 1200,
+                          "progress_status": "behind"}],
+        "similar_past_expenses": [{"date": "2025-03-02", "description": "盲盒", "amount": 69}],
+    }
+
+
+def test_impulse_shaper_passes_errors_through():
+    assert tr.shape_tool_result("detect_impulse_buying", "工具执行出错: boom") == "工具执行出错: boom"
+
+
+def _page(count, next_id=1):
+    expenses = [{"id": 100 - i, "user_id": "u1", "description": f"第 {i} 笔支出的描述", "amount": 10.0 + i,
+                 "category": "餐饮", "context": "", "timestamp": "2025-03-02T12:00:00", "ts": 0}
+                for i in range(count)]
+    return {"expenses": expenses, "next_cursor": tr.encode_cursor(next_id)}
+
+
+def test_trimmed_page_resets_cursor_to_last_kept_row():
+    text = tr.fit_to_budget(tr._shape_expenses(_page(40)), 200, tr.PAGE_CURSORS["view_recent_expenses"])
+    shaped = json.loads(text)
+    kept = shaped["expenses"]
+    assert 1 <= len(kept) < 40
+    assert shaped["expenses_omitted"] == 40 - len(kept)
+    # 下一页从最后保留的一条之后开始，被省略的记录不会丢失
+    assert tr.decode_cursor(shaped["next_cursor"]) == kept[-1]["id"]
+    assert tr.estimate_tokens(text) <= 200
+
+
+def test_untrimmed_page_keeps_cursor():
+    page = _page(3, next_id=97)
+    shaped = json.loads(tr.shape_tool_result("view_recent_expenses", page))
+    assert tr.decode_cursor(shaped["next_cursor"]) == 97
+    assert "expenses_omitted" not in shaped
+
+
+@pytest.mark.parametrize("obj", [
+    {"summary": "很长的说明" * 400, "count": 3},
+    [{"description": "很长的描述" * 400}],
+    {"rows": [{"note": "x" * 5000}], "total": 1},
+    {f"field_{i}": i for i in range(400)},
+])
+def test_overflow_still_returns_valid_json(obj):
+    text = tr.fit_to_budget(obj, 100)
+    json.loads(text)
+    assert tr.estimate_tokens(text) <= 100
+
+
+def test_long_string_field_is_shortened_in_place():
+    shaped = json.loads(tr.fit_to_budget({"summary": "很长的说明" * 400, "count": 3}, 100))
+    assert shaped["count"] == 3
+    assert shaped["summary"].startswith("很长的说明") and shaped["summary"].endswith("…")
+
+
+def test_plain_text_is_cut_with_marker():
+    text = tr.fit_to_budget("很长的文字" * 200, 50)
+    assert text.endswith("…(已截断)")
+    assert len(text) < 1000
+
+
+def test_cursor_round_trip_and_invalid_cursor():
+    assert tr.decode_cursor(tr.encode_cursor(12345)) == 12345
+    assert tr.decode_cursor(None) is None
+    with pytest.raises(ValueError):
+        tr.decode_cursor("not-a-cursor")
@@ -0,0 +1,103 @@
+import sqlite3
+import time
+
+import pytest
+from write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "wb.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (user_id TEXT, name TEXT UNIQUE)")
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def make_queue(path):
+    queues = []
+
+    def make(**kwargs):
+        q = WriteBehindQueue(lambda user_id: path, **kwargs)
+        queues.append(q)
+        return q
+
+    yield make
+    for q in queues:
+        q.stop(timeout=5)
+
+
+def insert(user_id, name):
+    def op(conn):
+        return conn.execute("INSERT INTO items (user_id, name) VALUES (?, ?)", (user_id, name)).lastrowid
+    return op
+
+
+def names(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT name FROM items"))
+    finally:
+        conn.close()
+
+
+def test_full_batch_flushes_without_waiting_for_interval(make_queue, path):
+    q = make_queue(flush_interval=60, batch_size=4)
+    partial = [q.submit("u1", insert("u1", f"a{i}")) for i in range(3)]
+    time.sleep(0.1)
+    assert not any(f.done() for f in partial)
+    last = q.submit("u1", insert("u1", "a3"))
+    assert last.result(timeout=2) == 4
+    assert names(path) == ["a0", "a1", "a2", "a3"]
+    assert q.metrics()["batches"] == 1 and q.metrics()["last_batch_size"] == 4
+
+
+def test_interval_flushes_partial_batch(make_queue, path):
+    q = make_queue(flush_interval=0.05, batch_size=1000)
+    started = time.monotonic()
+    q.submit("u1", insert("u1", "a")).result(timeout=2)
+    assert time.monotonic() - started < 1
+    assert names(path) == ["a"]
+
+
+def test_failed_op_rolls_back_only_its_savepoint(make_queue, path):
+    q = make_queue(flush_interval=60, batch_size=100)
+
+    def half_then_fail(conn):
+        conn.execute("INSERT INTO items (user_id, name) VALUES ('u2', 'b')")
+        conn.execute("INSERT INTO items (user_id, name) VALUES ('u2', 'a')")  # 违反 UNIQUE
+
+    futures = [q.submit("u1", insert("u1", "a")), q.submit("u2", half_then_fail), q.submit("u3", insert("u3", "c"))]
+    assert q.flush(timeout=2)
+    assert futures[0].result() and futures[2].result()
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result()
+    # 同一事务中的其他写入照常提交，失败操作中已执行的部分被撤销
+    assert names(path) == ["a", "c"]
+    metrics = q.metrics()
+    assert (metrics["batches"], metrics["ops_written"], metrics["ops_failed"]) == (1, 2, 1)
+
+
+def test_wait_user_waits_only_for_that_users_writes(make_queue, path):
+    q = make_queue(flush_interval=60, batch_size=100)
+    q.submit("u1", insert("u1", "a"))
+    q.submit("u1", insert("u1", "b"))
+    # 其他用户没有排队中的写入，不需要等待刷盘
+    assert q.wait_user("u2", timeout=0)
+    assert names(path) == []
+    assert q.wait_user("u1", timeout=2)
+    assert names(path) == ["a", "b"]
+
+
+def test_reads_see_own_queued_writes(scratch_db):
+    db = scratch_db
+    db.enable_write_behind(flush_interval=60, batch_size=100)
+    try:
+        db.add_expense("u1", "午饭", 25, "餐饮", "")
+        db.update_user_profile("u1", {"monthly_budget": 2000})
+        # connect() 先等待该用户排队中的写入落盘，按提交顺序读到自己的写
+        assert [e["description"] for e in db.get_recent_expenses("u1")] == ["午饭"]
+        assert db.get_user_profile("u1")["monthly_budget"] == 2000
+    finally:
+        db.disable_write_behind()